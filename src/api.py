@@ -1,21 +1,47 @@
 # fastapi dev api.py --host "::" --port 8000
 from vector_db import query_vector_store
-from fastapi import FastAPI, HTTPException, Response
-from pydantic import BaseModel
-from models import AssetBundle
-from asset_generator import AssetsGenerator
-from db import (
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, field_validator
+from models import MAX_DUNGEON_DEPTH, AssetBundle
+from async_db import (
+    aggregate_stage_metrics,
+    aggregate_usage_by_day,
+    aggregate_usage_by_model,
     find_all_assets_bundles,
+    find_assets_bundles_by_ids,
     find_bundle_data_by_id,
     delete_asset_bundle_by_id,
-    insert_asset_bundle,
+    insert_asset_bundle_rows,
+    run_read,
+    search_asset_bundles,
 )
-from typing import Any, Dict
-from config import model_key
+from typing import Any, Dict, Optional
+from config import max_items_per_section
 from fastapi.staticfiles import StaticFiles
 from os.path import join
 from utils import MAIN_PATH
+from metrics import render_prometheus
+from texture_cache import get_texture_cache_stats
+from bundle_codec import BUNDLE_MEDIA_TYPE, encode_bundle
+from bundle_index import find_similar_bundles, remove_bundle
+from asset_generator import BundleSection
+from generation_flights import GenerationError, generate_asset_bundle, regenerate_bundle_section
+from previews import delete_bundle_images, get_bundle_image_path
+from bundle_transfer import (
+    IMPORT_SPOOL_BYTES,
+    NDJSON_MEDIA_TYPE,
+    aexport_bundles_ndjson,
+    validate_bundles_ndjson,
+)
+from pregeneration import start_pregeneration
+from tilesets import DEFAULT_TILESET, get_loaded_tilesets, get_tileset, is_registered, list_tilesets
+from contextlib import asynccontextmanager
+import asyncio
+import io
 import logging
+import tempfile
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +54,18 @@ logging.basicConfig(
     ],  # Explicitly use StreamHandler for console output
 )
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Mantém bundles prontos dos temas populares enquanto o servidor está ocioso.
+    pregeneration = start_pregeneration()
+    yield
+    if pregeneration is not None:
+        pregeneration.cancel()
+        await asyncio.gather(pregeneration, return_exceptions=True)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Mount the "static" directory to the "/static" URL path
 app.mount(
@@ -40,45 +77,148 @@ app.mount(
 
 class MapDescription(BaseModel):
     map_description: str
+    # Tamanho das seções; sem valor, usa config.number_of_*_per_bundle.
+    number_of_levels: Optional[int] = Field(default=None, ge=1, le=MAX_DUNGEON_DEPTH)
+    number_of_enemies: Optional[int] = Field(default=None, ge=1, le=max_items_per_section)
+    number_of_weapons: Optional[int] = Field(default=None, ge=1, le=max_items_per_section)
+    # Estilo de arte das texturas (ver GET /tilesets/).
+    tileset: str = DEFAULT_TILESET
+
+    @field_validator("tileset")
+    @classmethod
+    def check_tileset(cls, tileset: str) -> str:
+        if not is_registered(tileset):
+            raise ValueError(f"Unknown tileset: {tileset}")
+        return tileset
 
 
 @app.post("/asset-bundle/")
-async def route_post_asset_bundle(map_description: MapDescription) -> AssetBundle:
+async def route_post_asset_bundle(
+    map_description: MapDescription,
+    request: Request,
+    idempotency_key: Optional[str] = Header(default=None, max_length=255),
+) -> AssetBundle:
     try:
-        asset_generator: AssetsGenerator = AssetsGenerator(
-            map_description.map_description
+        asset_bundle = await generate_asset_bundle(
+            map_description.map_description,
+            request.is_disconnected,
+            idempotency_key,
+            map_description.model_dump(exclude={"map_description", "tileset"}, exclude_none=True),
+            map_description.tileset,
         )
-        asset_bundle: AssetBundle = asset_generator.generate_asset_bundle()
+    except GenerationError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error.")
 
-        insert_asset_bundle(
-            asset_bundle,
-            model_key,
-        )
-        return asset_bundle
-    except:
+    if asset_bundle is None:
+        # Cliente desconectado: ninguém lê a resposta.
+        return Response(status_code=499)  # type: ignore[return-value]
+
+    return asset_bundle
+
+
+@app.post("/asset-bundle/{id}/regenerate/{section}")
+async def route_regenerate_bundle_section(
+    id: int, section: BundleSection, request: Request
+) -> AssetBundle:
+    try:
+        result = await regenerate_bundle_section(id, section, request.is_disconnected)
+    except GenerationError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception:
         raise HTTPException(status_code=500, detail="Internal Server Error.")
 
+    if result is None:
+        return Response(status_code=499)  # type: ignore[return-value]
+
+    new_id, asset_bundle = result
+    return Response(  # type: ignore[return-value]
+        content=asset_bundle.model_dump_json(),
+        media_type="application/json",
+        status_code=201,
+        headers={"Location": f"/asset-bundle/{new_id}"},
+    )
+
 
 @app.get("/asset-bundle/")
 async def route_find_all_asset_bundle() -> list[Dict[str, Any]]:
-    return find_all_assets_bundles()
+    return await find_all_assets_bundles()
+
+
+@app.get("/search/asset-bundle/")
+async def route_search_asset_bundles(
+    q: str,
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+) -> Dict[str, Any]:
+    return await search_asset_bundles(q, limit, offset)
 
 
 @app.get("/asset-bundle/{id}")
-async def route_find_bundle_data_id(id: int) -> AssetBundle:
-    asset_bundle = find_bundle_data_by_id(id)
+async def route_find_bundle_data_id(
+    id: int, request: Request, response: Response, atlas: bool = False
+) -> AssetBundle:
+    asset_bundle = await find_bundle_data_by_id(id)
 
     if asset_bundle == None:
         raise HTTPException(
             status_code=404, detail=f"Asset bundle with id {id} no found."
         )
 
+    # Clientes de jogo pedem o formato binário pelo header Accept; as duas
+    # respostas levam Vary para um cache compartilhado não trocar uma pela outra.
+    if BUNDLE_MEDIA_TYPE in request.headers.get("accept", ""):
+        return Response(
+            # Montar e codificar o atlas em PNG é CPU: fora do loop.
+            content=await run_in_threadpool(encode_bundle, asset_bundle, include_atlas=atlas),
+            media_type=BUNDLE_MEDIA_TYPE,
+            headers={"Vary": "Accept"},
+        )
+
+    response.headers["Vary"] = "Accept"
     return asset_bundle
 
 
+@app.get("/asset-bundle/{id}/similar")
+async def route_find_similar_bundles(
+    id: int, k: int = Query(default=5, ge=1, le=50)
+) -> list[Dict[str, Any]]:
+    if not await find_assets_bundles_by_ids([id]):
+        raise HTTPException(
+            status_code=404, detail=f"Asset bundle with id {id} no found."
+        )
+
+    return await run_read(find_similar_bundles, id, k)
+
+
+@app.get("/asset-bundle/{id}/preview.png")
+async def route_bundle_preview(id: int) -> FileResponse:
+    return await _bundle_image_response(id, "preview")
+
+
+@app.get("/asset-bundle/{id}/thumbnail.png")
+async def route_bundle_thumbnail(id: int) -> FileResponse:
+    return await _bundle_image_response(id, "thumbnail")
+
+
+async def _bundle_image_response(id: int, kind: str) -> FileResponse:
+    path = await run_read(get_bundle_image_path, id, kind)
+
+    if path is None:
+        raise HTTPException(
+            status_code=404, detail=f"Asset bundle with id {id} no found."
+        )
+
+    # Bundles não mudam depois de criados: o navegador pode manter a imagem.
+    return FileResponse(
+        path, media_type="image/png", headers={"Cache-Control": "public, max-age=86400"}
+    )
+
+
 @app.get("/raw/asset-bundle/{id}")
 async def route_find_raw_bundle_data_id(id: int) -> dict:
-    asset_bundle = find_bundle_data_by_id(id)
+    asset_bundle = await find_bundle_data_by_id(id)
 
     if asset_bundle == None:
         raise HTTPException(
@@ -91,20 +231,121 @@ async def route_find_raw_bundle_data_id(id: int) -> dict:
     del json["raw_description"]
     del json["usage_metadata"]
     del json["generation_time_seconds"]
+    del json["stage_metrics"]
 
     return json
 
 
 @app.delete("/asset-bundle/{id}")
 async def route_delete_bundle_data_id(id: int):
-    was_delete = delete_asset_bundle_by_id(id)
+    was_delete = await delete_asset_bundle_by_id(id)
 
     if not was_delete:
-        return HTTPException(
+        raise HTTPException(
             status_code=404, detail=f"Asset bundle with id {id} no found."
         )
     else:
+        # remove_bundle espera o lock do índice (um backfill pode estar rodando).
+        await run_in_threadpool(remove_bundle, id)
+        await run_in_threadpool(delete_bundle_images, id)
         return Response(content=f"Asset bundle with id {id} was deleted.")
 
 
+@app.get("/export/asset-bundle/")
+async def route_export_asset_bundles() -> StreamingResponse:
+    return StreamingResponse(aexport_bundles_ndjson(), media_type=NDJSON_MEDIA_TYPE)
+
+
+@app.post("/import/asset-bundle/")
+async def route_import_asset_bundles(
+    request: Request, skip_invalid: bool = False
+) -> Dict[str, int]:
+    # O corpo vai para um arquivo temporário para não ficar inteiro na memória,
+    # em blocos de IMPORT_SPOOL_BYTES escritos fora do event loop.
+    with tempfile.TemporaryFile() as file:
+        buffer = bytearray()
+        async for chunk in request.stream():
+            buffer += chunk
+            if len(buffer) >= IMPORT_SPOOL_BYTES:
+                data, buffer = buffer, bytearray()
+                await run_in_threadpool(file.write, data)
+        await run_in_threadpool(file.write, buffer)
+        file.seek(0)
+
+        try:
+            validated = await run_in_threadpool(
+                validate_bundles_ndjson,
+                io.TextIOWrapper(file, encoding="utf-8"),
+                skip_invalid=skip_invalid,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # Só os INSERTs seguram o lock de escrita, na thread de escrita do banco.
+    with validated:
+        imported = await insert_asset_bundle_rows(validated.chunks())
+
+    return {"imported": imported, "skipped": validated.skipped}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def route_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        render_prometheus(), media_type="text/plain; version=0.0.4"
+    )
+
+
+# since/until: datas ISO (ex: 2026-01-13), comparadas com create_at; until é exclusivo.
+@app.get("/analytics/models")
+async def route_analytics_by_model(
+    since: Optional[str] = None, until: Optional[str] = None
+) -> list[Dict[str, Any]]:
+    return await aggregate_usage_by_model(since, until)
+
+
+@app.get("/analytics/days")
+async def route_analytics_by_day(
+    since: Optional[str] = None, until: Optional[str] = None, model: Optional[str] = None
+) -> list[Dict[str, Any]]:
+    return await aggregate_usage_by_day(since, until, model)
+
+
+@app.get("/analytics/stages")
+async def route_analytics_by_stage(
+    since: Optional[str] = None, until: Optional[str] = None, model: Optional[str] = None
+) -> list[Dict[str, Any]]:
+    return await aggregate_stage_metrics(since, until, model)
+
+
+@app.get("/tilesets/")
+async def route_list_tilesets() -> list[Dict[str, Any]]:
+    # Tilesets carregados neste processo e o tamanho estimado deles em memória.
+    loaded = get_loaded_tilesets()
+    return [
+        {
+            "id": tileset_id,
+            "loaded": tileset_id in loaded,
+            "estimated_bytes": loaded.get(tileset_id, 0),
+        }
+        for tileset_id in await run_in_threadpool(list_tilesets)
+    ]
+
+
+@app.get("/tilesets/{tileset_id}/tileset.png")
+async def route_tileset_image(tileset_id: str) -> FileResponse:
+    if not is_registered(tileset_id):
+        raise HTTPException(status_code=404, detail=f"Tileset {tileset_id} no found.")
+
+    return FileResponse(
+        get_tileset(tileset_id).image_path,
+        media_type="image/png",
+        headers={"Cache-Control": "public, max-age=86400"},
+    )
+
+
+@app.get("/texture-cache/stats")
+async def route_texture_cache_stats() -> Dict[str, Any]:
+    return await run_read(get_texture_cache_stats)
+
+
 logger.info("Access bundle viewer on http://localhost:8000/viewer/index.html")
@@ -1,42 +1,123 @@
-from typing import Type, TypeVar
+from contextlib import nullcontext
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Literal,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+)
 from pydantic import BaseModel, ValidationError
 from os.path import join
 from math import floor
+import asyncio
+import logging
 import time
 import json
 
 from langchain.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.output_parsers import BaseOutputParser
+from langchain_core.runnables import RunnableSequence
 
 
 from utils import *
 from llm_models import get_model, Providers, GroqModels, GoogleModels
 from models import *  # type: ignore
-from vector_db import query_vector_store, StoreType, query_by_tileset_position
+from vector_db import StoreType, query_by_tileset_position
+from lexical_retriever import query_tiles
+from texture_cache import get_cached_texture, set_cached_texture
+from texture_assignment import assign_textures, retrieve_candidates
+from tilesets import DEFAULT_TILESET, get_tileset
+from json_stream import ItemStream
 from db import *
 from config import *
+from metrics import StageRecorder, bundle_generation_seconds
 
 
+logger = logging.getLogger(__name__)
+
 T = TypeVar("T", bound=BaseModel)
 
+BundleSection = Literal["player", "dungeon_levels", "enemies", "weapons", "final_objective"]
+
+# Store de textura de cada seção, na ordem em que os tiles são texturizados.
+SECTION_STORES: Dict[str, StoreType] = {
+    "player": "entities",
+    "final_objective": "items",
+    "dungeon_levels": "environments",
+    "enemies": "entities",
+    "weapons": "items",
+}
+
+# Modelo de cada item das seções em lista (itens recebidos por streaming).
+SECTION_ITEMS: Dict[str, Type[BaseModel]] = {
+    "dungeon_levels": DungeonLevel,
+    "enemies": Enemy,
+    "weapons": Weapon,
+}
+
 save_path = join(MAIN_PATH, "saves")
 
 
+class IncompleteSectionError(Exception):
+    """A list section came up short after its chunks and top-up attempts."""
+
+
 class AssetsGenerator:
 
-    def __init__(self, theme_description) -> None:
-        self.model = get_model(provider_key, model_key)
+    def __init__(
+        self,
+        theme_description,
+        provider=None,
+        model_name=None,
+        number_of_levels: Optional[int] = None,
+        number_of_enemies: Optional[int] = None,
+        number_of_weapons: Optional[int] = None,
+        tileset: Optional[str] = None,
+    ) -> None:
+        # provider/model_name default to config.provider_key/config.model_key
+        # and the section sizes to config.number_of_*_per_bundle
+        self.model_name = model_name or model_key
+        # Tileset (estilo de arte) de onde vêm as texturas; ValueError se não existe.
+        self.tileset = get_tileset(tileset or DEFAULT_TILESET).id
+        self.section_counts = {
+            "dungeon_levels": number_of_levels or number_of_levels_per_bundle,
+            "enemies": number_of_enemies or number_of_enemies_per_bundle,
+            "weapons": number_of_weapons or number_of_weapons_per_bundle,
+        }
+        self.model = get_model(provider or provider_key, self.model_name)
         self.usage_callback = UsageMetadataCallbackHandler()
+        self.stage_recorder = StageRecorder(self.model_name)
 
+        self.raw_theme_description = theme_description
+        # Preenchida pela primeira etapa da geração (expand_theme).
+        self.theme_description: str = ""
+        # Buscas de textura adiantadas, por (store_type, descrição do tile): a
+        # task da busca em lote e a posição da descrição no lote.
+        self._candidate_tasks: Dict[Tuple[str, str], Tuple[asyncio.Task, int]] = {}
+        # Descrições ainda não buscadas, por store (ver _flush_prefetch).
+        self._prefetch_buffer: Dict[str, List[str]] = {}
+        # Desligado quando o provedor falha no streaming (ver _ask_llm_structured).
+        self._stream_structured_output = stream_structured_output
+
+    async def expand_theme(self) -> str:
         # O prompt agora atua como um "Lead Game Designer" criando a documentação base.
-        response = self.model.invoke(
+        response = await self._ask_llm(
+            "theme_expansion",
             [
                 HumanMessage(
                     f"""
 Act as a Lead Game Designer and World Builder.
 You are tasked with expanding a basic concept into a rich Roguelike Game Setting.
 
-Input Concept: "{theme_description}"
+Input Concept: "{self.raw_theme_description}"
 
 **IMPORTANT LANGUAGE CONSTRAINT:**
 Regardless of the language used in the "Input Concept", **you must write the expanded description entirely in English.**
@@ -52,48 +133,133 @@ Do not list specific item stats yet. Focus on the narrative and sensory details
 """
                 )
             ],
-            config={"callbacks": [self.usage_callback]},
         )
 
-        self.raw_theme_description = theme_description
-        self.theme_description: str = str(response.content)
+        self.theme_description = str(response.content)
+        return self.theme_description
+
+    async def _ask_llm(self, stage: str, messages: list):
+        stage_usage_callback = UsageMetadataCallbackHandler()
+
+        with self.stage_recorder.stage(stage):
+            self.stage_recorder.record_llm_call(stage)
+            try:
+                with self.stage_recorder.llm_attempt(stage):
+                    return await self.model.ainvoke(
+                        messages,
+                        config={
+                            "callbacks": [self.usage_callback, stage_usage_callback]
+                        },
+                    )
+            except Exception:
+                self.stage_recorder.record_error(stage)
+                raise
+            finally:
+                self.stage_recorder.record_usage(
+                    stage, stage_usage_callback.usage_metadata
+                )
 
     def _get_structured_model(self, schema_class: Type[T]):
         return self.model.with_structured_output(
             schema=schema_class.model_json_schema(), method="json_schema"
         )
 
-    def _ask_llm_structured(self, schema_class: Type[T], messages: list) -> T:
+    async def _stream_structured(
+        self, structured_llm, messages: list, config: dict, on_item: Callable[[Any], None]
+    ) -> Any:
+        """
+        Streams the answer of a `model | output parser` chain, calling
+        `on_item` with each object of its items array as soon as it is
+        complete. The full answer is then parsed by the chain's own parser.
+        """
+        model, output_parser = structured_llm.first, structured_llm.last
+        if len(structured_llm.steps) > 2:
+            model = RunnableSequence(*structured_llm.steps[:-1])
+
+        item_stream = ItemStream()
+        message = None
+        async for chunk in model.astream(messages, config=config):
+            message = chunk if message is None else message + chunk
+            if isinstance(chunk.content, str):
+                for item in item_stream.feed(chunk.content):
+                    try:
+                        on_item(item)
+                    except Exception as e:
+                        logger.debug(f"Streamed item ignored: {e}")
+
+        return await output_parser.ainvoke(message)
+
+    async def _ask_llm_structured(
+        self,
+        stage: str,
+        schema_class: Type[T],
+        messages: list,
+        timed: bool = True,
+        on_item: Optional[Callable[[Any], None]] = None,
+    ) -> T:
+        """
+        `timed=False` when the caller times the stage (parallel chunks).
+        With `on_item` the answer is streamed (see _stream_structured).
+        """
         structured_llm = self._get_structured_model(schema_class)
+        stage_usage_callback = UsageMetadataCallbackHandler()
 
         last_exception = None
         max_attempts = 5
+        streaming = (
+            on_item is not None
+            and self._stream_structured_output
+            and isinstance(structured_llm, RunnableSequence)
+            and isinstance(structured_llm.last, BaseOutputParser)
+        )
 
-        for attempt in range(1, max_attempts + 1):
+        with self.stage_recorder.stage(stage) if timed else nullcontext():
+            self.stage_recorder.record_llm_call(stage)
             try:
-                # Tenta invocar o modelo
-                result = structured_llm.invoke(
-                    messages,
-                    config={"callbacks": [self.usage_callback]},
+                for attempt in range(1, max_attempts + 1):
+                    try:
+                        # Tenta invocar o modelo
+                        config = {"callbacks": [self.usage_callback, stage_usage_callback]}
+                        with self.stage_recorder.llm_attempt(stage):
+                            if streaming:
+                                try:
+                                    result = await self._stream_structured(
+                                        structured_llm, messages, config, on_item  # type: ignore[arg-type]
+                                    )
+                                except Exception as e:
+                                    # Provedor que recusa (ou quebra) o streaming com json_schema:
+                                    # as próximas tentativas e seções usam a chamada sem streaming.
+                                    streaming = self._stream_structured_output = False
+                                    logger.warning(
+                                        f"Streaming of '{stage}' failed, retrying without streaming: {e}"
+                                    )
+                                    raise
+                            else:
+                                result = await structured_llm.ainvoke(messages, config=config)
+
+                        # Tenta validar o resultado com o Pydantic
+                        # Se o result já vier como dict (comum em structured output), o validate converte
+                        return schema_class.model_validate(result)
+
+                    except (ValidationError, ValueError, TypeError) as e:
+                        # Captura erros de validação do Pydantic ou erros de tipo
+                        last_exception = e
+                        self.stage_recorder.record_validation_failure(stage)
+                        print(
+                            f"Tentativa {attempt}/{max_attempts} falhou ao validar o esquema. Erro: {e}"
+                        )
+                        # O loop continua para a próxima iteração automaticamente
+                    except Exception as e:
+                        # Captura outros erros inesperados (ex: erro de conexão com a API)
+                        # Se quiser que erros de conexão falhem imediatamente, remova este except
+                        last_exception = e
+                        self.stage_recorder.record_error(stage)
+                        print(f"Erro inesperado na tentativa {attempt}: {e}")
+            finally:
+                self.stage_recorder.record_usage(
+                    stage, stage_usage_callback.usage_metadata
                 )
 
-                # Tenta validar o resultado com o Pydantic
-                # Se o result já vier como dict (comum em structured output), o validate converte
-                return schema_class.model_validate(result)
-
-            except (ValidationError, ValueError, TypeError) as e:
-                # Captura erros de validação do Pydantic ou erros de tipo
-                last_exception = e
-                print(
-                    f"Tentativa {attempt}/{max_attempts} falhou ao validar o esquema. Erro: {e}"
-                )
-                # O loop continua para a próxima iteração automaticamente
-            except Exception as e:
-                # Captura outros erros inesperados (ex: erro de conexão com a API)
-                # Se quiser que erros de conexão falhem imediatamente, remova este except
-                last_exception = e
-                print(f"Erro inesperado na tentativa {attempt}: {e}")
-
         # Se sair do loop, significa que falhou 5 vezes
         print("Todas as 5 tentativas de gerar o mapa falharam.")
         if last_exception:
@@ -103,8 +269,115 @@ Do not list specific item stats yet. Focus on the narrative and sensory details
                 "Falha desconhecida na geração estruturada após 5 tentativas."
             )
 
-    def generate_player(self) -> Player:
-        return self._ask_llm_structured(
+    async def _generate_list(
+        self,
+        stage: str,
+        schema_class: Type[T],
+        count: int,
+        prompt: Callable[[int, str], str],
+        name_of: Callable[[Any], str],
+    ) -> T:
+        """
+        Generates a list section with `count` items. Up to section_chunk_size
+        items are asked in a single call; larger counts are split in chunks
+        asked in parallel (waves of section_chunk_concurrency calls), each
+        told the names produced by earlier waves. The chunks are merged
+        without repeated names, and missing items (duplicates, failed chunks)
+        are asked again, seeded with every name so far. Raises
+        IncompleteSectionError if the section is still short after that.
+        """
+        on_item = self._prefetch_item(stage)
+        if count <= section_chunk_size:
+            return await self._ask_llm_structured(
+                stage, schema_class, [HumanMessage(prompt(count, ""))], on_item=on_item
+            )
+
+        items: List[Any] = []
+        names: Dict[str, str] = {}  # nome normalizado -> nome
+        chunk_sizes = [
+            min(section_chunk_size, count - start) for start in range(0, count, section_chunk_size)
+        ]
+        first_error: Optional[BaseException] = None
+
+        def note(size: int, batch: int, batches: int, offset: int) -> str:
+            lines = [
+                f"\nThis request is batch {batch} of {batches} of a larger list of {count} "
+                f"generated in parallel: generate only {size} of them."
+            ]
+            if stage == "dungeon_levels":
+                lines.append(f"Generate only depths {offset + 1} to {offset + size}.")
+            if names:
+                lines.append(
+                    "Do not reuse these names, already taken: " + ", ".join(names.values()) + "."
+                )
+            return "\n".join(lines) + "\n"
+
+        def merge(result: Any) -> None:
+            for item in result.items:
+                key = " ".join(name_of(item).lower().replace("_", " ").split())
+                if key not in names and len(items) < count:
+                    names[key] = name_of(item)
+                    items.append(item)
+
+        with self.stage_recorder.stage(stage):
+            offsets = [sum(chunk_sizes[:i]) for i in range(len(chunk_sizes))]
+            chunks = list(enumerate(zip(chunk_sizes, offsets), start=1))
+
+            for start in range(0, len(chunks), section_chunk_concurrency):
+                wave = chunks[start : start + section_chunk_concurrency]
+                results = await asyncio.gather(
+                    *(
+                        self._ask_llm_structured(
+                            stage,
+                            schema_class,
+                            [HumanMessage(prompt(size, note(size, batch, len(chunks), offset)))],
+                            timed=False,
+                            on_item=on_item,
+                        )
+                        for batch, (size, offset) in wave
+                    ),
+                    return_exceptions=True,
+                )
+                for result in results:
+                    if isinstance(result, BaseException):
+                        first_error = first_error or result
+                    else:
+                        merge(result)
+
+            for _ in range(section_top_up_attempts):
+                missing = count - len(items)
+                if missing <= 0:
+                    break
+                try:
+                    merge(
+                        await self._ask_llm_structured(
+                            stage,
+                            schema_class,
+                            [HumanMessage(prompt(missing, note(missing, 1, 1, len(items))))],
+                            timed=False,
+                            on_item=on_item,
+                        )
+                    )
+                except Exception as e:
+                    first_error = first_error or e
+
+        if not items and first_error is not None:
+            raise first_error
+        if len(items) < count:
+            logger.warning(
+                f"Section {stage} got {len(items)} of {count} items after "
+                f"{section_top_up_attempts} top-up attempts."
+            )
+            raise IncompleteSectionError(
+                f"Only {len(items)} of the {count} requested {stage.replace('_', ' ')} were generated."
+            ) from first_error
+        if stage == "dungeon_levels":
+            items.sort(key=lambda level: level.depth)
+        return schema_class(items=items)  # type: ignore[call-arg]
+
+    async def generate_player(self) -> Player:
+        return await self._ask_llm_structured(
+            "player",
             Player,
             [
                 HumanMessage(
@@ -125,8 +398,9 @@ Generate the Player profile now.
             ],
         )
 
-    def generate_final_objective(self) -> FinalObjective:
-        return self._ask_llm_structured(
+    async def generate_final_objective(self) -> FinalObjective:
+        return await self._ask_llm_structured(
+            "final_objective",
             FinalObjective,
             [
                 HumanMessage(
@@ -150,38 +424,35 @@ Generate the legendary Final Objective now.
             ],
         )
 
-    def generate_dungeon_levels(self) -> DungeonLevelList:
-        return self._ask_llm_structured(
-            DungeonLevelList,
-            [
-                HumanMessage(
-                    f"""
+    async def generate_dungeon_levels(self) -> DungeonLevelList:
+        total = self.section_counts["dungeon_levels"]
+
+        def prompt(count: int, note: str) -> str:
+            return f"""
 Act as an expert Roguelike Level Designer. 
-Your task is to generate a progression of {number_of_levels_per_bundle} dungeon levels based on the following theme:
+Your task is to generate a progression of {total} dungeon levels based on the following theme:
 "{self.theme_description}"
 
 Guidelines for generation:
-1. **Progression**: The levels must evolve. Depth 1 should be the easier, while Depth {number_of_levels_per_bundle} is the most dangerous.
+1. **Progression**: The levels must evolve. Depth 1 should be the easier, while Depth {total} is the most dangerous.
 2. **Atmosphere**: For each level, describe the environment, lighting, smells, and ambient sounds.
 3. **Cohesion**: Ensure the transition between levels makes logical sense within the theme.
 4. **Variety**: Avoid repeating the exact same descriptions.
-
-Generate the {number_of_levels_per_bundle} levels now.
+{note}
+Generate the {count} levels now.
 """
-                )
-            ],
+
+        return await self._generate_list(
+            "dungeon_levels", DungeonLevelList, total, prompt, lambda level: level.name
         )
 
-    def generate_weapons(self) -> WeaponList:
-        return self._ask_llm_structured(
-            WeaponList,
-            [
-                HumanMessage(
-                    f"""
+    async def generate_weapons(self) -> WeaponList:
+        def prompt(count: int, note: str) -> str:
+            return f"""
 Act as a Creative Director for a Roguelike game.
 Based on the theme specification: "{self.theme_description}"
 
-Generate {number_of_weapons_per_bundle} unique weapons. 
+Generate {count} unique weapons. 
 Guidelines:
 1. **Thematic Fit**: All weapons must strictly fit the technology/magic level and tone of the theme.
 2. **Diversity**: Include a broad mix of types:
@@ -194,23 +465,25 @@ Guidelines:
    - 20% **Legendary weapons**: Artifacts, experimental prototypes, or named weapons with lore and unique properties.
 4. **Descriptions**: Provide vivid descriptions focusing on the weapon's appearance and the specific "feeling" of wielding it.
 5. **Range of Fields**: The fields rarity, weight and mana_cost need to be in the range [0, 10] (inclusive).
-
-Generate the list of {number_of_weapons_per_bundle} weapons now.
+{note}
+Generate the list of {count} weapons now.
 """
-                )
-            ],
+
+        return await self._generate_list(
+            "weapons",
+            WeaponList,
+            self.section_counts["weapons"],
+            prompt,
+            lambda weapon: weapon.tile.name,
         )
 
-    def generate_enemies(self) -> EnemyList:
-        return self._ask_llm_structured(
-            EnemyList,
-            [
-                HumanMessage(
-                    f"""
+    async def generate_enemies(self) -> EnemyList:
+        def prompt(count: int, note: str) -> str:
+            return f"""
 Act as a Gameplay Balance Designer.
 Using the theme: "{self.theme_description}"
 
-Generate a Bestiary of {number_of_enemies_per_bundle} unique enemies distributed across the dungeon depths.
+Generate a Bestiary of {count} unique enemies distributed across the dungeon depths.
 Guidelines:
 1. **Archetypes**: Ensure a mix of:
    - *Skinny*: Weak, but really fast.
@@ -218,17 +491,25 @@ Guidelines:
 2. **Variety**: Ensure variety on the thread of the enemies. Should exist 50% enemies with thread 1~5, 30% with thread 5~8 and 20% with thread 9~10
 3. **Visuals**: Describe their appearance to match the gloomy/adventurous tone of the theme.
 4. **Range of Fields**: The fields thread and weight need to be in the range [0, 10] (inclusive). 
-
-Generate the {number_of_enemies_per_bundle} enemies now.
+{note}
+Generate the {count} enemies now.
 """
-                )
-            ],
+
+        return await self._generate_list(
+            "enemies",
+            EnemyList,
+            self.section_counts["enemies"],
+            prompt,
+            lambda enemy: enemy.tile.name,
         )
 
     def generate_asset_bundle(self) -> AssetBundle:
-        start_time = time.time()
+        """Synchronous entry point (scripts, benchmarks): runs `agenerate_asset_bundle`."""
+        return asyncio.run(self.agenerate_asset_bundle())
 
-        asset_buddle_base = self._ask_llm_structured(
+    async def generate_name(self) -> AssetBundleBase:
+        return await self._ask_llm_structured(
+            "name",
             AssetBundleBase,
             [
                 HumanMessage(
@@ -250,88 +531,346 @@ Generate the title now.
             ],
         )
 
-        player = self.generate_player()
-        dungeon_levels = self.generate_dungeon_levels()
-        enemies = self.generate_enemies()
-        weapons = self.generate_weapons()
-        final_objective = self.generate_final_objective()
-
-        player_with_texture = PlayerWithTexture(
-            **player.model_dump(),
-            tile_with_texture=AssetsGenerator.convert_tile_to_tile_with_texture(
-                player.tile, "entities"
-            ),
-        )
-
-        final_objective_with_texture = FinalObjectiveWithTexture(
-            **final_objective.model_dump(),
-            tile_with_texture=AssetsGenerator.convert_tile_to_tile_with_texture(
-                final_objective.tile, "items"
-            ),
-        )
-
-        dungeon_levels_with_texture_items: List[DungeonLevelWithTexture] = []
-        for dungeon_level in dungeon_levels.items:
-            dungeon_levels_with_texture_items.append(
-                DungeonLevelWithTexture(
-                    **dungeon_level.model_dump(),
-                    wall_tile_with_texture=AssetsGenerator.convert_tile_to_tile_with_texture(
-                        dungeon_level.wall_tile, "environments"
-                    ),
-                    floor_tile_with_texture=AssetsGenerator.convert_tile_to_tile_with_texture(
-                        dungeon_level.floor_tile, "environments"
-                    ),
-                )
+    def _restore_checkpoint(self, checkpoint: dict) -> None:
+        if "theme_description" in checkpoint:
+            self.theme_description = checkpoint["theme_description"]
+        self.usage_callback.usage_metadata = checkpoint.get("usage_metadata", {})
+        self.stage_recorder.stages = {
+            stage: dict(values) for stage, values in checkpoint.get("stage_metrics", {}).items()
+        }
+
+    async def agenerate_asset_bundle(
+        self,
+        checkpoint: Optional[dict] = None,
+        on_checkpoint: Optional[Callable[[dict], Awaitable[None]]] = None,
+    ) -> AssetBundle:
+        """
+        Generates the bundle. Cancelling the task (client disconnect, deadline)
+        cancels the in-flight LLM request and no later stage runs.
+
+        After each LLM stage `on_checkpoint` receives a JSON-serializable dict
+        with every stage done so far (plus usage and stage metrics); passing
+        that dict back as `checkpoint` resumes the generation after them.
+        """
+        checkpoint = dict(checkpoint or {})
+        self._restore_checkpoint(checkpoint)
+        start_time = time.time() - checkpoint.get("generation_seconds", 0)
+
+        async def stage(
+            name: str,
+            generate: Callable[[], Awaitable[Any]],
+            schema_class: Optional[Type[BaseModel]] = None,
+        ) -> Any:
+            if name in checkpoint:
+                value = checkpoint[name]
+                return schema_class.model_validate(value) if schema_class else value
+            value = await generate()
+            checkpoint[name] = value.model_dump() if schema_class else value
+            checkpoint["usage_metadata"] = self.usage_callback.usage_metadata
+            checkpoint["stage_metrics"] = self.stage_recorder.stages
+            if name != "theme_description":
+                checkpoint["generation_seconds"] = time.time() - start_time
+            if on_checkpoint is not None:
+                await on_checkpoint(checkpoint)
+            return value
+
+        if not self.theme_description:
+            await stage("theme_description", self.expand_theme)
+            # A expansão do tema não entra no tempo de geração.
+            start_time = time.time()
+
+        asset_buddle_base = await stage("name", self.generate_name, AssetBundleBase)
+
+        try:
+            player = self._prefetch_section(
+                "player",
+                await stage("player", self.generate_player, Player),
+                later=["dungeon_levels", "enemies", "weapons", "final_objective"],
             )
-        dungeon_levels_with_texture = DungeonLevelWithTextureList(
-            items=dungeon_levels_with_texture_items
-        )
-
-        enemies_with_texture_items: List[EnemyWithTexture] = []
-        for enemy in enemies.items:
-            enemies_with_texture_items.append(
-                EnemyWithTexture(
-                    **enemy.model_dump(),
-                    tile_with_texture=AssetsGenerator.convert_tile_to_tile_with_texture(
-                        enemy.tile, "entities"
-                    ),
-                )
+            dungeon_levels = self._prefetch_section(
+                "dungeon_levels",
+                await stage("dungeon_levels", self.generate_dungeon_levels, DungeonLevelList),
+                later=["enemies", "weapons", "final_objective"],
             )
-        enemies_with_texture = EnemyWithTextureList(items=enemies_with_texture_items)
-
-        weapons_with_texture_items: List[WeaponWithTexture] = []
-        for weapon in weapons.items:
-            weapons_with_texture_items.append(
-                WeaponWithTexture(
-                    **weapon.model_dump(),
-                    tile_with_texture=AssetsGenerator.convert_tile_to_tile_with_texture(
-                        weapon.tile, "items"
-                    ),
-                )
+            enemies = self._prefetch_section(
+                "enemies",
+                await stage("enemies", self.generate_enemies, EnemyList),
+                later=["weapons", "final_objective"],
             )
-        weapons_with_texture = WeaponWithTextureList(items=weapons_with_texture_items)
+            weapons = self._prefetch_section(
+                "weapons",
+                await stage("weapons", self.generate_weapons, WeaponList),
+                later=["final_objective"],
+            )
+            final_objective = self._prefetch_section(
+                "final_objective",
+                await stage("final_objective", self.generate_final_objective, FinalObjective),
+            )
+
+            with self.stage_recorder.stage("texturing"):
+                # Todos os tiles do bundle são texturizados juntos, para evitar que
+                # tiles diferentes recebam o mesmo sprite.
+                textured = await self._texture_sections(
+                    {
+                        "player": player,
+                        "final_objective": final_objective,
+                        "dungeon_levels": dungeon_levels,
+                        "enemies": enemies,
+                        "weapons": weapons,
+                    }
+                )
+        finally:
+            self._cancel_prefetch()
 
         total_time = time.time() - start_time
+        bundle_generation_seconds.observe(total_time, model=self.stage_recorder.model)
 
         return AssetBundle(
             **asset_buddle_base.model_dump(),
             raw_description=self.raw_theme_description,
             description=self.theme_description,
-            player=player_with_texture,
-            dungeon_levels=dungeon_levels_with_texture,
-            enemies=enemies_with_texture,
-            weapons=weapons_with_texture,
-            final_objective=final_objective_with_texture,
+            player=textured["player"],
+            dungeon_levels=textured["dungeon_levels"],
+            enemies=textured["enemies"],
+            weapons=textured["weapons"],
+            final_objective=textured["final_objective"],
             usage_metadata=self.usage_callback.usage_metadata,
             generation_time_seconds=floor(total_time),
+            stage_metrics=self.stage_recorder.as_dict(),
+            tileset=self.tileset,
+        )
+
+    async def aregenerate_section(
+        self, asset_bundle: AssetBundle, section: BundleSection
+    ) -> AssetBundle:
+        """
+        New version of `asset_bundle` with only `section` regenerated (one LLM
+        call) and re-textured, avoiding the sprites used by the rest of the
+        bundle. Use with `from_bundle`, so the stored description is the theme.
+
+        The usage_metadata, generation_time_seconds and stage_metrics of the
+        version are cumulative: those of `asset_bundle` plus the regeneration.
+        """
+        # Parte do custo da versão anterior, como na retomada de um checkpoint.
+        self._restore_checkpoint(
+            {
+                "usage_metadata": dict(asset_bundle.usage_metadata),
+                "stage_metrics": asset_bundle.stage_metrics,
+            }
+        )
+        start_time = time.time()
+        try:
+            value = self._prefetch_section(section, await getattr(self, f"generate_{section}")())
+        except BaseException:
+            self._cancel_prefetch()
+            raise
+
+        reserved: Dict[str, Set[Tuple[int, int]]] = {}
+        for other in SECTION_STORES:
+            if other == section:
+                continue
+            for tile, store_type in self._section_tiles(
+                other, getattr(asset_bundle, other), textured=True
+            ):
+                position = tile.texture.tileset_position  # type: ignore[attr-defined]
+                reserved.setdefault(store_type, set()).add((position.x, position.y))
+
+        with self.stage_recorder.stage("texturing"):
+            try:
+                textured = await self._texture_sections({section: value}, reserved)
+            finally:
+                self._cancel_prefetch()
+
+        total_time = time.time() - start_time
+        bundle_generation_seconds.observe(total_time, model=self.stage_recorder.model)
+
+        return asset_bundle.model_copy(
+            update={
+                section: textured[section],
+                "usage_metadata": self.usage_callback.usage_metadata,
+                "generation_time_seconds": asset_bundle.generation_time_seconds
+                + floor(total_time),
+                "stage_metrics": self.stage_recorder.as_dict(),
+            }
+        )
+
+    @classmethod
+    def from_bundle(
+        cls, asset_bundle: AssetBundle, provider=None, model_name=None
+    ) -> "AssetsGenerator":
+        """Generator that reuses the expanded description of a stored bundle."""
+        asset_generator = cls(
+            asset_bundle.raw_description,
+            provider,
+            model_name,
+            number_of_levels=len(asset_bundle.dungeon_levels.items),
+            number_of_enemies=len(asset_bundle.enemies.items),
+            number_of_weapons=len(asset_bundle.weapons.items),
+            tileset=asset_bundle.tileset,
         )
+        asset_generator.theme_description = asset_bundle.description
+        return asset_generator
 
     @staticmethod
-    def convert_tile_to_tile_with_texture(
-        tile: Tile, store_type: StoreType
-    ) -> TileWithTexture:
-        texture_from_rag = query_vector_store(tile.description, store_type, 1)[0]
+    def _item_tiles(
+        section: str, item: BaseModel, textured: bool = False
+    ) -> List[Tuple[BaseModel, StoreType]]:
+        """(tile, store_type) of one item of a section (or of player/final_objective)."""
+        suffix = "_with_texture" if textured else ""
+        store_type = SECTION_STORES[section]
+
+        if section == "dungeon_levels":
+            return [
+                (getattr(item, "wall_tile" + suffix), store_type),
+                (getattr(item, "floor_tile" + suffix), store_type),
+            ]
+        return [(getattr(item, "tile" + suffix), store_type)]
 
+    @staticmethod
+    def _section_tiles(
+        section: str, value: BaseModel, textured: bool = False
+    ) -> List[Tuple[BaseModel, StoreType]]:
+        """(tile, store_type) of a section, in texturing order."""
+        if section in ("player", "final_objective"):
+            return AssetsGenerator._item_tiles(section, value, textured)
+
+        tiles = []
+        for item in value.items:  # type: ignore[attr-defined]
+            tiles += AssetsGenerator._item_tiles(section, item, textured)
+        return tiles
+
+    def _prefetch(self, description: str, store_type: StoreType) -> None:
+        """
+        Queues the texture retrieval of a tile description, once per generation;
+        the queue of the store is retrieved in one batch when it is full.
+        """
+        buffer = self._prefetch_buffer.setdefault(store_type, [])
+        if (store_type, description) in self._candidate_tasks or description in buffer:
+            return
+        buffer.append(description)
+        if len(buffer) >= texture_prefetch_batch_size:
+            self._flush_prefetch([store_type])
+
+    def _flush_prefetch(self, store_types: Optional[Iterable[str]] = None) -> None:
+        """Starts one batched retrieval per store with the queued descriptions."""
+        for store_type in list(store_types if store_types is not None else self._prefetch_buffer):
+            descriptions = self._prefetch_buffer.pop(store_type, [])
+            if not descriptions:
+                continue
+            task = asyncio.create_task(
+                asyncio.to_thread(retrieve_candidates, descriptions, store_type, self.tileset)
+            )
+            for i, description in enumerate(descriptions):
+                self._candidate_tasks[(store_type, description)] = (task, i)
+
+    def _prefetch_item(self, section: str) -> Callable[[Any], None]:
+        """`on_item` of a list section: prefetches the tiles of each streamed item."""
+
+        def on_item(raw_item: Any) -> None:
+            item = SECTION_ITEMS[section].model_validate(raw_item)
+            for tile, store_type in self._item_tiles(section, item):
+                self._prefetch(tile.description, store_type)  # type: ignore[attr-defined]
+
+        return on_item
+
+    def _prefetch_section(self, section: str, value: T, later: Iterable[str] = ()) -> T:
+        """
+        Prefetches the tiles of a generated section (those not streamed yet) and
+        retrieves the queues of the stores that no `later` section uses.
+        """
+        for tile, store_type in self._section_tiles(section, value):
+            self._prefetch(tile.description, store_type)  # type: ignore[attr-defined]
+        pending = {SECTION_STORES[other] for other in later}
+        self._flush_prefetch(
+            [store_type for store_type in self._prefetch_buffer if store_type not in pending]
+        )
+        return value
+
+    def _cancel_prefetch(self) -> None:
+        for task, _ in self._candidate_tasks.values():
+            task.cancel()
+        self._candidate_tasks.clear()
+        self._prefetch_buffer.clear()
+
+    async def _texture_sections(
+        self,
+        sections: Dict[str, BaseModel],
+        reserved: Optional[Dict[str, Set[Tuple[int, int]]]] = None,
+    ) -> Dict[str, BaseModel]:
+        """Textures the tiles of every section jointly; returns the *WithTexture models."""
+        tiles: List[Tuple[Tile, StoreType]] = []
+        for section, value in sections.items():
+            tiles += self._section_tiles(section, value)  # type: ignore[arg-type]
+
+        self.stage_recorder.record_texture_lookups("texturing", len(tiles))
+
+        # Buscas já adiantadas durante a geração; as que falharam são refeitas
+        # pelo assign_textures.
+        self._flush_prefetch()
+        retrieved: Dict[Tuple[str, str], dict] = {}
+        for (tile, store_type) in tiles:
+            key = (store_type, tile.description)
+            if key not in self._candidate_tasks or key in retrieved:
+                continue
+            task, i = self._candidate_tasks[key]
+            try:
+                retrieved[key] = (await task)[i]
+            except asyncio.CancelledError:
+                current = asyncio.current_task()
+                if task.cancelled() and not (current and current.cancelling()):
+                    continue
+                raise
+            except Exception as e:
+                logger.warning(f"Texture prefetch failed, retrying: {e}")
+
+        # As buscas são síncronas (Chroma/embeddings): rodam fora do event loop.
+        textures = await asyncio.to_thread(
+            assign_textures, tiles, None, reserved, retrieved, self.tileset
+        )
+        textured = iter(
+            AssetsGenerator.tile_with_texture(tile, texture)
+            for (tile, _), texture in zip(tiles, textures)
+        )
+
+        result: Dict[str, BaseModel] = {}
+        for section, value in sections.items():
+            if section == "player":
+                result[section] = PlayerWithTexture(
+                    **value.model_dump(), tile_with_texture=next(textured)
+                )
+            elif section == "final_objective":
+                result[section] = FinalObjectiveWithTexture(
+                    **value.model_dump(), tile_with_texture=next(textured)
+                )
+            elif section == "dungeon_levels":
+                result[section] = DungeonLevelWithTextureList(
+                    items=[
+                        DungeonLevelWithTexture(
+                            **dungeon_level.model_dump(),
+                            wall_tile_with_texture=next(textured),
+                            floor_tile_with_texture=next(textured),
+                        )
+                        for dungeon_level in value.items  # type: ignore[attr-defined]
+                    ]
+                )
+            elif section == "enemies":
+                result[section] = EnemyWithTextureList(
+                    items=[
+                        EnemyWithTexture(**enemy.model_dump(), tile_with_texture=next(textured))
+                        for enemy in value.items  # type: ignore[attr-defined]
+                    ]
+                )
+            else:
+                result[section] = WeaponWithTextureList(
+                    items=[
+                        WeaponWithTexture(**weapon.model_dump(), tile_with_texture=next(textured))
+                        for weapon in value.items  # type: ignore[attr-defined]
+                    ]
+                )
+        return result
+
+    @staticmethod
+    def tile_with_texture(tile: Tile, texture_from_rag: dict) -> TileWithTexture:
         position = Position(x=texture_from_rag["x"], y=texture_from_rag["y"])
 
         texture = Texture(
@@ -341,6 +880,18 @@ Generate the title now.
 
         return TileWithTexture(**tile.model_dump(), texture=texture)
 
+    @staticmethod
+    def convert_tile_to_tile_with_texture(
+        tile: Tile, store_type: StoreType, tileset: str = DEFAULT_TILESET
+    ) -> TileWithTexture:
+        texture_from_rag = get_cached_texture(tile.description, store_type, tileset)
+
+        if texture_from_rag is None:
+            texture_from_rag = query_tiles(tile.description, store_type, 1, tileset=tileset)[0]
+            set_cached_texture(tile.description, store_type, texture_from_rag, tileset)
+
+        return AssetsGenerator.tile_with_texture(tile, texture_from_rag)
+
 
 def load_zombie_souls_asset_bundle() -> AssetBundle:
     return load_object_json(
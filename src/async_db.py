@@ -0,0 +1,94 @@
+"""
+Async access to db.py for the FastAPI handlers.
+
+sqlite3 calls block, so running them inside `async def` handlers stalls the
+event loop for every other request during a slow query or a lock wait. The
+functions here have the same names and arguments as in db.py and run them on
+dedicated, bounded thread pools:
+
+- reads share `db_read_threads` threads: a large listing occupies one
+  thread, not the loop nor the other reads;
+- writes go through a single thread, as SQLite serializes writers anyway,
+  so queued inserts never take the threads of the reads.
+
+With the database in WAL mode (see db.init_db) the reads do not wait for an
+insert in progress either.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Any, Awaitable, Callable, TypeVar
+import asyncio
+
+import db
+from config import db_read_threads
+
+R = TypeVar("R")
+
+_read_executor = ThreadPoolExecutor(max_workers=db_read_threads, thread_name_prefix="db-read")
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+
+async def run_read(function: Callable[..., R], *args: Any, **kwargs: Any) -> R:
+    """Runs `function` (db reads, possibly with other work) on the read pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, partial(function, *args, **kwargs))
+
+
+async def run_write(function: Callable[..., R], *args: Any, **kwargs: Any) -> R:
+    """Runs `function` on the writer thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_write_executor, partial(function, *args, **kwargs))
+
+
+def _reader(function: Callable[..., R]) -> Callable[..., Awaitable[R]]:
+    @wraps(function)
+    async def wrapper(*args, **kwargs):
+        return await run_read(function, *args, **kwargs)
+
+    return wrapper
+
+
+def _writer(function: Callable[..., R]) -> Callable[..., Awaitable[R]]:
+    @wraps(function)
+    async def wrapper(*args, **kwargs):
+        return await run_write(function, *args, **kwargs)
+
+    return wrapper
+
+
+find_all_assets_bundles = _reader(db.find_all_assets_bundles)
+find_bundle_data_by_id = _reader(db.find_bundle_data_by_id)
+find_assets_bundles_by_ids = _reader(db.find_assets_bundles_by_ids)
+search_asset_bundles = _reader(db.search_asset_bundles)
+fetch_asset_bundle_rows = _reader(db.fetch_asset_bundle_rows)
+find_texture_cache_entry = _reader(db.find_texture_cache_entry)
+count_texture_cache_entries = _reader(db.count_texture_cache_entries)
+find_bundle_embeddings = _reader(db.find_bundle_embeddings)
+find_bundles_without_embedding = _reader(db.find_bundles_without_embedding)
+aggregate_usage_by_model = _reader(db.aggregate_usage_by_model)
+aggregate_usage_by_day = _reader(db.aggregate_usage_by_day)
+aggregate_stage_metrics = _reader(db.aggregate_stage_metrics)
+find_generation_job = _reader(db.find_generation_job)
+
+insert_asset_bundle = _writer(db.insert_asset_bundle)
+delete_asset_bundle_by_id = _writer(db.delete_asset_bundle_by_id)
+insert_asset_bundle_rows = _writer(db.insert_asset_bundle_rows)
+upsert_texture_cache_entry = _writer(db.upsert_texture_cache_entry)
+delete_stale_texture_cache_entries = _writer(db.delete_stale_texture_cache_entries)
+upsert_bundle_embeddings = _writer(db.upsert_bundle_embeddings)
+backfill_bundle_analytics = _writer(db.backfill_bundle_analytics)
+claim_idempotency_key = _writer(db.claim_idempotency_key)
+take_over_idempotency_key = _writer(db.take_over_idempotency_key)
+complete_idempotency_keys = _writer(db.complete_idempotency_keys)
+release_idempotency_keys = _writer(db.release_idempotency_keys)
+insert_pooled_bundle = _writer(db.insert_pooled_bundle)
+take_pooled_bundle = _writer(db.take_pooled_bundle)
+claim_pregeneration = _writer(db.claim_pregeneration)
+finish_pregeneration = _writer(db.finish_pregeneration)
+enqueue_generation_job = _writer(db.enqueue_generation_job)
+claim_generation_job = _writer(db.claim_generation_job)
+renew_generation_job = _writer(db.renew_generation_job)
+complete_generation_job = _writer(db.complete_generation_job)
+fail_generation_job = _writer(db.fail_generation_job)
+cancel_generation_job = _writer(db.cancel_generation_job)
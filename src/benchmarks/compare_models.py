@@ -0,0 +1,334 @@
+"""
+Side-by-side comparison of chat models for the production pipeline.
+
+Generates a bundle for every theme of `config.prompts` with every model of
+the matrix, concurrently, under a requests-per-minute limit and a
+concurrency limit per provider (the free tiers are rate limited per
+account, not per model). Each bundle is then reconstructed into a narrative
+by a single judge model, and all (expanded description, reconstruction)
+pairs are scored in one batched embedding call: the cosine similarity is the
+quality column, the same measure the tests/<model>/ folders were scored with
+by hand.
+
+Run from the src/ folder:
+
+    python -m benchmarks.compare_models
+    python -m benchmarks.compare_models --models groq:openai/gpt-oss-20b,google:gemini-2.5-flash --prompts 0,1
+    python -m benchmarks.compare_models --fake   # offline, with benchmarks/fakes.py
+
+Runs (bundles, reconstructions and scores) are saved to
+benchmarks/results/models/.
+"""
+
+from datetime import datetime
+from functools import partial
+from os.path import join
+from typing import Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import time
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain.messages import HumanMessage
+
+from benchmarks.run import RESULTS_PATH, current_commit, prepare_workspace, summarize
+from llm_models import GoogleModels, GroqModels, NvidiaModels, Providers
+
+PROVIDERS = {
+    "groq": (Providers.GROQ, GroqModels),
+    "google": (Providers.GOOGLE, GoogleModels),
+    "nvidia": (Providers.NVIDIA, NvidiaModels),
+}
+
+# Limites padrão por provider (camada gratuita).
+DEFAULT_REQUESTS_PER_MINUTE = {"groq": 30, "google": 10, "nvidia": 40}
+
+COLUMNS = [
+    "runs",
+    "errors",
+    "p50_s",
+    "p90_s",
+    "p99_s",
+    "input_tokens",
+    "output_tokens",
+    "retries",
+    "cost_usd",
+    "similarity",
+]
+
+
+def model_matrix(spec: Optional[str] = None) -> List[Tuple[str, str]]:
+    """(provider, model) pairs of `spec` ("groq:model,..."), or every known model."""
+    if spec:
+        pairs = []
+        for item in spec.split(","):
+            provider, _, model = item.strip().partition(":")
+            if provider not in PROVIDERS or not model:
+                raise ValueError(f"Invalid model '{item}', expected <provider>:<model>.")
+            pairs.append((provider, model))
+        return pairs
+
+    return [
+        (provider, value)
+        for provider, (_, models) in PROVIDERS.items()
+        for name, value in vars(models).items()
+        if not name.startswith("_") and isinstance(value, str)
+    ]
+
+
+def reconstruction_prompt(asset_bundle) -> str:
+    assets = asset_bundle.model_dump(
+        exclude={
+            "name",
+            "description",
+            "raw_description",
+            "usage_metadata",
+            "generation_time_seconds",
+            "stage_metrics",
+            "tileset",
+        }
+    )
+    return f"""
+Please, reconstruct the thematic description based strictly on this Asset Bundle:
+
+=== ASSET BUNDLE (JSON) ===
+{json.dumps(assets)}
+
+Write the narrative description of the environment represented above (in English).
+"""
+
+
+def cosine(vector1: List[float], vector2: List[float]) -> float:
+    dot_product = sum(a * b for a, b in zip(vector1, vector2))
+    magnitude = math.sqrt(sum(a * a for a in vector1)) * math.sqrt(sum(b * b for b in vector2))
+    return dot_product / magnitude if magnitude else 0.0
+
+
+class Harness:
+    def __init__(self, args) -> None:
+        self.args = args
+        self.limiters: Dict[str, InMemoryRateLimiter] = {}
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.prices: Dict[str, List[float]] = {}
+        if args.prices:
+            with open(args.prices, "r", encoding="utf-8") as file:
+                self.prices = json.load(file)
+
+    def provider(self, provider: str):
+        """Chat model class of `provider`, sharing one rate limiter per provider."""
+        if provider not in self.limiters:
+            rpm = self.args.requests_per_minute or DEFAULT_REQUESTS_PER_MINUTE[provider]
+            self.limiters[provider] = InMemoryRateLimiter(
+                requests_per_second=rpm / 60, check_every_n_seconds=0.05
+            )
+            self.semaphores[provider] = asyncio.Semaphore(self.args.concurrency)
+
+        if self.args.fake:
+            import asset_generator
+
+            chat_model = asset_generator.provider_key
+        else:
+            chat_model = PROVIDERS[provider][0]
+        return partial(chat_model, rate_limiter=self.limiters[provider])
+
+    async def generate(self, provider: str, model: str, prompt_index: int) -> dict:
+        from asset_generator import AssetsGenerator
+        from config import prompts
+
+        run = {"provider": provider, "model": model, "prompt": prompt_index}
+        chat_model = self.provider(provider)
+
+        async with self.semaphores[provider]:
+            start = time.perf_counter()
+            try:
+                asset_generator = AssetsGenerator(
+                    prompts[prompt_index], provider=chat_model, model_name=model
+                )
+                asset_bundle = await asset_generator.agenerate_asset_bundle()
+            except Exception as e:
+                run["error"] = repr(e)[:200]
+                print(f"{provider}:{model} p{prompt_index + 1} failed: {run['error']}")
+                return run
+            run["seconds"] = time.perf_counter() - start
+
+        stages = asset_bundle.stage_metrics
+        run["input_tokens"] = sum(stage["input_tokens"] for stage in stages.values())
+        run["output_tokens"] = sum(stage["output_tokens"] for stage in stages.values())
+        run["retries"] = sum(stage["attempts"] - stage["llm_calls"] for stage in stages.values())
+        run["bundle"] = asset_bundle
+        print(f"{provider}:{model} p{prompt_index + 1} done in {run['seconds']:.1f}s")
+        return run
+
+    async def reconstruct(self, run: dict) -> None:
+        from asset_generator import AssetsGenerator
+
+        provider, model = self.args.judge.split(":", 1)
+        judge = AssetsGenerator("", provider=self.provider(provider), model_name=model)
+        async with self.semaphores[provider]:
+            try:
+                response = await judge._ask_llm(
+                    "reconstruction", [HumanMessage(reconstruction_prompt(run["bundle"]))]
+                )
+                run["reconstruction"] = str(response.content)
+            except Exception as e:
+                # A geração conta na latência; só a nota de qualidade fica faltando.
+                run["reconstruction_error"] = repr(e)[:200]
+
+    def score(self, runs: List[dict]) -> None:
+        """Cosine similarity of every pair, from a single embedding batch."""
+        from vector_db import get_embeddings
+
+        scored = [run for run in runs if "reconstruction" in run]
+        if not scored:
+            return
+        texts = []
+        for run in scored:
+            texts += [run["bundle"].description, run["reconstruction"]]
+
+        vectors = get_embeddings().embed_documents(texts)
+        for index, run in enumerate(scored):
+            run["similarity"] = cosine(vectors[2 * index], vectors[2 * index + 1])
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+        if model not in self.prices:
+            return None
+        input_price, output_price = self.prices[model]
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def report(self, runs: List[dict], wall_seconds: float) -> Dict[str, dict]:
+        table: Dict[str, dict] = {}
+        for provider, model in model_matrix(self.args.models):
+            model_runs = [run for run in runs if run["model"] == model and run["provider"] == provider]
+            succeeded = [run for run in model_runs if "error" not in run]
+            latency = summarize(
+                [run["seconds"] for run in succeeded],
+                len(model_runs) - len(succeeded),
+                wall_seconds,
+            )
+            similarities = [run["similarity"] for run in succeeded if "similarity" in run]
+            input_tokens = sum(run["input_tokens"] for run in succeeded)
+            output_tokens = sum(run["output_tokens"] for run in succeeded)
+            cost = self.cost(model, input_tokens, output_tokens)
+
+            table[f"{provider}:{model}"] = {
+                "runs": len(model_runs),
+                "errors": latency["errors"],
+                "p50_s": round(latency["p50_ms"] / 1000, 2),
+                "p90_s": round(latency["p90_ms"] / 1000, 2),
+                "p99_s": round(latency["p99_ms"] / 1000, 2),
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "retries": sum(run["retries"] for run in succeeded),
+                "cost_usd": round(cost, 4) if cost is not None else "-",
+                "similarity": (
+                    round(sum(similarities) / len(similarities), 4) if similarities else "-"
+                ),
+            }
+        return table
+
+    async def run(self) -> List[dict]:
+        from config import prompts
+
+        indexes = (
+            [int(index) for index in self.args.prompts.split(",")]
+            if self.args.prompts
+            else list(range(len(prompts)))
+        )
+        # A ordem intercala modelos, para que nenhum provider espere pelos outros.
+        jobs = [
+            (provider, model, index)
+            for _ in range(self.args.repeats)
+            for index in indexes
+            for provider, model in model_matrix(self.args.models)
+        ]
+        self.provider(self.args.judge.split(":", 1)[0])
+
+        runs = await asyncio.gather(*(self.generate(*job) for job in jobs))
+        await asyncio.gather(*(self.reconstruct(run) for run in runs if "error" not in run))
+        self.score(runs)
+        return runs
+
+
+def print_table(table: Dict[str, dict]) -> None:
+    width = max([len("model")] + [len(name) for name in table]) + 2
+    print(f"{'model':<{width}}" + "".join(f"{column:>14}" for column in COLUMNS))
+    ranking = sorted(
+        table.items(),
+        key=lambda item: item[1]["similarity"] if item[1]["similarity"] != "-" else -1,
+        reverse=True,
+    )
+    for name, row in ranking:
+        print(f"{name:<{width}}" + "".join(f"{row[column]!s:>14}" for column in COLUMNS))
+
+
+def save(args, runs: List[dict], table: Dict[str, dict]) -> str:
+    path = join(RESULTS_PATH, "models")
+    os.makedirs(path, exist_ok=True)
+    timestamp = datetime.now().isoformat(timespec="seconds")
+    result = {
+        "commit": current_commit(),
+        "timestamp": timestamp,
+        "parameters": {key: value for key, value in vars(args).items() if key != "no_save"},
+        "table": table,
+        "runs": [
+            {
+                **{key: value for key, value in run.items() if key != "bundle"},
+                **({"bundle": run["bundle"].model_dump()} if "bundle" in run else {}),
+            }
+            for run in runs
+        ],
+    }
+    file_path = join(path, f"{timestamp.replace(':', '-')}_{result['commit']}.json")
+    with open(file_path, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2)
+    return file_path
+
+
+def main() -> None:
+    from config import model_key, provider_key
+
+    default_provider = next(
+        name for name, (provider, _) in PROVIDERS.items() if provider is provider_key
+    )
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models", help="<provider>:<model>,... (default: every model)")
+    parser.add_argument("--prompts", help="Indexes of config.prompts (default: all)")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--judge", default=f"{default_provider}:{model_key}")
+    parser.add_argument("--concurrency", type=int, default=2, help="Generations per provider")
+    parser.add_argument("--requests-per-minute", type=float, help="LLM calls per provider")
+    parser.add_argument("--prices", help='JSON {"<model>": [input, output] USD per 1M tokens}')
+    parser.add_argument("--fake", action="store_true", help="Offline, with benchmarks/fakes.py")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    workspace = None
+    if args.fake:
+        args.llm_failure_rate = args.llm_invalid_rate = args.embedding_failure_rate = 0.0
+        args.requests_per_minute = args.requests_per_minute or 6000
+        workspace = prepare_workspace(args)
+
+    harness = Harness(args)
+    start = time.perf_counter()
+    try:
+        runs = asyncio.run(harness.run())
+    finally:
+        if workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+    table = harness.report(runs, time.perf_counter() - start)
+
+    print_table(table)
+    if not args.no_save:
+        print(f"Saved to {save(args, runs, table)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Deterministic local stand-ins for the chat models and the embedding model, so
+the generation pipeline can be benchmarked without Groq/Google credentials.
+
+Both stand-ins support configurable latency and failure injection.
+"""
+
+from functools import partial
+from typing import Any, AsyncIterator, Iterator, List, Optional
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+EMBEDDING_DIMENSIONS = 768  # Same size as models/text-embedding-004
+
+ADJECTIVES = [
+    "rusty", "mossy", "cracked", "ancient", "glowing", "cursed", "iron",
+    "golden", "rotten", "molten", "frozen", "bloody", "wooden", "crystal",
+    "dark", "stone", "metal", "broken", "burning", "slimy",
+]
+NOUNS = [
+    "sword", "wall", "floor", "door", "goblin", "skeleton", "potion", "shield",
+    "dagger", "staff", "bow", "drone", "spider", "slime", "brick", "lava",
+    "water", "crown", "scroll", "orb", "knight", "mage", "bat", "axe",
+]
+
+
+def _stable_seed(*parts: Any) -> int:
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def _inject_latency_and_failures(
+    rng: random.Random, latency_seconds: float, jitter_seconds: float, failure_rate: float
+) -> float:
+    delay = max(0.0, latency_seconds + rng.uniform(-jitter_seconds, jitter_seconds))
+
+    if rng.random() < failure_rate:
+        raise RuntimeError("Injected provider failure.")
+
+    return delay
+
+
+class SchemaSynthesizer:
+    """
+    Builds a deterministic instance of a JSON schema (as produced by
+    `BaseModel.model_json_schema()`), honouring enums, ranges and lengths.
+    """
+
+    def __init__(self, rng: random.Random, list_length: int) -> None:
+        self.rng = rng
+        self.list_length = list_length
+
+    def build(self, schema: dict, root: Optional[dict] = None, key: str = "") -> Any:
+        root = root or schema
+
+        if "$ref" in schema:
+            name = schema["$ref"].split("/")[-1]
+            return self.build(root["$defs"][name], root, key)
+
+        if "enum" in schema:
+            return self.rng.choice(schema["enum"])
+
+        if "const" in schema:
+            return schema["const"]
+
+        schema_type = schema.get("type")
+
+        if schema_type == "object":
+            return {
+                name: self.build(property_schema, root, name)
+                for name, property_schema in schema.get("properties", {}).items()
+            }
+
+        if schema_type == "array":
+            return [
+                self.build(schema["items"], root, key) for _ in range(self.list_length)
+            ]
+
+        if schema_type == "integer":
+            low = schema.get("minimum", schema.get("exclusiveMinimum", -1) + 1)
+            high = schema.get("maximum", schema.get("exclusiveMaximum", 11) - 1)
+            return self.rng.randint(int(low), int(high))
+
+        if schema_type == "number":
+            return round(self.rng.uniform(0, 10), 2)
+
+        if schema_type == "boolean":
+            return self.rng.random() < 0.5
+
+        return self._string(schema, key)
+
+    def _string(self, schema: dict, key: str) -> str:
+        adjective = self.rng.choice(ADJECTIVES)
+        noun = self.rng.choice(NOUNS)
+
+        if key == "color":
+            return "#%06X" % self.rng.randint(0, 0xFFFFFF)
+
+        if key == "name":
+            value = f"{adjective}_{noun}_{self.rng.randint(0, 999)}"
+        else:
+            words = [adjective, noun] + self.rng.sample(ADJECTIVES + NOUNS, 6)
+            value = " ".join(words).capitalize() + "."
+
+        min_length = schema.get("minLength", 0)
+        max_length = schema.get("maxLength")
+        value = value.ljust(min_length, "x")
+
+        return value[:max_length] if max_length else value
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model stand-in. Plain calls return a prose answer; calls made through
+    `with_structured_output` return JSON synthesized from the schema.
+    """
+
+    model: str = "fake-chat-model"
+    temperature: float = 0.0
+    latency_seconds: float = 0.0
+    latency_jitter_seconds: float = 0.0
+    failure_rate: float = 0.0
+    invalid_rate: float = 0.0
+    list_length: int = 2
+    seed: int = 0
+
+    _calls: dict = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def with_structured_output(self, schema, *, method: str = "json_schema", **kwargs):  # type: ignore[override]
+        if not isinstance(schema, dict):
+            schema = schema.model_json_schema()
+
+        return self.bind(fake_schema=schema) | JsonOutputParser()
+
+    def _rng_for(self, messages: List[BaseMessage]) -> random.Random:
+        prompt = "".join(str(message.content) for message in messages)
+
+        with self._lock:
+            call_index = self._calls.get(prompt, 0)
+            self._calls[prompt] = call_index + 1
+
+        return random.Random(_stable_seed(self.seed, self.model, prompt, call_index))
+
+    def _build_text(self, rng: random.Random, schema: Optional[dict]) -> str:
+        if schema is None:
+            words = [rng.choice(ADJECTIVES + NOUNS) for _ in range(120)]
+            return "The Fake Realm. " + " ".join(words)
+
+        value = SchemaSynthesizer(rng, self.list_length).build(schema)
+
+        if rng.random() < self.invalid_rate:
+            # Violates the schema so that the caller's validation retries.
+            value = {"unexpected": value}
+
+        return json.dumps(value)
+
+    def _build_message(self, messages: List[BaseMessage], text: str) -> AIMessage:
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = len(text) // 4
+
+        return AIMessage(
+            content=text,
+            response_metadata={"model_name": self.model},
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def _prepare(self, messages: List[BaseMessage], **kwargs) -> tuple[float, str]:
+        rng = self._rng_for(messages)
+        delay = _inject_latency_and_failures(
+            rng, self.latency_seconds, self.latency_jitter_seconds, self.failure_rate
+        )
+        return delay, self._build_text(rng, kwargs.get("fake_schema"))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        delay, text = self._prepare(messages, **kwargs)
+        time.sleep(delay)
+
+        return ChatResult(
+            generations=[ChatGeneration(message=self._build_message(messages, text))]
+        )
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        delay, text = self._prepare(messages, **kwargs)
+        await asyncio.sleep(delay)
+
+        return ChatResult(
+            generations=[ChatGeneration(message=self._build_message(messages, text))]
+        )
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        delay, text = self._prepare(messages, **kwargs)
+        message = self._build_message(messages, text)
+        pieces = re.findall(r".{1,16}", text, flags=re.DOTALL) or [""]
+
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="",
+                response_metadata=message.response_metadata,
+                usage_metadata=message.usage_metadata,
+            )
+        )
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        delay, text = self._prepare(messages, **kwargs)
+        message = self._build_message(messages, text)
+        pieces = re.findall(r".{1,16}", text, flags=re.DOTALL) or [""]
+
+        for piece in pieces:
+            await asyncio.sleep(delay / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+        yield ChatGenerationChunk(
+            message=AIMessageChunk(
+                content="",
+                response_metadata=message.response_metadata,
+                usage_metadata=message.usage_metadata,
+            )
+        )
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Embedding stand-in based on feature hashing of the words of the text, so
+    texts sharing vocabulary get similar vectors.
+    """
+
+    def __init__(
+        self,
+        dimensions: int = EMBEDDING_DIMENSIONS,
+        latency_seconds: float = 0.0,
+        latency_jitter_seconds: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.dimensions = dimensions
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            hashed = _stable_seed(self.seed, word)
+            sign = 1.0 if hashed & 1 else -1.0
+            vector[(hashed >> 1) % self.dimensions] += sign
+
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def _wait(self, texts: List[str]) -> None:
+        with self._lock:
+            self.calls += 1
+            call_index = self.calls
+
+        rng = random.Random(_stable_seed(self.seed, call_index, *texts))
+        time.sleep(
+            _inject_latency_and_failures(
+                rng, self.latency_seconds, self.latency_jitter_seconds, self.failure_rate
+            )
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._wait(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._wait([text])
+        return self._embed(text)
+
+
+def fake_provider(**settings):
+    """
+    Returns a provider usable as `AssetsGenerator(provider=...)` or
+    `config.provider_key`, i.e. a callable accepting `model` and `temperature`.
+    """
+    return partial(FakeChatModel, **settings)
@@ -0,0 +1,103 @@
+"""
+Heap cost of the tile catalogue.
+
+Measures with tracemalloc the Python heap held by the old pandas DataFrame
+(every CSV concatenated, base64 data URIs as object strings) and by the
+compact `TileCatalogue`, built from the CSVs and from the mapped tile
+artifact, plus the allocations of a position lookup.
+
+Run from the src/ folder:
+
+    python -m benchmarks.memory [--lookups 1000]
+"""
+
+from typing import Callable, Tuple
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+
+from tile_catalogue import TileCatalogue
+from vector_db import DATABASES
+
+
+def measure(build: Callable) -> Tuple[object, int, float]:
+    """(result, bytes still allocated by it, seconds) of `build()`."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - started
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, seconds
+
+
+def dataframe_catalogue() -> pd.DataFrame:
+    dataframes = []
+    for category, config in DATABASES.items():
+        df = pd.read_csv(config["csv_path"])
+        df["category"] = category
+        dataframes.append(df)
+    return pd.concat(dataframes, ignore_index=True)
+
+
+def artifact_catalogue() -> TileCatalogue:
+    from tile_artifact import TILE_ARTIFACT_PATH, TileArtifact
+
+    # Instância nova, para que o mapeamento entre na medição.
+    return TileCatalogue.from_artifact(TileArtifact(TILE_ARTIFACT_PATH))
+
+
+def run(lookups: int) -> None:
+    csv_paths = {category: config["csv_path"] for category, config in DATABASES.items()}
+
+    df, df_bytes, df_seconds = measure(dataframe_catalogue)
+    positions = list(zip(df["x"].tolist(), df["y"].tolist()))
+    sample = [random.choice(positions) for _ in range(lookups)]
+
+    def dataframe_lookups() -> list:
+        return [
+            df[(df["x"] == x) & (df["y"] == y)].to_dict(orient="records") for x, y in sample
+        ]
+
+    rows = [("DataFrame (old)", df_bytes, df_seconds, dataframe_lookups)]
+
+    from tile_artifact import get_tile_artifact
+
+    # Constrói o artefato (se preciso) fora da medição.
+    get_tile_artifact()
+    builders = [("TileCatalogue (CSV)", lambda: TileCatalogue.from_csvs(csv_paths))]
+    builders.append(("TileCatalogue (artifact)", artifact_catalogue))
+    for name, build in builders:
+        try:
+            catalogue, catalogue_bytes, seconds = measure(build)
+        except Exception as e:
+            print(f"{name}: skipped ({e})")
+            continue
+
+        def catalogue_lookups(catalogue: TileCatalogue = catalogue) -> list:
+            return [catalogue.at(x, y) for x, y in sample]
+
+        rows.append((name, catalogue_bytes, seconds, catalogue_lookups))
+
+    print(f"{len(df)} tiles, {lookups} position lookups\n")
+    print(f"{'catalogue':<26} {'heap':>10} {'build':>9} {'lookups':>10} {'lookup heap':>12}")
+    for name, heap_bytes, seconds, lookup in rows:
+        _, lookup_bytes, lookup_seconds = measure(lookup)
+        print(
+            f"{name:<26} {heap_bytes / 2**20:>8.2f}MB {seconds * 1000:>7.0f}ms "
+            f"{lookup_seconds * 1000:>8.1f}ms {lookup_bytes / 2**10:>10.1f}KB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Heap cost of the tile catalogue.")
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    run(args.lookups)
@@ -0,0 +1,420 @@
+"""
+Offline benchmark of the generation pipeline.
+
+Runs AssetsGenerator, the vector lookups, db.py and the FastAPI routes under
+concurrent load with local stand-ins for the chat model and the embedding
+model (see benchmarks/fakes.py), so no API key or network is needed.
+
+Run from the src/ folder:
+
+    python -m benchmarks.run --requests 20 --concurrency 4 --llm-latency 0.2
+
+Every run is saved to benchmarks/results/ (ignored by git) and compared
+against the previous run with the same parameters, so regressions are
+visible between commits.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from os.path import join
+from typing import Callable, List
+import argparse
+import asyncio
+import glob
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from utils import MAIN_PATH
+
+RESULTS_PATH = join(MAIN_PATH, "benchmarks", "results")
+
+SCENARIOS = ["generator", "vector", "hybrid", "db", "api", "export"]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(
+    latencies: List[float], errors: int, wall_seconds: float, error_types: dict | None = None
+) -> dict:
+    values = sorted(latencies)
+
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "error_types": error_types or {},
+        "wall_seconds": round(wall_seconds, 4),
+        "throughput_per_second": round(len(values) / wall_seconds, 3) if wall_seconds else 0.0,
+        "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(1000 * percentile(values, 0.50), 3),
+        "p90_ms": round(1000 * percentile(values, 0.90), 3),
+        "p99_ms": round(1000 * percentile(values, 0.99), 3),
+        "max_ms": round(1000 * values[-1], 3) if values else 0.0,
+    }
+
+
+def run_concurrently(function: Callable, arguments: list, concurrency: int) -> dict:
+    """Calls `function(argument)` for every argument from a thread pool."""
+    latencies: List[float] = []
+    errors = 0
+    error_types: dict = {}
+
+    def timed(argument):
+        start = time.perf_counter()
+        function(argument)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(timed, argument) for argument in arguments]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors += 1
+                error_types[repr(e)[:120]] = error_types.get(repr(e)[:120], 0) + 1
+
+    return summarize(latencies, errors, time.perf_counter() - start, error_types)
+
+
+def prepare_workspace(args) -> str:
+    """
+    Points db.py and vector_db.py at a scratch copy of the data and installs
+    the fake models. Must run before the project modules are imported.
+    """
+    workspace = tempfile.mkdtemp(prefix="roguelike_benchmark_")
+    os.environ["ASSETS_DB_PATH"] = join(workspace, "database.db")
+
+    import asset_generator
+    import vector_db
+    from benchmarks.fakes import FakeEmbeddings, fake_provider
+
+    for store_type, db_config in vector_db.DATABASES.items():
+        if os.path.exists(db_config["db_path"]):
+            copy_path = join(workspace, os.path.basename(db_config["db_path"]))
+            shutil.copytree(db_config["db_path"], copy_path)
+            db_config["db_path"] = copy_path
+
+    vector_db.set_embeddings(
+        FakeEmbeddings(
+            latency_seconds=args.embedding_latency,
+            latency_jitter_seconds=args.embedding_latency / 4,
+            failure_rate=args.embedding_failure_rate,
+            seed=args.seed,
+        )
+    )
+    asset_generator.provider_key = fake_provider(
+        latency_seconds=args.llm_latency,
+        latency_jitter_seconds=args.llm_latency / 4,
+        failure_rate=args.llm_failure_rate,
+        invalid_rate=args.llm_invalid_rate,
+        seed=args.seed,
+    )
+
+    return workspace
+
+
+def _embedding_calls_per_bundle() -> int:
+    """
+    Embedding calls a bundle may make with the default section sizes: one
+    batched query per store and prefetch batch (see texture_prefetch_batch_size).
+    """
+    from config import (
+        number_of_enemies_per_bundle,
+        number_of_levels_per_bundle,
+        number_of_weapons_per_bundle,
+        texture_prefetch_batch_size,
+    )
+
+    tiles_per_store = [
+        1 + number_of_enemies_per_bundle,  # entities: player + enemies
+        2 * number_of_levels_per_bundle,  # environments: wall + floor
+        number_of_weapons_per_bundle + 1,  # items: weapons + final objective
+    ]
+    return sum(-(-tiles // texture_prefetch_batch_size) for tiles in tiles_per_store)
+
+
+def benchmark_generator(args) -> dict:
+    from asset_generator import AssetsGenerator
+    from config import prompts
+    from vector_db import get_embeddings
+
+    themes = [prompts[i % len(prompts)] for i in range(args.requests)]
+    embeddings = get_embeddings()
+    calls_before = embeddings.calls  # type: ignore[attr-defined]
+
+    summary = run_concurrently(
+        lambda theme: AssetsGenerator(theme).generate_asset_bundle(),
+        themes,
+        args.concurrency,
+    )
+
+    summary["embedding_calls"] = embeddings.calls - calls_before  # type: ignore[attr-defined]
+    if not (args.llm_failure_rate or args.llm_invalid_rate or args.embedding_failure_rate):
+        # O prefetch das texturas não pode multiplicar as chamadas de embedding.
+        budget = args.requests * _embedding_calls_per_bundle()
+        assert summary["embedding_calls"] <= budget, (
+            f"{summary['embedding_calls']} embedding calls for {args.requests} bundles "
+            f"(at most {budget} expected)."
+        )
+    return summary
+
+
+def _tile_queries(args) -> list:
+    from vector_db import DATABASES
+    import pandas as pd
+
+    queries = []
+    for store_type, db_config in DATABASES.items():
+        descriptions = pd.read_csv(db_config["csv_path"])["description"].tolist()
+        queries += [(str(description), store_type) for description in descriptions]
+
+    return [queries[(i * 7919) % len(queries)] for i in range(args.requests * 10)]
+
+
+def benchmark_vector(args) -> dict:
+    from vector_db import query_vector_store
+
+    return run_concurrently(
+        lambda query: query_vector_store(query[0], query[1], 1),
+        _tile_queries(args),
+        args.concurrency,
+    )
+
+
+def benchmark_hybrid(args) -> dict:
+    from lexical_retriever import query_tiles
+
+    return run_concurrently(
+        lambda query: query_tiles(query[0], query[1], 1, retriever="hybrid"),
+        _tile_queries(args),
+        args.concurrency,
+    )
+
+
+def _sample_bundle():
+    from asset_generator import AssetsGenerator
+    from config import prompts
+
+    return AssetsGenerator(prompts[0]).generate_asset_bundle()
+
+
+def benchmark_db(args) -> dict:
+    from db import (
+        delete_asset_bundle_by_id,
+        find_all_assets_bundles,
+        find_bundle_data_by_id,
+        insert_asset_bundle,
+    )
+
+    bundle = _sample_bundle()
+    ids: List[int] = []
+
+    def operation(index: int):
+        kind = index % 4
+        if kind == 0:
+            ids.append(insert_asset_bundle(bundle, "benchmark"))
+        elif kind == 1:
+            find_all_assets_bundles()
+        elif kind == 2 and ids:
+            find_bundle_data_by_id(ids[-1])
+        elif kind == 3 and len(ids) > 1:
+            delete_asset_bundle_by_id(ids.pop(0))
+
+    return run_concurrently(operation, list(range(args.requests * 10)), args.concurrency)
+
+
+def benchmark_api(args) -> dict:
+    from api import app
+    from config import prompts
+    from db import insert_asset_bundle
+    import httpx
+
+    # Bundle lido pelas requisições de detalhe (o cenário db apaga os que insere).
+    bundle_id = insert_asset_bundle(_sample_bundle(), "benchmark")
+
+    async def main() -> dict:
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies: List[float] = []
+        errors = 0
+        transport = httpx.ASGITransport(app=app)
+
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=None
+        ) as client:
+
+            async def request(index: int):
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    if index % 5 == 0:
+                        response = await client.post(
+                            "/asset-bundle/",
+                            json={"map_description": prompts[index % len(prompts)]},
+                        )
+                    elif index % 5 in (1, 2):
+                        response = await client.get("/asset-bundle/")
+                    else:
+                        response = await client.get(f"/asset-bundle/{bundle_id}")
+
+                    if response.status_code >= 400:
+                        errors += 1
+                    else:
+                        latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(request(i) for i in range(args.requests * 5)))
+            return summarize(latencies, errors, time.perf_counter() - start)
+
+    return asyncio.run(main())
+
+
+def benchmark_export(args) -> dict:
+    """Concurrent NDJSON exports; an export with missing lines counts as an error."""
+    from api import app
+    from db import insert_asset_bundle
+    import httpx
+
+    bundle = _sample_bundle()
+    for _ in range(args.requests * 5):
+        insert_asset_bundle(bundle, "benchmark")
+
+    async def main() -> dict:
+        latencies: List[float] = []
+        errors = 0
+        error_types: dict = {}
+        transport = httpx.ASGITransport(app=app)
+
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=None
+        ) as client:
+            expected = len((await client.get("/asset-bundle/")).json())
+
+            async def request(index: int):
+                nonlocal errors
+                start = time.perf_counter()
+                try:
+                    response = await client.get("/export/asset-bundle/")
+                    lines = response.text.count("\n")
+                    if response.status_code != 200 or lines != expected:
+                        raise RuntimeError(f"{response.status_code}: {lines}/{expected} lines")
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    errors += 1
+                    error_types[repr(e)[:120]] = error_types.get(repr(e)[:120], 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(request(i) for i in range(args.requests * 2)))
+            return summarize(latencies, errors, time.perf_counter() - start, error_types)
+
+    return asyncio.run(main())
+
+
+def current_commit() -> str:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=MAIN_PATH,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            cwd=MAIN_PATH,
+        ).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except Exception:
+        return "unknown"
+
+
+def load_previous_result(parameters: dict) -> dict | None:
+    for path in sorted(glob.glob(join(RESULTS_PATH, "*.json")), reverse=True):
+        with open(path, "r", encoding="utf-8") as file:
+            result = json.load(file)
+        if result.get("parameters") == parameters:
+            return result
+    return None
+
+
+def print_report(result: dict, previous: dict | None) -> None:
+    columns = ["requests", "errors", "throughput_per_second", "p50_ms", "p90_ms", "p99_ms"]
+    print(f"Benchmark at {result['commit']} ({result['timestamp']})")
+    print(f"{'scenario':<12}" + "".join(f"{column:>24}" for column in columns))
+
+    for scenario, summary in result["scenarios"].items():
+        line = f"{scenario:<12}"
+        for column in columns:
+            cell = f"{summary[column]}"
+            if previous and scenario in previous["scenarios"] and column.endswith(("_ms", "_second")):
+                old = previous["scenarios"][scenario][column]
+                if old:
+                    cell += f" ({100 * (summary[column] - old) / old:+.1f}%)"
+            line += f"{cell:>24}"
+        print(line)
+
+    if previous:
+        print(f"Compared against {previous['commit']} ({previous['timestamp']})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--llm-invalid-rate", type=float, default=0.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--embedding-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    workspace = prepare_workspace(args)
+    parameters = {key: value for key, value in vars(args).items() if key != "no_save"}
+    benchmarks = {
+        "generator": benchmark_generator,
+        "vector": benchmark_vector,
+        "hybrid": benchmark_hybrid,
+        "db": benchmark_db,
+        "api": benchmark_api,
+        "export": benchmark_export,
+    }
+
+    try:
+        result = {
+            "commit": current_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "parameters": parameters,
+            "scenarios": {
+                scenario: benchmarks[scenario](args)
+                for scenario in args.scenarios.split(",")
+            },
+        }
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    previous = load_previous_result(parameters)
+    print_report(result, previous)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        file_name = f"{result['timestamp'].replace(':', '-')}_{result['commit']}.json"
+        with open(join(RESULTS_PATH, file_name), "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Compact binary encoding of an AssetBundle for game clients.
+
+Layout (all integers are unsigned LEB128 varints unless noted):
+
+    magic "RGAB" | version (u8) | flags (u8) | layout id (u32, big endian)
+    string table: count, then (byte length, utf-8 bytes) per string; with
+        flag 0x02 it is preceded by its compressed length and zlib deflated
+    body: the bundle fields in model declaration order, without keys
+        str / Literal -> index in the string table
+        int           -> zigzag varint
+        dict          -> index of its JSON text in the string table
+        list          -> item count, then the items
+        model         -> its fields, recursively
+    sprite atlas (flag 0x01): columns, tile size, sprite count,
+        (tileset x, tileset y) per sprite, PNG byte length, PNG bytes
+
+Repeated strings (tile colors, names, descriptions shared between tiles)
+are stored once. The layout id is derived from the model fields, so a
+client built against another version of the models rejects the payload
+instead of misreading it.
+"""
+
+from typing import Any, List, Literal, Optional, Tuple, Type, get_args, get_origin
+import functools
+import json
+import struct
+import zlib
+
+from pydantic import BaseModel
+
+from models import AssetBundle
+from sprites import TILE_SIZE, build_sprite_atlas
+
+BUNDLE_MEDIA_TYPE = "application/vnd.roguelike.asset-bundle"
+
+MAGIC = b"RGAB"
+FORMAT_VERSION = 1
+FLAG_ATLAS = 0x01
+FLAG_DEFLATE = 0x02
+
+
+################################################################################
+# Layout
+################################################################################
+
+
+def _field_layout(annotation) -> Any:
+    origin = get_origin(annotation)
+
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return ("model", annotation)
+    if origin in (list, List):
+        return ("list", _field_layout(get_args(annotation)[0]))
+    if origin is Literal or annotation is str:
+        return ("str",)
+    if annotation is int:
+        return ("int",)
+    if annotation is dict or origin is dict:
+        return ("json",)
+
+    raise TypeError(f"Unsupported field type in the bundle codec: {annotation!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def _model_layout(model: Type[BaseModel]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple(
+        (name, _field_layout(field.annotation)) for name, field in model.model_fields.items()
+    )
+
+
+def _describe_layout(model: Type[BaseModel]) -> list:
+    def describe(layout):
+        if layout[0] == "model":
+            return _describe_layout(layout[1])
+        if layout[0] == "list":
+            return ["list", describe(layout[1])]
+        return layout[0]
+
+    return [[name, describe(layout)] for name, layout in _model_layout(model)]
+
+
+@functools.lru_cache(maxsize=None)
+def layout_id(model: Type[BaseModel] = AssetBundle) -> int:
+    return zlib.crc32(json.dumps(_describe_layout(model)).encode("utf-8"))
+
+
+################################################################################
+# Encoding
+################################################################################
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+class _Encoder:
+    def __init__(self) -> None:
+        self.strings: dict[str, int] = {}
+        self.body = bytearray()
+
+    def string(self, value: str) -> None:
+        index = self.strings.setdefault(value, len(self.strings))
+        _write_varint(self.body, index)
+
+    def value(self, layout, value) -> None:
+        kind = layout[0]
+
+        if kind == "model":
+            for name, field_layout in _model_layout(layout[1]):
+                self.value(field_layout, getattr(value, name))
+        elif kind == "list":
+            _write_varint(self.body, len(value))
+            for item in value:
+                self.value(layout[1], item)
+        elif kind == "str":
+            self.string(value)
+        elif kind == "int":
+            _write_varint(self.body, (value << 1) ^ (value >> 63))
+        elif kind == "json":
+            self.string(json.dumps(value, separators=(",", ":"), sort_keys=True))
+
+    def string_table(self) -> bytes:
+        out = bytearray()
+        _write_varint(out, len(self.strings))
+        for value in self.strings:
+            encoded = value.encode("utf-8")
+            _write_varint(out, len(encoded))
+            out += encoded
+        return bytes(out)
+
+
+def _texture_positions(bundle: AssetBundle) -> List[Tuple[int, int]]:
+    tiles = [bundle.player.tile_with_texture, bundle.final_objective.tile_with_texture]
+    for level in bundle.dungeon_levels.items:
+        tiles += [level.wall_tile_with_texture, level.floor_tile_with_texture]
+    tiles += [enemy.tile_with_texture for enemy in bundle.enemies.items]
+    tiles += [weapon.tile_with_texture for weapon in bundle.weapons.items]
+
+    return [
+        (tile.texture.tileset_position.x, tile.texture.tileset_position.y) for tile in tiles
+    ]
+
+
+def encode_bundle(
+    bundle: AssetBundle, include_atlas: bool = False, deflate: bool = True
+) -> bytes:
+    """Serializes the bundle, optionally followed by a sprite atlas of its tiles."""
+    encoder = _Encoder()
+    encoder.value(("model", AssetBundle), bundle)
+
+    flags = (FLAG_ATLAS if include_atlas else 0) | (FLAG_DEFLATE if deflate else 0)
+    out = bytearray(MAGIC)
+    out += struct.pack(">BBI", FORMAT_VERSION, flags, layout_id())
+
+    # A prosa domina o tamanho do bundle; deflate reduz a tabela a ~1/3.
+    string_table = encoder.string_table()
+    if deflate:
+        string_table = zlib.compress(string_table, 9)
+        _write_varint(out, len(string_table))
+    out += string_table
+    out += encoder.body
+
+    if include_atlas:
+        png, positions, columns = build_sprite_atlas(_texture_positions(bundle), bundle.tileset)
+        _write_varint(out, columns)
+        _write_varint(out, TILE_SIZE)
+        _write_varint(out, len(positions))
+        for x, y in positions:
+            _write_varint(out, x)
+            _write_varint(out, y)
+        _write_varint(out, len(png))
+        out += png
+
+    return bytes(out)
+
+
+################################################################################
+# Decoding
+################################################################################
+
+
+class _Decoder:
+    def __init__(self, data: bytes, offset: int) -> None:
+        self.data = data
+        self.offset = offset
+        self.strings: List[str] = []
+
+    def varint(self) -> int:
+        result = shift = 0
+        while True:
+            if self.offset >= len(self.data):
+                raise ValueError("Truncated asset bundle payload.")
+            byte = self.data[self.offset]
+            self.offset += 1
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+
+    def raw(self, length: int) -> bytes:
+        if self.offset + length > len(self.data):
+            raise ValueError("Truncated asset bundle payload.")
+        chunk = self.data[self.offset : self.offset + length]
+        self.offset += length
+        return chunk
+
+    def string_table(self, deflated: bool) -> None:
+        if deflated:
+            table = _Decoder(zlib.decompress(self.raw(self.varint())), 0)
+            table.string_table(False)
+            self.strings = table.strings
+        else:
+            self.strings = [
+                self.raw(self.varint()).decode("utf-8") for _ in range(self.varint())
+            ]
+
+    def value(self, layout):
+        kind = layout[0]
+
+        if kind == "model":
+            return {name: self.value(field_layout) for name, field_layout in _model_layout(layout[1])}
+        if kind == "list":
+            return [self.value(layout[1]) for _ in range(self.varint())]
+        if kind == "str":
+            return self.strings[self.varint()]
+        if kind == "int":
+            value = self.varint()
+            return (value >> 1) ^ -(value & 1)
+        if kind == "json":
+            return json.loads(self.strings[self.varint()])
+
+
+def decode_bundle(data: bytes) -> Tuple[AssetBundle, Optional[dict]]:
+    """
+    Inverse of `encode_bundle`. Returns the bundle and, when present, the atlas
+    as {"png", "columns", "tile_size", "positions"}.
+    """
+    if data[:4] != MAGIC:
+        raise ValueError("Not an asset bundle payload.")
+
+    version, flags, payload_layout_id = struct.unpack(">BBI", data[4:10])
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported asset bundle format version: {version}")
+    if payload_layout_id != layout_id():
+        raise ValueError("Asset bundle payload was encoded with a different model layout.")
+
+    decoder = _Decoder(data, 10)
+    decoder.string_table(bool(flags & FLAG_DEFLATE))
+    bundle = AssetBundle.model_validate(decoder.value(("model", AssetBundle)))
+
+    atlas = None
+    if flags & FLAG_ATLAS:
+        columns = decoder.varint()
+        tile_size = decoder.varint()
+        positions = [(decoder.varint(), decoder.varint()) for _ in range(decoder.varint())]
+        atlas = {
+            "png": decoder.raw(decoder.varint()),
+            "columns": columns,
+            "tile_size": tile_size,
+            "positions": positions,
+        }
+
+    return bundle, atlas
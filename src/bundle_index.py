@@ -0,0 +1,155 @@
+"""
+Semantic index over the generated bundles ("find similar bundles").
+
+The expanded `description` of each bundle is embedded once and stored in the
+`bundle_embeddings` table (keyed by the embedding model, so switching models
+re-embeds). In memory the index is a normalized float32 matrix, so a lookup
+is a single matrix-vector product with no remote call. Bundles inserted by
+other paths (bulk import, older databases) are embedded in batches on the
+next lookup; identical descriptions reuse the same embedding.
+"""
+
+from typing import Dict, List, Optional
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from db import (
+    find_assets_bundles_by_ids,
+    find_bundle_embeddings,
+    find_bundles_without_embedding,
+    upsert_bundle_embeddings,
+)
+from vector_db import get_embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BATCH_SIZE = 100
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _embedding_model_name() -> str:
+    embeddings = get_embeddings()
+    return str(getattr(embeddings, "model", type(embeddings).__name__))
+
+
+class BundleIndex:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._model: Optional[str] = None
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._by_hash: Dict[str, np.ndarray] = {}
+
+    def _load(self, model: str) -> None:
+        rows = find_bundle_embeddings(model)
+        self._model = model
+        self._by_hash = {}
+        self._ids = np.array([row["bundle_id"] for row in rows], dtype=np.int64)
+        vectors = [np.frombuffer(row["embedding"], dtype=np.float32) for row in rows]
+        self._matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        for row, vector in zip(rows, vectors):
+            self._by_hash[row["content_hash"]] = vector
+
+    def _add(self, items: List[Dict]) -> None:
+        """Embeds (or reuses) the descriptions of `items` ({id, description})."""
+        model = self._model or _embedding_model_name()
+        hashes = [_hash_text(item["description"] or "") for item in items]
+
+        missing = {
+            content_hash: item["description"] or ""
+            for content_hash, item in zip(hashes, items)
+            if content_hash not in self._by_hash
+        }
+        pending = list(missing.items())
+        for start in range(0, len(pending), EMBEDDING_BATCH_SIZE):
+            batch = pending[start : start + EMBEDDING_BATCH_SIZE]
+            vectors = get_embeddings().embed_documents([text for _, text in batch])
+            for (content_hash, _), vector in zip(batch, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                self._by_hash[content_hash] = vector / (np.linalg.norm(vector) + 1e-12)
+
+        rows = [
+            (item["id"], model, content_hash, self._by_hash[content_hash].tobytes())
+            for item, content_hash in zip(items, hashes)
+        ]
+        upsert_bundle_embeddings(rows)
+
+        keep = ~np.isin(self._ids, [item["id"] for item in items])
+        new_vectors = np.vstack([self._by_hash[content_hash] for content_hash in hashes])
+        self._ids = np.concatenate([self._ids[keep], [item["id"] for item in items]])
+        self._matrix = (
+            np.vstack([self._matrix[keep], new_vectors]) if keep.any() else new_vectors
+        )
+
+    def _refresh(self) -> None:
+        model = _embedding_model_name()
+        if self._model != model:
+            self._load(model)
+
+        missing = find_bundles_without_embedding(model)
+        if missing:
+            self._add(missing)
+
+    def add(self, bundle_id: int, description: str) -> None:
+        with self._lock:
+            model = _embedding_model_name()
+            if self._model != model:
+                self._load(model)
+            self._add([{"id": bundle_id, "description": description}])
+
+    def remove(self, bundle_id: int) -> None:
+        """Drops the bundle from memory; the row goes with the bundle (trigger)."""
+        with self._lock:
+            keep = self._ids != bundle_id
+            self._ids = self._ids[keep]
+            self._matrix = self._matrix[keep]
+
+    def similar(self, bundle_id: int, k: int) -> List[Dict]:
+        with self._lock:
+            self._refresh()
+            positions = np.flatnonzero(self._ids == bundle_id)
+            if len(positions) == 0:
+                return []
+
+            scores = self._matrix @ self._matrix[positions[0]]
+            scores[positions[0]] = -np.inf
+            k = min(k, len(scores) - 1)
+            if k <= 0:
+                return []
+
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            neighbours = [(int(self._ids[i]), float(scores[i])) for i in best]
+
+        metadata = find_assets_bundles_by_ids([bundle_id for bundle_id, _ in neighbours])
+        return [
+            {**metadata[neighbour_id], "score": round(score, 4)}
+            for neighbour_id, score in neighbours
+            if neighbour_id in metadata
+        ]
+
+
+bundle_index = BundleIndex()
+
+
+def index_bundle(bundle_id: int, description: str) -> None:
+    """Embeds a new bundle. Failures are logged: the next lookup retries."""
+    try:
+        bundle_index.add(bundle_id, description)
+    except Exception as e:
+        logger.warning(f"Could not index bundle {bundle_id}: {e}")
+
+
+def remove_bundle(bundle_id: int) -> None:
+    bundle_index.remove(bundle_id)
+
+
+def find_similar_bundles(bundle_id: int, k: int = 5) -> List[Dict]:
+    """Top-k bundles with the most similar description (cosine)."""
+    return bundle_index.similar(bundle_id, k)
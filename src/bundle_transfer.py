@@ -0,0 +1,241 @@
+"""
+NDJSON export and bulk import of the asset bundle library.
+
+Each line is one bundle:
+
+    {"id": ..., "parent_id": ..., "name": ..., "description": ..., "llm_model": ...,
+     "generation_time": ..., "create_at": ..., "bundle": {...AssetBundle...}}
+
+The export reads the table in batches of ids and writes the stored bundle_data
+as is, so memory stays constant regardless of the library size. The API uses
+the async version, which reads each batch on the db read pool (async_db.py).
+The import validates the lines in chunks and inserts them with executemany
+inside a single transaction. Ids are reassigned by the target database; the
+parent_id of a version is remapped to the new id of its parent when the parent
+is in the same file, otherwise it is dropped.
+Validation is the expensive part (~1 ms per bundle), so it can be spread over
+worker processes. Every line is validated (and the rows spooled to a temporary
+file) before the transaction opens, so the database write lock is only held
+for the inserts; the API runs them on the db writer thread (async_db.py).
+
+    python bundle_transfer.py export [-o library.ndjson]
+    python bundle_transfer.py import library.ndjson [--skip-invalid] [--workers 4]
+"""
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import json
+import pickle
+import sys
+import tempfile
+
+from pydantic import BaseModel
+
+from async_db import fetch_asset_bundle_rows
+from db import BUNDLE_COLUMNS, insert_asset_bundle_rows, iter_asset_bundle_rows
+from models import AssetBundle
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+IMPORT_CHUNK_SIZE = 500
+# Bytes do corpo do import acumulados antes de cada escrita no arquivo temporário.
+IMPORT_SPOOL_BYTES = 1 << 20
+
+
+def _ndjson_line(row: Dict[str, Any]) -> str:
+    metadata = json.dumps(
+        {
+            column: row[column]
+            for column in ("id", "parent_id", *BUNDLE_COLUMNS)
+            if column != "bundle_data"
+        },
+        ensure_ascii=False,
+    )
+    # bundle_data já é JSON: é copiado sem ser decodificado de novo.
+    return f'{metadata[:-1]}, "bundle": {row["bundle_data"]}}}\n'
+
+
+def export_bundles_ndjson(batch_size: int = 500) -> Iterator[str]:
+    """Yields one NDJSON line per stored bundle, in id order."""
+    for row in iter_asset_bundle_rows(batch_size):
+        yield _ndjson_line(row)
+
+
+async def aexport_bundles_ndjson(batch_size: int = 500) -> AsyncIterator[str]:
+    """`export_bundles_ndjson` for the event loop: each batch is read on the db read pool."""
+    after_id = 0
+    while True:
+        rows = await fetch_asset_bundle_rows(after_id, batch_size)
+        if not rows:
+            break
+        yield "".join(_ndjson_line(row) for row in rows)
+        after_id = rows[-1]["id"]
+
+
+class BundleLine(BaseModel):
+    id: Optional[int] = None
+    parent_id: Optional[int] = None
+    llm_model: Optional[str] = None
+    generation_time: Optional[float] = None
+    create_at: Optional[str] = None
+    bundle: AssetBundle
+
+
+def _parse_chunk(
+    numbered_lines: List[Tuple[int, str]], skip_invalid: bool
+) -> Tuple[List[Tuple], int]:
+    """Validates a chunk of lines. Returns (rows to insert, skipped lines)."""
+    rows: List[Tuple] = []
+    skipped = 0
+
+    for line_number, line in numbered_lines:
+        try:
+            # Decodificação e validação numa única passada (pydantic-core).
+            entry = BundleLine.model_validate_json(line)
+        except Exception as e:
+            if not skip_invalid:
+                raise ValueError(f"Invalid bundle on line {line_number}: {e}") from None
+            skipped += 1
+            continue
+
+        bundle = entry.bundle
+        rows.append(
+            (
+                entry.id,
+                entry.parent_id,
+                bundle.name,
+                bundle.description,
+                entry.llm_model,
+                entry.generation_time
+                if entry.generation_time is not None
+                else bundle.generation_time_seconds,
+                entry.create_at or datetime.now().isoformat(),
+                bundle.model_dump_json(),
+            )
+        )
+
+    return rows, skipped
+
+
+def _numbered_chunks(lines: Iterable[str], chunk_size: int) -> Iterator[List[Tuple[int, str]]]:
+    chunk: List[Tuple[int, str]] = []
+
+    for line_number, line in enumerate(lines, start=1):
+        if line.strip():
+            chunk.append((line_number, line))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+class ValidatedBundles:
+    """Rows validated by `validate_bundles_ndjson`, spooled to a temporary file."""
+
+    def __init__(self) -> None:
+        self._file = tempfile.TemporaryFile()
+        self.skipped = 0
+
+    def add(self, rows: List[Tuple], skipped: int) -> None:
+        pickle.dump(rows, self._file)
+        self.skipped += skipped
+
+    def chunks(self) -> Iterator[List[Tuple]]:
+        self._file.seek(0)
+        while True:
+            try:
+                yield pickle.load(self._file)
+            except EOFError:
+                return
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "ValidatedBundles":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def validate_bundles_ndjson(
+    lines: Iterable[str],
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    skip_invalid: bool = False,
+    workers: int = 1,
+) -> ValidatedBundles:
+    """
+    Validates every bundle in `lines`. An invalid line raises ValueError (with
+    its line number) unless `skip_invalid` is set, in which case it is counted
+    and ignored. With `workers` > 1 chunks are validated in a process pool,
+    keeping at most two chunks per worker in flight so memory stays bounded.
+    """
+    validated = ValidatedBundles()
+
+    try:
+        if workers <= 1:
+            for chunk in _numbered_chunks(lines, chunk_size):
+                validated.add(*_parse_chunk(chunk, skip_invalid))
+            return validated
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending: Deque[Future] = deque()
+            for chunk in _numbered_chunks(lines, chunk_size):
+                pending.append(executor.submit(_parse_chunk, chunk, skip_invalid))
+                if len(pending) >= 2 * workers:
+                    validated.add(*pending.popleft().result())
+            while pending:
+                validated.add(*pending.popleft().result())
+        return validated
+    except BaseException:
+        validated.close()
+        raise
+
+
+def import_bundles_ndjson(
+    lines: Iterable[str],
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    skip_invalid: bool = False,
+    workers: int = 1,
+) -> Dict[str, int]:
+    """
+    Validates (see validate_bundles_ndjson) and then inserts every bundle in
+    `lines`, all or nothing: an invalid line aborts before anything is written.
+    """
+    with validate_bundles_ndjson(lines, chunk_size, skip_invalid, workers) as validated:
+        imported = insert_asset_bundle_rows(validated.chunks())
+
+    return {"imported": imported, "skipped": validated.skipped}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import the bundle library as NDJSON.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("-o", "--output", help="Output file (default: stdout).")
+
+    import_parser = subparsers.add_parser("import")
+    import_parser.add_argument("input")
+    import_parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    import_parser.add_argument("--skip-invalid", action="store_true")
+    import_parser.add_argument("--workers", type=int, default=1)
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            output.writelines(export_bundles_ndjson())
+        finally:
+            if output is not sys.stdout:
+                output.close()
+    else:
+        with open(args.input, "r", encoding="utf-8") as file:
+            print(
+                import_bundles_ndjson(file, args.chunk_size, args.skip_invalid, args.workers)
+            )
@@ -3,9 +3,91 @@ from llm_models import Providers, GroqModels, GoogleModels
 number_of_enemies_per_bundle = 2
 number_of_weapons_per_bundle = 2
 number_of_levels_per_bundle = 2
+
+# Larger sections (per request counts on POST /asset-bundle/) are generated in
+# chunks of this size, asked in parallel, then merged without repeated names.
+section_chunk_size = 5
+section_chunk_concurrency = 8
+section_top_up_attempts = 2
+max_items_per_section = 100
+
+# Stream the list sections and start the texture retrieval of each item as
+# soon as its JSON object is complete, while the rest is still generated.
+# The streamed descriptions are buffered by store and retrieved together (one
+# embedding call and one Chroma query) when the buffer is full or when no later
+# section uses that store.
+stream_structured_output = True
+texture_prefetch_batch_size = 8
+
+# Threads de leitura do async_db (as escritas usam uma thread só).
+db_read_threads = 4
+
 provider_key = Providers.GROQ
 model_key = GroqModels.OPENAI_GPT_OSS_120B
 
+# Texture retrieval: "vector" (embeddings + Chroma), "lexical" (local BM25) or
+# "hybrid" (BM25 first, embeddings only when the lexical confidence is low).
+# Both lexical modes fall back to embeddings when BM25 finds nothing. They
+# change the sprites chosen: on the 2012 tiles of the stored bundles no
+# threshold is safe. The lexical top-1 agreed with the vector top-1 for 18% of
+# the lookups served at 0.3 and for 33% at 0.6, which serves only 2% of them.
+# Check the sweep of `python lexical_retriever.py` before switching.
+texture_retriever = "vector"
+lexical_confidence_threshold = 0.3
+
+# Batch texture assignment: candidates retrieved per tile and whether tiles of
+# the same store in a bundle must get different sprites when possible.
+texture_candidates_per_tile = 8
+unique_textures_per_bundle = True
+
+# Cache of description -> texture assignments (persisted in database.db).
+texture_cache_enabled = True
+texture_cache_memory_entries = 10_000
+
+# Memory-mapped tile data shared by all workers (tile_artifact.py); rebuilt on
+# first use when the CSVs, the tileset or the vector stores changed.
+tile_artifact_enabled = True
+tile_artifact_auto_build = True
+
+# Tilesets (tilesets.py): besides the default one, every tilesets/<id>/ folder
+# is an art style selectable per request. Their stores, catalogues and indexes
+# are loaded on first use; the least recently used tilesets are dropped once
+# the estimated size of the loaded ones exceeds this budget.
+tileset_memory_budget_mb = 256
+
+# POST /asset-bundle/ cancels the generation (and its in-flight LLM request)
+# when the client disconnects or after this many seconds.
+generation_deadline_seconds = 300
+
+# Concurrent requests with the same (normalized) map description share one
+# generation; Idempotency-Key results are kept for this many hours.
+coalesce_identical_generations = True
+idempotency_key_ttl_hours = 24
+
+# Pre-generation (pregeneration.py), opt-in: while the server is idle, keep this
+# many fresh bundles per registered theme (config.prompts plus the curated
+# themes below) for POST /asset-bundle/ to serve at once. Bundles older than
+# the max age are discarded; at most pregeneration_max_per_hour generations in
+# total across all processes sharing database.db, so the provider quota is
+# left for on-demand requests.
+pregeneration_enabled = False
+pregeneration_themes: list = []
+pregeneration_pool_size = 2
+pregeneration_max_age_hours = 24
+pregeneration_max_per_hour = 6
+pregeneration_idle_seconds = 30
+
+# Durable generation queue: with generation_queue_enabled, POST /asset-bundle/
+# enqueues a job in database.db and waits for it, and the generation runs in
+# `python worker.py` processes. Workers hold a lease on the job (renewed every
+# lease / 3 seconds), checkpoint every stage, and retry failed jobs with
+# exponential backoff; a job whose worker died resumes from its checkpoint.
+generation_queue_enabled = False
+generation_job_lease_seconds = 60
+generation_job_max_attempts = 3
+generation_job_retry_backoff_seconds = 10
+generation_queue_poll_seconds = 1.0
+
 ################################################################################
 # Maps Description for teste
 ################################################################################
@@ -1,12 +1,17 @@
 import sqlite3
-from datetime import datetime
-from typing import List, Optional, Any, Dict
+import json
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Any, Dict, Tuple
 from pathlib import Path
 from models import AssetBundle
 from os.path import join
 from utils import MAIN_PATH
+import os
+import re
+from metrics import timed_db_operation
 
-DB_PATH = join(MAIN_PATH, "database.db")
+# ASSETS_DB_PATH permite apontar para outro arquivo (ex: benchmarks).
+DB_PATH = os.environ.get("ASSETS_DB_PATH", join(MAIN_PATH, "database.db"))
 
 
 def get_db_connection() -> sqlite3.Connection:
@@ -15,11 +20,102 @@ def get_db_connection() -> sqlite3.Connection:
     return conn
 
 
+FTS_COLUMNS = (
+    "name",
+    "description",
+    "raw_description",
+    "level_names",
+    "enemy_names",
+    "weapon_names",
+)
+
+
+def _fts_values(row: str) -> List[str]:
+    """Expressões SQL que extraem as colunas do FTS de uma linha de assets_bundles."""
+
+    def names(path: str, field: str) -> str:
+        return (
+            f"(SELECT group_concat(replace(json_extract(value, '$.{field}'), '_', ' '), ' ') "
+            f"FROM json_each({row}.bundle_data, '$.{path}'))"
+        )
+
+    return [
+        f"{row}.name",
+        f"{row}.description",
+        f"json_extract({row}.bundle_data, '$.raw_description')",
+        names("dungeon_levels.items", "name"),
+        names("enemies.items", "tile.name"),
+        names("weapons.items", "tile.name"),
+    ]
+
+
+# Métricas de cada bundle em tabelas normalizadas (consultas de capacidade em SQL).
+ANALYTICS_COLUMNS = (
+    "llm_model",
+    "create_at",
+    "day",
+    "generation_time",
+    "input_tokens",
+    "output_tokens",
+    "total_tokens",
+    "llm_calls",
+    "attempts",
+    "validation_failures",
+    "errors",
+)
+STAGE_COLUMNS = (
+    "llm_model",
+    "create_at",
+    "stage",
+    "seconds",
+    "llm_calls",
+    "attempts",
+    "validation_failures",
+    "errors",
+    "input_tokens",
+    "output_tokens",
+    "total_tokens",
+)
+
+
+def _analytics_values(row: str) -> List[str]:
+    """Expressões SQL das colunas de bundle_analytics, extraídas do bundle_data."""
+
+    def total(path: str, field: str) -> str:
+        return (
+            f"(SELECT coalesce(sum(json_extract(value, '$.{field}')), 0) "
+            f"FROM json_each({row}.bundle_data, '$.{path}'))"
+        )
+
+    return [
+        f"{row}.llm_model",
+        f"{row}.create_at",
+        f"substr({row}.create_at, 1, 10)",
+        f"{row}.generation_time",
+        total("usage_metadata", "input_tokens"),
+        total("usage_metadata", "output_tokens"),
+        total("usage_metadata", "total_tokens"),
+        total("stage_metrics", "llm_calls"),
+        total("stage_metrics", "attempts"),
+        total("stage_metrics", "validation_failures"),
+        total("stage_metrics", "errors"),
+    ]
+
+
+def _stage_values(row: str) -> List[str]:
+    """Expressões SQL das colunas de bundle_stage_metrics (uma linha por etapa do json_each)."""
+    fields = [f"coalesce(json_extract(value, '$.{column}'), 0)" for column in STAGE_COLUMNS[3:]]
+    return [f"{row}.llm_model", f"{row}.create_at", "key", *fields]
+
+
 def init_db():
     """Inicializa o banco de dados criando a tabela se não existir."""
     conn = get_db_connection()
     cursor = conn.cursor()
 
+    # WAL: leituras não esperam uma escrita em andamento (a configuração fica no arquivo).
+    cursor.execute("PRAGMA journal_mode=WAL")
+
     # Adicionada a coluna generation_time (REAL para aceitar decimais)
     cursor.execute(
         """
@@ -34,10 +130,272 @@ def init_db():
         )
     """
     )
+
+    # Versões: um bundle regenerado em parte aponta para o bundle de origem.
+    columns = [row["name"] for row in cursor.execute("PRAGMA table_info(assets_bundles)")]
+    if "parent_id" not in columns:
+        cursor.execute("ALTER TABLE assets_bundles ADD COLUMN parent_id INTEGER")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS assets_bundles_parent_id ON assets_bundles (parent_id)"
+    )
+
+    # Cache descrição normalizada + store -> textura escolhida
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS texture_cache (
+            description_key TEXT NOT NULL,
+            store_type TEXT NOT NULL,
+            store_fingerprint TEXT NOT NULL,
+            x INTEGER NOT NULL,
+            y INTEGER NOT NULL,
+            tileset_description TEXT NOT NULL,
+            create_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (description_key, store_type)
+        )
+    """
+    )
+
+    # Embedding da descrição expandida de cada bundle (bundles similares)
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bundle_embeddings (
+            bundle_id INTEGER PRIMARY KEY,
+            embedding_model TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            create_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS bundle_embeddings_delete
+        AFTER DELETE ON assets_bundles BEGIN
+            DELETE FROM bundle_embeddings WHERE bundle_id = old.id;
+        END
+    """
+    )
+
+    # Idempotency-Key de POST /asset-bundle/: status 'in_progress' ou 'completed'
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            request_hash TEXT NOT NULL,
+            status TEXT NOT NULL,
+            bundle_id INTEGER,
+            create_at TIMESTAMP NOT NULL,
+            update_at TIMESTAMP NOT NULL
+        )
+    """
+    )
+
+    # Tokens, chamadas e tempos de cada bundle (e de cada etapa), preenchidos
+    # por triggers a partir do bundle_data no momento da inserção.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bundle_analytics (
+            bundle_id INTEGER PRIMARY KEY,
+            llm_model TEXT,
+            create_at TIMESTAMP,
+            day TEXT,
+            generation_time REAL,
+            input_tokens INTEGER NOT NULL,
+            output_tokens INTEGER NOT NULL,
+            total_tokens INTEGER NOT NULL,
+            llm_calls INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            validation_failures INTEGER NOT NULL,
+            errors INTEGER NOT NULL
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bundle_stage_metrics (
+            bundle_id INTEGER NOT NULL,
+            llm_model TEXT,
+            create_at TIMESTAMP,
+            stage TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            llm_calls INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            validation_failures INTEGER NOT NULL,
+            errors INTEGER NOT NULL,
+            input_tokens INTEGER NOT NULL,
+            output_tokens INTEGER NOT NULL,
+            total_tokens INTEGER NOT NULL,
+            PRIMARY KEY (bundle_id, stage)
+        )
+    """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS bundle_analytics_model_day ON bundle_analytics (llm_model, day)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS bundle_analytics_day ON bundle_analytics (day)")
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS bundle_stage_metrics_model_stage
+        ON bundle_stage_metrics (llm_model, stage, create_at)
+    """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS bundle_analytics_insert
+        AFTER INSERT ON assets_bundles BEGIN
+            INSERT OR REPLACE INTO bundle_analytics (bundle_id, {", ".join(ANALYTICS_COLUMNS)})
+            VALUES (new.id, {", ".join(_analytics_values("new"))});
+            INSERT OR REPLACE INTO bundle_stage_metrics (bundle_id, {", ".join(STAGE_COLUMNS)})
+            SELECT new.id, {", ".join(_stage_values("new"))}
+            FROM json_each(new.bundle_data, '$.stage_metrics');
+        END
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS bundle_analytics_delete
+        AFTER DELETE ON assets_bundles BEGIN
+            DELETE FROM bundle_analytics WHERE bundle_id = old.id;
+            DELETE FROM bundle_stage_metrics WHERE bundle_id = old.id;
+        END
+    """
+    )
+    backfill_bundle_analytics(cursor)
+
+    # Bundles pré-gerados (pregeneration.py), ainda não entregues a ninguém
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bundle_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_hash TEXT NOT NULL,
+            llm_model TEXT,
+            create_at TIMESTAMP NOT NULL,
+            bundle_data TEXT NOT NULL
+        )
+    """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS bundle_pool_hash ON bundle_pool (request_hash, create_at)"
+    )
+
+    # Pré-gerações iniciadas por qualquer processo: limite por hora compartilhado
+    # e reserva do tema (finished_at NULL enquanto a geração roda).
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pregeneration_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_hash TEXT NOT NULL,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP
+        )
+    """
+    )
+
+    # Fila de gerações (worker.py). status: queued, running, completed, failed
+    # ou cancelled. Um job 'running' com lease vencida volta a ser pego por
+    # outro worker, que continua do checkpoint (JSON das etapas já geradas).
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at TIMESTAMP NOT NULL,
+            lease_owner TEXT,
+            lease_expires_at TIMESTAMP,
+            checkpoint TEXT,
+            bundle_id INTEGER,
+            error TEXT,
+            create_at TIMESTAMP NOT NULL,
+            update_at TIMESTAMP NOT NULL
+        )
+    """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS generation_jobs_status ON generation_jobs (status, available_at)"
+    )
+
+    # Busca textual: índice FTS5 mantido por triggers, com os nomes de níveis,
+    # inimigos e armas extraídos do bundle_data no momento da inserção.
+    cursor.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS assets_bundles_fts USING fts5(
+            name,
+            description,
+            raw_description,
+            level_names,
+            enemy_names,
+            weapon_names,
+            tokenize = 'porter unicode61'
+        )
+    """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS assets_bundles_fts_insert
+        AFTER INSERT ON assets_bundles BEGIN
+            INSERT INTO assets_bundles_fts (rowid, {", ".join(FTS_COLUMNS)})
+            VALUES (new.id, {", ".join(_fts_values("new"))});
+        END
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS assets_bundles_fts_delete
+        AFTER DELETE ON assets_bundles BEGIN
+            DELETE FROM assets_bundles_fts WHERE rowid = old.id;
+        END
+    """
+    )
+    # Bancos anteriores ao índice: indexa os bundles que ainda não estão nele.
+    cursor.execute(
+        f"""
+        INSERT INTO assets_bundles_fts (rowid, {", ".join(FTS_COLUMNS)})
+        SELECT b.id, {", ".join(_fts_values("b"))} FROM assets_bundles b
+        WHERE b.id NOT IN (SELECT rowid FROM assets_bundles_fts)
+    """
+    )
+
     conn.commit()
     conn.close()
 
 
+def backfill_bundle_analytics(cursor: Optional[sqlite3.Cursor] = None) -> int:
+    """
+    Preenche as tabelas de métricas para os bundles que ainda não estão nelas
+    (bancos anteriores às tabelas). Retorna quantos bundles foram incluídos.
+    """
+    conn = None
+    if cursor is None:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+    missing = "SELECT id FROM assets_bundles WHERE id NOT IN (SELECT bundle_id FROM bundle_analytics)"
+    cursor.execute(
+        f"""
+        INSERT OR REPLACE INTO bundle_stage_metrics (bundle_id, {", ".join(STAGE_COLUMNS)})
+        SELECT b.id, {", ".join(_stage_values("b"))}
+        FROM assets_bundles b, json_each(b.bundle_data, '$.stage_metrics')
+        WHERE b.id IN ({missing})
+    """
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO bundle_analytics (bundle_id, {", ".join(ANALYTICS_COLUMNS)})
+        SELECT b.id, {", ".join(_analytics_values("b"))} FROM assets_bundles b
+        WHERE b.id IN ({missing})
+    """
+    )
+    inserted = cursor.rowcount
+
+    if conn is not None:
+        conn.commit()
+        conn.close()
+    return inserted
+
+
 # Inicializa o DB
 init_db()
 
@@ -45,12 +403,15 @@ init_db()
 # migrate_add_generation_time_column()
 
 
+@timed_db_operation("insert_asset_bundle")
 def insert_asset_bundle(
     asset_bundle: AssetBundle,
     llm_model: str,
+    parent_id: Optional[int] = None,
 ) -> int:
     """
-    Insere um novo asset bundle.
+    Insere um novo asset bundle. `parent_id` é o bundle de origem de uma nova
+    versão (regeneração de uma seção).
     """
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -61,8 +422,8 @@ def insert_asset_bundle(
     # Atualizado o SQL para incluir generation_time
     cursor.execute(
         """
-        INSERT INTO assets_bundles (name, description, llm_model, generation_time, create_at, bundle_data)
-        VALUES (?, ?, ?, ?, ?, ?)
+        INSERT INTO assets_bundles (name, description, llm_model, generation_time, create_at, bundle_data, parent_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
         """,
         (
             asset_bundle.name,
@@ -71,6 +432,7 @@ def insert_asset_bundle(
             asset_bundle.generation_time_seconds,
             created_at,
             json_data,
+            parent_id,
         ),
     )
 
@@ -81,6 +443,163 @@ def insert_asset_bundle(
     return new_id if new_id is not None else -1
 
 
+@timed_db_operation("insert_pooled_bundle")
+def insert_pooled_bundle(
+    request_hash: str,
+    asset_bundle: AssetBundle,
+    llm_model: str,
+    run_id: Optional[int] = None,
+) -> None:
+    """
+    Guarda um bundle pré-gerado para o pedido `request_hash` e encerra a
+    pré-geração `run_id` (ver claim_pregeneration) na mesma transação.
+    """
+    conn = get_db_connection()
+    now = datetime.now().isoformat()
+
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO bundle_pool (request_hash, llm_model, create_at, bundle_data)
+            VALUES (?, ?, ?, ?)
+            """,
+            (request_hash, llm_model, now, asset_bundle.model_dump_json()),
+        )
+        if run_id is not None:
+            conn.execute(
+                "UPDATE pregeneration_runs SET finished_at = ? WHERE id = ?", (now, run_id)
+            )
+
+    conn.close()
+
+
+@timed_db_operation("claim_pregeneration")
+def claim_pregeneration(
+    request_hashes: List[str],
+    pool_size: int,
+    max_per_hour: int,
+    fresh_after: str,
+    running_after: str,
+) -> Optional[Tuple[int, str]]:
+    """
+    Reserva a próxima pré-geração, valendo para todos os processos: o pedido
+    (de `request_hashes`) com menos bundles no pool, contando os que estão
+    sendo gerados (iniciados depois de `running_after` e não encerrados), se
+    algum tiver menos de `pool_size` e se menos de `max_per_hour` pré-gerações
+    começaram na última hora. Retorna (id da pré-geração, request_hash) ou None.
+    """
+    conn = get_db_connection()
+    now = datetime.now()
+    result = None
+
+    try:
+        with conn:
+            # IMMEDIATE: dois processos não reservam a mesma vaga.
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM bundle_pool WHERE create_at < ?", (fresh_after,))
+            conn.execute(
+                "DELETE FROM pregeneration_runs WHERE started_at < ?",
+                ((now - timedelta(hours=1)).isoformat(),),
+            )
+
+            (started,) = conn.execute("SELECT COUNT(*) FROM pregeneration_runs").fetchone()
+            if started >= max_per_hour:
+                return None
+
+            counts: Dict[str, int] = {}
+            for row in conn.execute(
+                """
+                SELECT request_hash FROM bundle_pool
+                UNION ALL
+                SELECT request_hash FROM pregeneration_runs
+                WHERE finished_at IS NULL AND started_at >= ?
+                """,
+                (running_after,),
+            ):
+                counts[row["request_hash"]] = counts.get(row["request_hash"], 0) + 1
+
+            missing = [
+                (counts.get(request_hash, 0), index, request_hash)
+                for index, request_hash in enumerate(request_hashes)
+                if counts.get(request_hash, 0) < pool_size
+            ]
+            if not missing:
+                return None
+
+            request_hash = min(missing)[2]
+            cursor = conn.execute(
+                "INSERT INTO pregeneration_runs (request_hash, started_at) VALUES (?, ?)",
+                (request_hash, now.isoformat()),
+            )
+            result = (cursor.lastrowid or -1, request_hash)
+    finally:
+        conn.close()
+
+    return result
+
+
+@timed_db_operation("finish_pregeneration")
+def finish_pregeneration(run_id: int) -> None:
+    """Encerra uma pré-geração que falhou (ela continua contando no limite por hora)."""
+    conn = get_db_connection()
+
+    with conn:
+        conn.execute(
+            "UPDATE pregeneration_runs SET finished_at = ? WHERE id = ?",
+            (datetime.now().isoformat(), run_id),
+        )
+
+    conn.close()
+
+
+@timed_db_operation("take_pooled_bundle")
+def take_pooled_bundle(
+    request_hash: str, fresh_after: str
+) -> Optional[Tuple[int, AssetBundle]]:
+    """
+    Retira do pool o bundle mais antigo (criado depois de `fresh_after`) do
+    pedido e o salva em assets_bundles, na mesma transação: cada bundle do
+    pool é entregue uma vez só, mesmo com vários processos. Retorna (id, bundle).
+    """
+    conn = get_db_connection()
+
+    with conn:
+        row = conn.execute(
+            """
+            DELETE FROM bundle_pool WHERE id = (
+                SELECT id FROM bundle_pool
+                WHERE request_hash = ? AND create_at >= ?
+                ORDER BY create_at LIMIT 1
+            )
+            RETURNING llm_model, bundle_data
+            """,
+            (request_hash, fresh_after),
+        ).fetchone()
+
+        result = None
+        if row is not None:
+            asset_bundle = AssetBundle.model_validate_json(row["bundle_data"])
+            cursor = conn.execute(
+                """
+                INSERT INTO assets_bundles (name, description, llm_model, generation_time, create_at, bundle_data)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    asset_bundle.name,
+                    asset_bundle.description,
+                    row["llm_model"],
+                    asset_bundle.generation_time_seconds,
+                    datetime.now().isoformat(),
+                    row["bundle_data"],
+                ),
+            )
+            result = (cursor.lastrowid or -1, asset_bundle)
+
+    conn.close()
+    return result
+
+
+@timed_db_operation("find_all_assets_bundles")
 def find_all_assets_bundles() -> List[Dict[str, Any]]:
     """
     Retorna todos os asset bundles.
@@ -90,7 +609,7 @@ def find_all_assets_bundles() -> List[Dict[str, Any]]:
 
     # Adicionado generation_time no SELECT
     cursor.execute(
-        "SELECT id, name, llm_model, generation_time, create_at FROM assets_bundles ORDER BY create_at DESC"
+        "SELECT id, name, llm_model, generation_time, create_at, parent_id FROM assets_bundles ORDER BY create_at DESC"
     )
     rows = cursor.fetchall()
 
@@ -100,6 +619,7 @@ def find_all_assets_bundles() -> List[Dict[str, Any]]:
     return result
 
 
+@timed_db_operation("find_bundle_data_by_id")
 def find_bundle_data_by_id(id: int) -> Optional[AssetBundle]:
     """Retorna o bundle_data de um asset bundle."""
     conn = get_db_connection()
@@ -122,6 +642,7 @@ def find_bundle_data_by_id(id: int) -> Optional[AssetBundle]:
         return None
 
 
+@timed_db_operation("delete_asset_bundle_by_id")
 def delete_asset_bundle_by_id(id: int) -> bool:
     """Deleta um asset bundle pelo id."""
     conn = get_db_connection()
@@ -134,3 +655,722 @@ def delete_asset_bundle_by_id(id: int) -> bool:
     conn.close()
 
     return rows_deleted > 0
+
+
+BUNDLE_COLUMNS = ("name", "description", "llm_model", "generation_time", "create_at", "bundle_data")
+
+
+def fetch_asset_bundle_rows(after_id: int, limit: int) -> List[Dict[str, Any]]:
+    """
+    Até `limit` asset bundles (com bundle_data) com id maior que `after_id`,
+    em ordem de id. Cada lote abre e fecha a própria conexão, então os lotes
+    de uma mesma exportação podem ser lidos de threads diferentes.
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT id, parent_id, {', '.join(BUNDLE_COLUMNS)} FROM assets_bundles
+            WHERE id > ? ORDER BY id LIMIT ?
+            """,
+            (after_id, limit),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def iter_asset_bundle_rows(batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """
+    Percorre todos os asset bundles (com bundle_data) em ordem de id, lendo
+    `batch_size` linhas por vez, sem carregar a tabela na memória.
+    """
+    after_id = 0
+    while True:
+        rows = fetch_asset_bundle_rows(after_id, batch_size)
+        if not rows:
+            break
+        yield from rows
+        after_id = rows[-1]["id"]
+
+
+@timed_db_operation("insert_asset_bundle_rows")
+def insert_asset_bundle_rows(chunks: Iterable[List[Tuple]]) -> int:
+    """
+    Insere lotes de linhas (id de origem, parent_id de origem e as colunas de
+    BUNDLE_COLUMNS) com executemany, tudo numa única transação: se um lote
+    falhar, nada é inserido. Os ids são novos; o parent_id é traduzido para o
+    novo id do pai quando ele também foi importado, senão fica NULL.
+    """
+    conn = get_db_connection()
+    inserted = 0
+    new_ids: Dict[int, int] = {}
+    # (novo id, parent_id de origem), resolvidos depois que todos os lotes entraram.
+    parents: List[Tuple[int, int]] = []
+
+    try:
+        with conn:
+            # IMMEDIATE: nenhum outro escritor entre o MAX(id) e o INSERT.
+            conn.execute("BEGIN IMMEDIATE")
+            for chunk in chunks:
+                (last_id,) = conn.execute(
+                    "SELECT COALESCE(MAX(id), 0) FROM assets_bundles"
+                ).fetchone()
+                conn.executemany(
+                    f"""
+                    INSERT INTO assets_bundles ({', '.join(BUNDLE_COLUMNS)})
+                    VALUES ({', '.join('?' for _ in BUNDLE_COLUMNS)})
+                    """,
+                    [row[2:] for row in chunk],
+                )
+                # AUTOINCREMENT: os ids novos são os maiores, na ordem de inserção.
+                inserted_ids = conn.execute(
+                    "SELECT id FROM assets_bundles WHERE id > ? ORDER BY id", (last_id,)
+                ).fetchall()
+                for row, (new_id,) in zip(chunk, inserted_ids):
+                    if row[0] is not None:
+                        new_ids[row[0]] = new_id
+                    if row[1] is not None:
+                        parents.append((new_id, row[1]))
+                inserted += len(chunk)
+
+            conn.executemany(
+                "UPDATE assets_bundles SET parent_id = ? WHERE id = ?",
+                [
+                    (new_ids[parent_id], new_id)
+                    for new_id, parent_id in parents
+                    if parent_id in new_ids
+                ],
+            )
+    finally:
+        conn.close()
+
+    return inserted
+
+
+def _fts_query(text: str) -> str:
+    """
+    Converte o texto do usuário numa consulta FTS5 segura: cada termo entre
+    aspas (todos obrigatórios) e o último como prefixo ("lav" acha "lava").
+    """
+    terms = re.findall(r"\w+", text.lower())
+    if not terms:
+        return ""
+
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+@timed_db_operation("search_asset_bundles")
+def search_asset_bundles(query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """
+    Busca bundles por conteúdo, ordenados por relevância (BM25, com mais peso
+    para o nome), com um trecho destacado do texto encontrado.
+    """
+    match = _fts_query(query)
+    if not match:
+        return {"total": 0, "items": []}
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        "SELECT COUNT(*) FROM assets_bundles_fts WHERE assets_bundles_fts MATCH ?",
+        (match,),
+    )
+    total = cursor.fetchone()[0]
+
+    cursor.execute(
+        """
+        SELECT
+            b.id, b.name, b.llm_model, b.generation_time, b.create_at,
+            bm25(assets_bundles_fts, 10.0, 2.0, 2.0, 4.0, 4.0, 4.0) AS rank,
+            snippet(assets_bundles_fts, -1, '[', ']', '...', 16) AS snippet
+        FROM assets_bundles_fts
+        JOIN assets_bundles b ON b.id = assets_bundles_fts.rowid
+        WHERE assets_bundles_fts MATCH ?
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+        """,
+        (match, limit, offset),
+    )
+    items = [dict(row) for row in cursor.fetchall()]
+
+    conn.close()
+    return {"total": total, "items": items}
+
+
+@timed_db_operation("find_texture_cache_entry")
+def find_texture_cache_entry(
+    description_key: str, store_type: str, store_fingerprint: str
+) -> Optional[Dict[str, Any]]:
+    """Retorna a textura em cache, se ela foi calculada com o store atual."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        SELECT x, y, tileset_description FROM texture_cache
+        WHERE description_key = ? AND store_type = ? AND store_fingerprint = ?
+        """,
+        (description_key, store_type, store_fingerprint),
+    )
+    row = cursor.fetchone()
+
+    conn.close()
+    return dict(row) if row is not None else None
+
+
+@timed_db_operation("upsert_texture_cache_entry")
+def upsert_texture_cache_entry(
+    description_key: str,
+    store_type: str,
+    store_fingerprint: str,
+    x: int,
+    y: int,
+    tileset_description: str,
+) -> None:
+    """Insere ou substitui a textura em cache de uma descrição."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO texture_cache
+            (description_key, store_type, store_fingerprint, x, y, tileset_description, create_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            description_key,
+            store_type,
+            store_fingerprint,
+            x,
+            y,
+            tileset_description,
+            datetime.now().isoformat(),
+        ),
+    )
+
+    conn.commit()
+    conn.close()
+
+
+@timed_db_operation("delete_stale_texture_cache_entries")
+def delete_stale_texture_cache_entries(store_type: str, store_fingerprint: str) -> int:
+    """Remove as entradas calculadas com uma versão anterior do store."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        "DELETE FROM texture_cache WHERE store_type = ? AND store_fingerprint != ?",
+        (store_type, store_fingerprint),
+    )
+    conn.commit()
+
+    rows_deleted = cursor.rowcount
+    conn.close()
+
+    return rows_deleted
+
+
+def count_texture_cache_entries() -> Dict[str, int]:
+    """Quantidade de entradas em cache por store."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        "SELECT store_type, COUNT(*) AS entries FROM texture_cache GROUP BY store_type"
+    )
+    result = {row["store_type"]: row["entries"] for row in cursor.fetchall()}
+
+    conn.close()
+    return result
+
+
+@timed_db_operation("find_bundle_embeddings")
+def find_bundle_embeddings(embedding_model: str) -> List[Dict[str, Any]]:
+    """Embeddings (bytes float32) calculados com o modelo atual."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        SELECT bundle_id, content_hash, embedding FROM bundle_embeddings
+        WHERE embedding_model = ?
+        """,
+        (embedding_model,),
+    )
+    result = [dict(row) for row in cursor.fetchall()]
+
+    conn.close()
+    return result
+
+
+@timed_db_operation("find_bundles_without_embedding")
+def find_bundles_without_embedding(embedding_model: str) -> List[Dict[str, Any]]:
+    """Id e descrição dos bundles ainda sem embedding do modelo atual."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        SELECT id, description FROM assets_bundles
+        WHERE id NOT IN (
+            SELECT bundle_id FROM bundle_embeddings WHERE embedding_model = ?
+        )
+        ORDER BY id
+        """,
+        (embedding_model,),
+    )
+    result = [dict(row) for row in cursor.fetchall()]
+
+    conn.close()
+    return result
+
+
+@timed_db_operation("upsert_bundle_embeddings")
+def upsert_bundle_embeddings(rows: List[Tuple[int, str, str, bytes]]) -> None:
+    """Salva (bundle_id, embedding_model, content_hash, embedding) em lote."""
+    conn = get_db_connection()
+
+    with conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO bundle_embeddings
+                (bundle_id, embedding_model, content_hash, embedding, create_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(*row, datetime.now().isoformat()) for row in rows],
+        )
+
+    conn.close()
+
+
+@timed_db_operation("find_assets_bundles_by_ids")
+def find_assets_bundles_by_ids(ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Metadados (sem bundle_data) dos bundles pedidos, por id."""
+    if not ids:
+        return {}
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        f"""
+        SELECT id, name, llm_model, generation_time, create_at, parent_id FROM assets_bundles
+        WHERE id IN ({", ".join("?" for _ in ids)})
+        """,
+        ids,
+    )
+    result = {row["id"]: dict(row) for row in cursor.fetchall()}
+
+    conn.close()
+    return result
+
+
+@timed_db_operation("claim_idempotency_key")
+def claim_idempotency_key(
+    key: str, request_hash: str, expire_before: str
+) -> Optional[Dict[str, Any]]:
+    """
+    Registra a chave como em andamento. Retorna None se ela foi registrada
+    agora, ou a linha existente se a chave já estava em uso. Chaves criadas
+    antes de `expire_before` são descartadas primeiro.
+    """
+    conn = get_db_connection()
+    now = datetime.now().isoformat()
+
+    with conn:
+        conn.execute("DELETE FROM idempotency_keys WHERE create_at < ?", (expire_before,))
+        cursor = conn.execute(
+            """
+            INSERT OR IGNORE INTO idempotency_keys
+                (key, request_hash, status, bundle_id, create_at, update_at)
+            VALUES (?, ?, 'in_progress', NULL, ?, ?)
+            """,
+            (key, request_hash, now, now),
+        )
+        existing = None
+        if cursor.rowcount == 0:
+            row = conn.execute(
+                "SELECT * FROM idempotency_keys WHERE key = ?", (key,)
+            ).fetchone()
+            existing = dict(row) if row is not None else None
+
+    conn.close()
+    return existing
+
+
+@timed_db_operation("take_over_idempotency_key")
+def take_over_idempotency_key(key: str, update_at: str) -> bool:
+    """
+    Assume uma chave abandonada ('in_progress' sem atualização desde
+    `update_at`). Só um processo consegue, pois a condição compara o update_at.
+    """
+    conn = get_db_connection()
+
+    with conn:
+        cursor = conn.execute(
+            """
+            UPDATE idempotency_keys SET update_at = ?
+            WHERE key = ? AND status = 'in_progress' AND update_at = ?
+            """,
+            (datetime.now().isoformat(), key, update_at),
+        )
+
+    conn.close()
+    return cursor.rowcount == 1
+
+
+@timed_db_operation("complete_idempotency_keys")
+def complete_idempotency_keys(keys: Iterable[str], bundle_id: int) -> None:
+    """Associa as chaves ao bundle gerado."""
+    conn = get_db_connection()
+    now = datetime.now().isoformat()
+
+    with conn:
+        conn.executemany(
+            """
+            UPDATE idempotency_keys SET status = 'completed', bundle_id = ?, update_at = ?
+            WHERE key = ?
+            """,
+            [(bundle_id, now, key) for key in keys],
+        )
+
+    conn.close()
+
+
+@timed_db_operation("release_idempotency_keys")
+def release_idempotency_keys(keys: Iterable[str]) -> None:
+    """Libera chaves de gerações que falharam, para que um retry gere de novo."""
+    conn = get_db_connection()
+
+    with conn:
+        conn.executemany(
+            "DELETE FROM idempotency_keys WHERE key = ? AND status = 'in_progress'",
+            [(key,) for key in keys],
+        )
+
+    conn.close()
+
+
+PERCENTILES = (50, 90, 99)
+
+
+def _aggregate(
+    table: str,
+    group_by: Tuple[str, ...],
+    value: str,
+    aggregates: List[str],
+    since: Optional[str],
+    until: Optional[str],
+    llm_model: Optional[str],
+) -> List[Dict[str, Any]]:
+    """
+    Agrega `table` por `group_by`, com os percentis de `value` (rank mais
+    próximo, via funções de janela) calculados no próprio SQLite.
+    """
+    filters, params = [], []
+    if since:
+        filters.append("create_at >= ?")
+        params.append(since)
+    if until:
+        filters.append("create_at < ?")
+        params.append(until)
+    if llm_model:
+        filters.append("llm_model = ?")
+        params.append(llm_model)
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    groups = ", ".join(group_by)
+
+    percentiles = [
+        f"MIN(CASE WHEN rank * 100 >= n * {p} THEN {value} END) AS p{p}_{value}"
+        for p in PERCENTILES
+    ]
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        f"""
+        SELECT {groups}, COUNT(*) AS count, {", ".join(aggregates + percentiles)}
+        FROM (
+            SELECT *,
+                ROW_NUMBER() OVER (PARTITION BY {groups} ORDER BY {value}) AS rank,
+                COUNT(*) OVER (PARTITION BY {groups}) AS n
+            FROM {table} {where}
+        )
+        GROUP BY {groups}
+        ORDER BY {groups}
+        """,
+        params,
+    )
+    result = [dict(row) for row in cursor.fetchall()]
+
+    conn.close()
+    return result
+
+
+BUNDLE_AGGREGATES = [
+    "SUM(input_tokens) AS input_tokens",
+    "SUM(output_tokens) AS output_tokens",
+    "SUM(total_tokens) AS total_tokens",
+    "AVG(total_tokens) AS avg_total_tokens",
+    "SUM(llm_calls) AS llm_calls",
+    "SUM(attempts - llm_calls) AS retries",
+    "SUM(validation_failures) AS validation_failures",
+    "SUM(errors) AS errors",
+    "AVG(generation_time) AS avg_generation_time",
+]
+
+
+@timed_db_operation("aggregate_usage_by_model")
+def aggregate_usage_by_model(
+    since: Optional[str] = None, until: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Tokens, retries e percentis do tempo de geração por modelo."""
+    return _aggregate(
+        "bundle_analytics", ("llm_model",), "generation_time", BUNDLE_AGGREGATES, since, until, None
+    )
+
+
+@timed_db_operation("aggregate_usage_by_day")
+def aggregate_usage_by_day(
+    since: Optional[str] = None, until: Optional[str] = None, llm_model: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Os mesmos agregados de aggregate_usage_by_model, por dia e modelo."""
+    return _aggregate(
+        "bundle_analytics",
+        ("day", "llm_model"),
+        "generation_time",
+        BUNDLE_AGGREGATES,
+        since,
+        until,
+        llm_model,
+    )
+
+
+@timed_db_operation("aggregate_stage_metrics")
+def aggregate_stage_metrics(
+    since: Optional[str] = None, until: Optional[str] = None, llm_model: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Tempo (média e percentis), chamadas, retries e tokens por modelo e etapa."""
+    return _aggregate(
+        "bundle_stage_metrics",
+        ("llm_model", "stage"),
+        "seconds",
+        [
+            "AVG(seconds) AS avg_seconds",
+            "SUM(llm_calls) AS llm_calls",
+            "SUM(attempts - llm_calls) AS retries",
+            "SUM(validation_failures) AS validation_failures",
+            "SUM(errors) AS errors",
+            "SUM(total_tokens) AS total_tokens",
+        ],
+        since,
+        until,
+        llm_model,
+    )
+
+
+def _job_row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["checkpoint"] = json.loads(job["checkpoint"]) if job["checkpoint"] else None
+    return job
+
+
+@timed_db_operation("enqueue_generation_job")
+def enqueue_generation_job(kind: str, payload: Dict[str, Any]) -> int:
+    """Adiciona um job à fila e retorna o id."""
+    conn = get_db_connection()
+    now = datetime.now().isoformat()
+
+    with conn:
+        cursor = conn.execute(
+            """
+            INSERT INTO generation_jobs (kind, payload, status, available_at, create_at, update_at)
+            VALUES (?, ?, 'queued', ?, ?, ?)
+            """,
+            (kind, json.dumps(payload), now, now, now),
+        )
+
+    conn.close()
+    return cursor.lastrowid if cursor.lastrowid is not None else -1
+
+
+@timed_db_operation("claim_generation_job")
+def claim_generation_job(owner: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+    """
+    Pega o job mais antigo disponível (na fila ou com a lease vencida) para
+    `owner`, com uma lease de `lease_seconds`. O UPDATE único garante que só
+    um worker pega cada job.
+    """
+    conn = get_db_connection()
+    now = datetime.now()
+
+    with conn:
+        row = conn.execute(
+            """
+            UPDATE generation_jobs
+            SET status = 'running', attempts = attempts + 1, lease_owner = ?,
+                lease_expires_at = ?, update_at = ?
+            WHERE id = (
+                SELECT id FROM generation_jobs
+                WHERE (status = 'queued' AND available_at <= ?)
+                   OR (status = 'running' AND lease_expires_at < ?)
+                ORDER BY id LIMIT 1
+            )
+            RETURNING *
+            """,
+            (
+                owner,
+                (now + timedelta(seconds=lease_seconds)).isoformat(),
+                now.isoformat(),
+                now.isoformat(),
+                now.isoformat(),
+            ),
+        ).fetchone()
+        job = _job_row(row)
+
+    conn.close()
+    return job
+
+
+@timed_db_operation("renew_generation_job")
+def renew_generation_job(
+    id: int, owner: str, lease_seconds: float, checkpoint: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Renova a lease (e salva o checkpoint, se houver). False quando o job não
+    pertence mais a `owner` (lease perdida ou job cancelado): o worker para.
+    """
+    conn = get_db_connection()
+    now = datetime.now()
+    values: List[Any] = [(now + timedelta(seconds=lease_seconds)).isoformat(), now.isoformat()]
+    checkpoint_sql = ""
+    if checkpoint is not None:
+        checkpoint_sql = ", checkpoint = ?"
+        values.append(json.dumps(checkpoint))
+
+    with conn:
+        cursor = conn.execute(
+            f"""
+            UPDATE generation_jobs SET lease_expires_at = ?, update_at = ?{checkpoint_sql}
+            WHERE id = ? AND status = 'running' AND lease_owner = ?
+            """,
+            (*values, id, owner),
+        )
+
+    conn.close()
+    return cursor.rowcount == 1
+
+
+@timed_db_operation("complete_generation_job")
+def complete_generation_job(
+    id: int,
+    owner: str,
+    asset_bundle: AssetBundle,
+    llm_model: str,
+    parent_id: Optional[int] = None,
+) -> Optional[int]:
+    """
+    Salva o bundle e conclui o job na mesma transação, só se `owner` ainda
+    tem o job: um bundle é salvo uma vez só, mesmo que o worker caia no meio.
+    Retorna o id do bundle, ou None se o job foi perdido.
+    """
+    conn = get_db_connection()
+    now = datetime.now().isoformat()
+
+    with conn:
+        owned = conn.execute(
+            "SELECT 1 FROM generation_jobs WHERE id = ? AND status = 'running' AND lease_owner = ?",
+            (id, owner),
+        ).fetchone()
+        bundle_id = None
+        if owned is not None:
+            cursor = conn.execute(
+                """
+                INSERT INTO assets_bundles (name, description, llm_model, generation_time, create_at, bundle_data, parent_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    asset_bundle.name,
+                    asset_bundle.description,
+                    llm_model,
+                    asset_bundle.generation_time_seconds,
+                    now,
+                    asset_bundle.model_dump_json(),
+                    parent_id,
+                ),
+            )
+            bundle_id = cursor.lastrowid
+            conn.execute(
+                """
+                UPDATE generation_jobs
+                SET status = 'completed', bundle_id = ?, lease_owner = NULL, update_at = ?
+                WHERE id = ?
+                """,
+                (bundle_id, now, id),
+            )
+
+    conn.close()
+    return bundle_id
+
+
+@timed_db_operation("fail_generation_job")
+def fail_generation_job(
+    id: int, owner: str, error: str, retry_at: Optional[str] = None
+) -> None:
+    """Devolve o job à fila a partir de `retry_at`, ou o marca como failed."""
+    conn = get_db_connection()
+
+    with conn:
+        conn.execute(
+            """
+            UPDATE generation_jobs
+            SET status = ?, available_at = coalesce(?, available_at), error = ?,
+                lease_owner = NULL, lease_expires_at = NULL, update_at = ?
+            WHERE id = ? AND status = 'running' AND lease_owner = ?
+            """,
+            (
+                "queued" if retry_at else "failed",
+                retry_at,
+                error,
+                datetime.now().isoformat(),
+                id,
+                owner,
+            ),
+        )
+
+    conn.close()
+
+
+@timed_db_operation("cancel_generation_job")
+def cancel_generation_job(id: int) -> None:
+    """Cancela um job pendente; o worker que o executa para na próxima renovação."""
+    conn = get_db_connection()
+
+    with conn:
+        conn.execute(
+            """
+            UPDATE generation_jobs SET status = 'cancelled', lease_owner = NULL, update_at = ?
+            WHERE id = ? AND status IN ('queued', 'running')
+            """,
+            (datetime.now().isoformat(), id),
+        )
+
+    conn.close()
+
+
+@timed_db_operation("find_generation_job")
+def find_generation_job(id: int) -> Optional[Dict[str, Any]]:
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM generation_jobs WHERE id = ?", (id,)).fetchone()
+    job = _job_row(row)
+    conn.close()
+    return job
@@ -0,0 +1,438 @@
+"""
+Deduplication of bundle generations (POST /asset-bundle/).
+
+- Singleflight: concurrent requests with the same normalized map description
+  attach to one generation in progress (a "flight") instead of each running
+  the whole LLM pipeline. The flight counts its waiters: a waiter that
+  disconnects or reaches its deadline detaches, and the generation is only
+  cancelled when the last one leaves.
+- Idempotency-Key: the key is recorded in the `idempotency_keys` table of
+  database.db. A retry with the same key returns the stored bundle, or
+  attaches to the flight when the generation is still running. Keys of failed
+  or cancelled generations are released, so the retry generates again.
+- Section regeneration (POST /asset-bundle/{id}/regenerate/{section}) runs
+  as a flight too, keyed by bundle and section, and stores a new version
+  whose parent_id is the original bundle.
+- Generation queue: with `generation_queue_enabled` the flight enqueues a
+  job (generation_jobs table) and waits for a worker.py process to store the
+  bundle, instead of generating in this process. Cancelling the flight
+  cancels the job.
+- Pre-generated bundles: with a pool installed (`set_bundle_pool`, see
+  pregeneration.py), a request with default section sizes and tileset is
+  first served from the pool, without starting a flight.
+
+Flights live in the event loop of each worker process. A key in progress in
+another worker answers 409 until that worker finishes, or until the key goes
+`generation_deadline_seconds` without updates and is taken over.
+"""
+
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+
+from asset_generator import AssetsGenerator, BundleSection, IncompleteSectionError
+from bundle_index import index_bundle
+from config import (
+    coalesce_identical_generations,
+    generation_deadline_seconds,
+    generation_queue_enabled,
+    generation_queue_poll_seconds,
+    idempotency_key_ttl_hours,
+    model_key,
+)
+from async_db import (
+    cancel_generation_job,
+    claim_idempotency_key,
+    complete_idempotency_keys,
+    enqueue_generation_job,
+    find_bundle_data_by_id,
+    find_generation_job,
+    insert_asset_bundle,
+    release_idempotency_keys,
+    take_over_idempotency_key,
+)
+from metrics import generation_requests_total
+from models import AssetBundle
+from tilesets import DEFAULT_TILESET
+
+logger = logging.getLogger(__name__)
+
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+class GenerationError(Exception):
+    status_code = 500
+
+
+class IdempotencyKeyMismatch(GenerationError):
+    status_code = 422
+
+
+class IdempotencyKeyInProgress(GenerationError):
+    status_code = 409
+
+
+class IdempotentBundleDeleted(GenerationError):
+    status_code = 410
+
+
+class BundleNotFound(GenerationError):
+    status_code = 404
+
+
+class GenerationDeadlineExceeded(GenerationError):
+    status_code = 504
+
+
+class GenerationJobFailed(GenerationError):
+    status_code = 502
+
+
+class IncompleteGeneration(GenerationError):
+    status_code = 502
+
+
+def normalize_description(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def hash_request(
+    map_description: str,
+    section_counts: Optional[Dict[str, int]] = None,
+    tileset: str = DEFAULT_TILESET,
+) -> str:
+    counts = json.dumps(section_counts or {}, sort_keys=True)
+    text = f"{normalize_description(map_description)}\n{counts}"
+    # O tileset padrão fica fora do hash: as chaves anteriores continuam valendo.
+    if tileset != DEFAULT_TILESET:
+        text += f"\n{tileset}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class GenerationFlight:
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.cancel_reason: Optional[str] = None
+        self.idempotency_keys: Set[str] = set()
+        # Marcado antes de gravar o destino das chaves: a partir daí nenhuma
+        # chave nova entra no voo, e a gravação pode esperar o banco.
+        self.finished = False
+
+    def is_running(self) -> bool:
+        """True while new waiters can still attach (not finished nor being cancelled)."""
+        return (
+            self.task is not None
+            and not self.task.done()
+            and self.cancel_reason is None
+            and not self.finished
+        )
+
+
+_flights: Dict[str, GenerationFlight] = {}
+
+# Indexações de similares em andamento (referência forte até terminarem).
+_background_tasks: Set[asyncio.Task] = set()
+
+# Bundles pré-gerados: request_hash -> (id, bundle) já salvo, ou None.
+BundlePool = Callable[[str], Awaitable[Optional[Tuple[int, AssetBundle]]]]
+_bundle_pool: Optional[BundlePool] = None
+
+# Última chegada de um pedido de geração (time.monotonic), para a pré-geração
+# só rodar com o servidor ocioso.
+last_request_at = 0.0
+
+
+def set_bundle_pool(bundle_pool: Optional[BundlePool]) -> None:
+    global _bundle_pool
+    _bundle_pool = bundle_pool
+
+
+def is_idle(idle_seconds: float) -> bool:
+    """No flight running and no generation request in the last `idle_seconds`."""
+    running = any(flight.is_running() for flight in _flights.values())
+    return not running and time.monotonic() - last_request_at >= idle_seconds
+
+
+async def _generate_and_store(
+    flight: GenerationFlight,
+    map_description: str,
+    section_counts: Optional[Dict[str, int]] = None,
+    parent: Optional[Tuple[int, AssetBundle, BundleSection]] = None,
+    tileset: str = DEFAULT_TILESET,
+) -> Tuple[int, AssetBundle]:
+    """
+    Generates and stores a bundle, or, with `parent` (id, bundle, section),
+    a new version of a stored bundle with only that section regenerated.
+    """
+    asset_generator: Optional[AssetsGenerator] = None
+    try:
+        if generation_queue_enabled:
+            # O worker salva e indexa o bundle.
+            bundle_id, asset_bundle = await _run_on_worker(
+                map_description, section_counts, parent, tileset
+            )
+        elif parent is None:
+            asset_generator = AssetsGenerator(
+                map_description, **(section_counts or {}), tileset=tileset
+            )
+            asset_bundle = await asset_generator.agenerate_asset_bundle()
+            bundle_id = await insert_asset_bundle(asset_bundle, model_key)
+        else:
+            parent_id, parent_bundle, section = parent
+            asset_generator = AssetsGenerator.from_bundle(parent_bundle)
+            asset_bundle = await asset_generator.aregenerate_section(parent_bundle, section)
+            bundle_id = await insert_asset_bundle(asset_bundle, model_key, parent_id)
+    except asyncio.CancelledError:
+        if asset_generator is not None:
+            asset_generator.stage_recorder.record_cancellation(flight.cancel_reason or "unknown")
+        await _release_keys(flight)
+        raise
+    except IncompleteSectionError as e:
+        await _release_keys(flight)
+        raise IncompleteGeneration(str(e)) from e
+    except Exception:
+        await _release_keys(flight)
+        raise
+
+    flight.finished = True
+    if not generation_queue_enabled:
+        # Embedding remoto + escrita no sqlite: fora do loop, e a resposta não espera.
+        task = asyncio.create_task(
+            asyncio.to_thread(index_bundle, bundle_id, asset_bundle.description)
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    # Protegida: o voo cancelado durante a escrita ainda completa as chaves.
+    await asyncio.shield(complete_idempotency_keys(list(flight.idempotency_keys), bundle_id))
+    return bundle_id, asset_bundle
+
+
+async def _release_keys(flight: GenerationFlight) -> None:
+    """Frees the keys of a failed or cancelled flight, so a retry generates again."""
+    flight.finished = True
+    if flight.idempotency_keys:
+        await asyncio.shield(release_idempotency_keys(list(flight.idempotency_keys)))
+
+
+async def _run_on_worker(
+    map_description: str,
+    section_counts: Optional[Dict[str, int]] = None,
+    parent: Optional[Tuple[int, AssetBundle, BundleSection]] = None,
+    tileset: str = DEFAULT_TILESET,
+) -> Tuple[int, AssetBundle]:
+    """Queues the generation and waits until a worker stores the bundle."""
+    if parent is None:
+        job_id = await enqueue_generation_job(
+            "bundle",
+            {
+                "map_description": map_description,
+                "section_counts": section_counts or {},
+                "tileset": tileset,
+            },
+        )
+    else:
+        job_id = await enqueue_generation_job(
+            "regenerate", {"parent_id": parent[0], "section": parent[2]}
+        )
+
+    try:
+        while True:
+            await asyncio.sleep(generation_queue_poll_seconds)
+            job = await find_generation_job(job_id)
+            if job is None or job["status"] == "cancelled":
+                raise GenerationJobFailed(f"Generation job {job_id} was cancelled.")
+            if job["status"] == "failed":
+                raise GenerationJobFailed(f"Generation job {job_id} failed: {job['error']}")
+            if job["status"] == "completed":
+                asset_bundle = await find_bundle_data_by_id(job["bundle_id"])
+                if asset_bundle is None:
+                    raise BundleNotFound(f"Asset bundle with id {job['bundle_id']} no found.")
+                return job["bundle_id"], asset_bundle
+    except asyncio.CancelledError:
+        # Pelo writer do async_db, protegida: o cancelamento não espera o banco no loop.
+        await asyncio.shield(cancel_generation_job(job_id))
+        raise
+
+
+def _flight_with_key(idempotency_key: Optional[str]) -> Optional[GenerationFlight]:
+    for flight in _flights.values():
+        if idempotency_key in flight.idempotency_keys and flight.is_running():
+            return flight
+    return None
+
+
+def _join(
+    key: str,
+    start: Callable[[GenerationFlight], Awaitable[Tuple[int, AssetBundle]]],
+    idempotency_key: Optional[str] = None,
+) -> GenerationFlight:
+    if not coalesce_identical_generations:
+        key = uuid.uuid4().hex
+    flight = _flight_with_key(idempotency_key) or _flights.get(key)
+
+    if flight is None or not flight.is_running():
+        flight = GenerationFlight(key)
+        flight.task = asyncio.create_task(start(flight))
+        flight.task.add_done_callback(
+            lambda _: _flights.pop(key) if _flights.get(key) is flight else None
+        )
+        _flights[key] = flight
+        generation_requests_total.inc(result="started")
+    else:
+        generation_requests_total.inc(result="coalesced")
+
+    flight.waiters += 1
+    if idempotency_key:
+        flight.idempotency_keys.add(idempotency_key)
+    return flight
+
+
+def _leave(flight: GenerationFlight, reason: Optional[str]) -> None:
+    flight.waiters -= 1
+    if flight.waiters == 0 and flight.task is not None and not flight.task.done():
+        flight.cancel_reason = reason or "unknown"
+        flight.task.cancel()
+
+
+async def _replay(idempotency_key: str, request_hash: str) -> Optional[AssetBundle]:
+    """
+    Registra a chave. Retorna o bundle já gerado para ela, None quando a
+    geração deve seguir (chave nova, em andamento neste processo ou abandonada).
+    """
+    expire_before = (datetime.now() - timedelta(hours=idempotency_key_ttl_hours)).isoformat()
+    existing = await claim_idempotency_key(idempotency_key, request_hash, expire_before)
+    if existing is None:
+        return None
+
+    if existing["request_hash"] != request_hash:
+        raise IdempotencyKeyMismatch("Idempotency-Key was already used with another request.")
+
+    if existing["status"] == "completed":
+        asset_bundle = await find_bundle_data_by_id(existing["bundle_id"])
+        if asset_bundle is None:
+            raise IdempotentBundleDeleted(
+                f"Asset bundle {existing['bundle_id']} of this Idempotency-Key was deleted."
+            )
+        generation_requests_total.inc(result="replayed")
+        return asset_bundle
+
+    if _flight_with_key(idempotency_key) is not None:
+        return None
+
+    stale_before = (datetime.now() - timedelta(seconds=generation_deadline_seconds)).isoformat()
+    if existing["update_at"] < stale_before and await take_over_idempotency_key(
+        idempotency_key, existing["update_at"]
+    ):
+        return None
+
+    raise IdempotencyKeyInProgress("A request with this Idempotency-Key is still in progress.")
+
+
+async def _wait(
+    flight: GenerationFlight, is_disconnected: Callable[[], Awaitable[bool]]
+) -> Optional[Tuple[int, AssetBundle]]:
+    """
+    Waits for the flight as one of its waiters. Returns None when the client
+    disconnected and raises GenerationDeadlineExceeded after the deadline.
+    """
+    task = flight.task
+    assert task is not None
+    deadline = time.monotonic() + generation_deadline_seconds
+    reason = None
+
+    try:
+        while not task.done():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                reason = "deadline"
+            elif await is_disconnected():
+                reason = "disconnect"
+            if reason:
+                break
+            await asyncio.wait({task}, timeout=min(DISCONNECT_POLL_SECONDS, remaining))
+    finally:
+        # O próprio handler cancelado (ex: shutdown) também abandona o voo.
+        if not task.done():
+            reason = reason or "shutdown"
+        _leave(flight, reason)
+
+    if reason is not None:
+        logger.info(f"Generation request abandoned ({reason}).")
+        if reason == "deadline":
+            raise GenerationDeadlineExceeded("Generation deadline exceeded.")
+        return None
+
+    return task.result()
+
+
+async def generate_asset_bundle(
+    map_description: str,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    idempotency_key: Optional[str] = None,
+    section_counts: Optional[Dict[str, int]] = None,
+    tileset: str = DEFAULT_TILESET,
+) -> Optional[AssetBundle]:
+    """
+    Generates (or reuses) the bundle of `map_description`, stored once.
+    `section_counts` holds the AssetsGenerator number_of_* arguments and
+    `tileset` the tileset of the textures. Returns None when the client
+    disconnected; raises GenerationDeadlineExceeded after
+    `generation_deadline_seconds` and the other GenerationErrors for keys that
+    cannot be served.
+    """
+    global last_request_at
+    last_request_at = time.monotonic()
+    request_hash = hash_request(map_description, section_counts, tileset)
+
+    if idempotency_key:
+        asset_bundle = await _replay(idempotency_key, request_hash)
+        if asset_bundle is not None:
+            return asset_bundle
+
+    if _bundle_pool is not None and not section_counts and tileset == DEFAULT_TILESET:
+        pooled = await _bundle_pool(request_hash)
+        if pooled is not None:
+            bundle_id, asset_bundle = pooled
+            if idempotency_key:
+                await complete_idempotency_keys([idempotency_key], bundle_id)
+            generation_requests_total.inc(result="pooled")
+            return asset_bundle
+
+    flight = _join(
+        request_hash,
+        lambda flight: _generate_and_store(
+            flight, map_description, section_counts, tileset=tileset
+        ),
+        idempotency_key,
+    )
+    result = await _wait(flight, is_disconnected)
+    return result[1] if result is not None else None
+
+
+async def regenerate_bundle_section(
+    bundle_id: int,
+    section: BundleSection,
+    is_disconnected: Callable[[], Awaitable[bool]],
+) -> Optional[Tuple[int, AssetBundle]]:
+    """
+    Stores a new version of the bundle with only `section` regenerated and
+    returns (new id, bundle). Identical concurrent requests share the work.
+    """
+    parent_bundle = await find_bundle_data_by_id(bundle_id)
+    if parent_bundle is None:
+        raise BundleNotFound(f"Asset bundle with id {bundle_id} no found.")
+
+    flight = _join(
+        f"regenerate:{bundle_id}:{section}",
+        lambda flight: _generate_and_store(
+            flight, parent_bundle.raw_description, parent=(bundle_id, parent_bundle, section)
+        ),
+    )
+    return await _wait(flight, is_disconnected)
@@ -0,0 +1,350 @@
+"""
+Tileset ingestion: slices tileset.png into the category catalogues of tiles_data/.
+
+Replaces tiles_analyzer/analyze_tileset.ipynb, which described every 16x16 tile
+of the sheet one by one (duplicates and empty tiles included) before the
+category CSVs were derived by hand. Here:
+
+    1. tileset.png is decoded (sprites.decode_png) and sliced into TILE_SIZE
+       tiles in a single numpy reshape; fully transparent tiles are dropped;
+    2. each tile is hashed by its pixels, so pixel-identical tiles are found
+       and only one of them (the canonical tile) is catalogued;
+    3. the hashes are compared with tiles_data/tiles_manifest.csv, written by
+       the previous ingestion, and only new or changed tiles are described by
+       a vision model, which also picks their category (or none: letters, UI);
+       a tile whose pixels were already catalogued at another position (e.g.
+       a duplicate left out while its catalogued twin has since changed)
+       reuses that row instead;
+    4. the category CSVs (and their .json copies) are rewritten keeping the
+       rows of unchanged tiles.
+
+The first run on a tileset without a manifest takes its CSVs as up to date,
+only dropping the rows of duplicate tiles, and records the hashes. Then embed
+the changes with sync_vector_stores.py.
+
+    python ingest_tileset.py [--tileset default] [--dry-run]
+"""
+
+from os.path import exists, join
+from typing import Callable, Dict, List, Literal, Optional, Tuple
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from langchain.messages import HumanMessage
+from pydantic import BaseModel, Field
+
+from sprites import TILE_SIZE, decode_png, encode_png
+from tilesets import DEFAULT_TILESET, get_tileset, list_tilesets
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "tiles_manifest.csv"
+CATALOGUE_COLUMNS = ["x", "y", "base64", "description"]
+
+Position = Tuple[int, int]
+
+
+class TileDescription(BaseModel):
+    category: Literal["items", "environments", "entities", "none"] = Field(
+        description="Catalogue of the tile: items (weapons, armor, potions, loot), "
+        "environments (floors, walls, doors, furniture, terrain) or entities "
+        "(characters, monsters, animals). Use none for letters, digits and UI symbols."
+    )
+    description: str = Field(
+        description="One short sentence describing what the tile depicts "
+        "(e.g. `Open wooden door.`, `Futuristic, cybernetic soldier's helmet.`)."
+    )
+
+
+DESCRIBE_TILE_PROMPT = """
+You are an expert in pixel art game assets. The image is one 16x16 tile of a
+roguelike tileset, drawn as a white mask that the game tints with a color.
+Classify the tile and describe it in a short English sentence.
+"""
+
+Describer = Callable[[List[np.ndarray]], List[TileDescription]]
+
+
+################################################################################
+# Fatiamento e hashes
+################################################################################
+
+
+def slice_tileset(pixels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Positions (n, 2) and pixels (n, TILE_SIZE, TILE_SIZE, 4) of the visible
+    tiles of a tileset, in row-major order.
+    """
+    rows, columns = pixels.shape[0] // TILE_SIZE, pixels.shape[1] // TILE_SIZE
+    tiles = (
+        pixels[: rows * TILE_SIZE, : columns * TILE_SIZE]
+        .reshape(rows, TILE_SIZE, columns, TILE_SIZE, 4)
+        .swapaxes(1, 2)
+        .reshape(rows * columns, TILE_SIZE, TILE_SIZE, 4)
+    )
+    ys, xs = np.divmod(np.arange(rows * columns), columns)
+    positions = np.stack([xs, ys], axis=1).astype(np.int16)
+
+    visible = tiles[..., 3].reshape(len(tiles), -1).any(axis=1)
+    return positions[visible], tiles[visible]
+
+
+def hash_tiles(tiles: np.ndarray) -> List[str]:
+    """Pixel hash of each tile; the color of transparent pixels is ignored."""
+    # Pixels transparentes com RGB diferente continuam sendo o mesmo sprite.
+    normalized = np.where(tiles[..., 3:] > 0, tiles, 0).astype(np.uint8)
+    flat = np.ascontiguousarray(normalized).reshape(len(tiles), -1)
+    return [hashlib.sha1(row.tobytes()).hexdigest() for row in flat]
+
+
+def _data_uri(tile: np.ndarray) -> str:
+    return "data:image/png;base64," + base64.b64encode(encode_png(tile)).decode("ascii")
+
+
+################################################################################
+# Descrição dos tiles
+################################################################################
+
+
+def describe_tiles_with_llm(tiles: List[np.ndarray], max_concurrency: int = 4) -> List[TileDescription]:
+    from llm_models import GoogleModels, Providers, get_model
+
+    model = get_model(Providers.GOOGLE, GoogleModels.GEMINI_2_5_FLASH).with_structured_output(
+        schema=TileDescription.model_json_schema(), method="json_schema"
+    )
+    answers = model.batch(
+        [
+            [
+                HumanMessage(
+                    content=[
+                        {"type": "text", "text": DESCRIBE_TILE_PROMPT},
+                        {"type": "image_url", "image_url": _data_uri(tile)},
+                    ]
+                )
+            ]
+            for tile in tiles
+        ],
+        config={"max_concurrency": max_concurrency},
+    )
+    return [TileDescription.model_validate(answer) for answer in answers]
+
+
+################################################################################
+# Pipeline
+################################################################################
+
+
+def _read_manifest(path: str) -> Optional[Dict[Position, str]]:
+    if not exists(path):
+        return None
+    manifest = pd.read_csv(path)
+    return {
+        (int(x), int(y)): str(tile_hash)
+        for x, y, tile_hash in zip(manifest["x"], manifest["y"], manifest["hash"])
+    }
+
+
+def _read_catalogue(csv_path: str) -> Tuple[pd.DataFrame, bool]:
+    """The catalogue rows and whether the CSV was saved with its pandas index."""
+    if not exists(csv_path):
+        return pd.DataFrame(columns=CATALOGUE_COLUMNS), False
+    df = pd.read_csv(csv_path)
+    return df[CATALOGUE_COLUMNS], df.columns[0].startswith("Unnamed")
+
+
+def _write_csv(df: pd.DataFrame, path: str, index: bool = False) -> None:
+    # Troca atômica: a API pode estar lendo o CSV anterior.
+    tmp_path = path + ".tmp"
+    df.to_csv(tmp_path, index=index)
+    os.replace(tmp_path, path)
+
+
+def _write_catalogue(df: pd.DataFrame, csv_path: str, index: bool) -> None:
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    _write_csv(df.reset_index(drop=True), csv_path, index)
+
+    json_path = csv_path[: -len(".csv")] + ".json"
+    if exists(json_path):
+        with open(json_path, "w", encoding="utf-8") as file:
+            json.dump(df.to_dict(orient="records"), file, indent=2, ensure_ascii=False)
+
+
+def ingest_tileset(
+    tileset: str = DEFAULT_TILESET,
+    describe: Optional[Describer] = None,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Brings the category CSVs of the tileset up to date with its tileset.png,
+    describing only new or changed tiles with `describe` (the vision model
+    by default). Returns the counts of the run.
+    """
+    config = get_tileset(tileset)
+    data_path = join(config.root, "tiles_data")
+    manifest_path = join(data_path, MANIFEST_FILE)
+
+    with open(config.image_path, "rb") as file:
+        positions, tiles = slice_tileset(decode_png(file.read()))
+    hashes = hash_tiles(tiles)
+    current = {
+        (int(x), int(y)): (tile_hash, row)
+        for row, ((x, y), tile_hash) in enumerate(zip(positions.tolist(), hashes))
+    }
+
+    previous = _read_manifest(manifest_path)
+    bootstrap = previous is None
+    unchanged = {
+        position
+        for position, (tile_hash, _) in current.items()
+        if bootstrap or previous.get(position) == tile_hash
+    }
+
+    catalogues: Dict[str, pd.DataFrame] = {}
+    saved_with_index: Dict[str, bool] = {}
+    for category, db_config in config.databases.items():
+        catalogues[category], saved_with_index[category] = _read_catalogue(db_config["csv_path"])
+    catalogued = {
+        (int(x), int(y))
+        for df in catalogues.values()
+        for x, y in zip(df["x"], df["y"])
+        if (int(x), int(y)) in unchanged
+    }
+
+    # Um tile canônico por hash: de preferência um já catalogado, depois um já
+    # visto (mesmo que deixado de fora), e só então o primeiro na ordem da folha.
+    groups: Dict[str, List[Position]] = {}
+    for position, (tile_hash, _) in current.items():
+        groups.setdefault(tile_hash, []).append(position)
+    canonical = {
+        tile_hash: min(group, key=lambda p: (p not in catalogued, p not in unchanged, p[1], p[0]))
+        for tile_hash, group in groups.items()
+    }
+    canonical_positions = set(canonical.values())
+
+    keep = catalogued & canonical_positions
+
+    # Linhas catalogadas por hash anterior: um tile canônico fora do catálogo
+    # com os mesmos pixels herda a linha (categoria e descrição) sem o modelo.
+    inheritable: Dict[str, Dict[str, str]] = {}
+    if not bootstrap:
+        for category, df in catalogues.items():
+            for x, y, description in zip(df["x"], df["y"], df["description"]):
+                tile_hash = previous.get((int(x), int(y)))
+                if tile_hash is not None:
+                    inheritable.setdefault(tile_hash, {}).setdefault(category, description)
+
+    to_describe: List[Position] = []
+    to_inherit: List[Position] = []
+    for position in sorted(canonical_positions - keep, key=lambda p: (p[1], p[0])):
+        if current[position][0] in inheritable:
+            to_inherit.append(position)
+        elif position not in unchanged:
+            to_describe.append(position)
+
+    report = {
+        "tileset": tileset,
+        "tiles": len(current),
+        "duplicates": len(current) - len(canonical_positions),
+        "unchanged": len(unchanged & canonical_positions),
+        "described": len(to_describe),
+        "inherited": len(to_inherit),
+        "bootstrap": bootstrap,
+        "removed": 0,
+        "added": 0,
+    }
+
+    if dry_run:
+        report["removed"] = sum(
+            sum((int(x), int(y)) not in keep for x, y in zip(df["x"], df["y"]))
+            for df in catalogues.values()
+        )
+        return report
+
+    descriptions: List[TileDescription] = []
+    if to_describe:
+        describe = describe or describe_tiles_with_llm
+        descriptions = describe([tiles[current[position][1]] for position in to_describe])
+
+    new_rows: Dict[str, List[dict]] = {category: [] for category in catalogues}
+    for x, y in to_inherit:
+        for category, description in inheritable[current[(x, y)][0]].items():
+            new_rows[category].append(
+                {
+                    "x": x,
+                    "y": y,
+                    "base64": _data_uri(tiles[current[(x, y)][1]]),
+                    "description": description,
+                }
+            )
+    for (x, y), tile_description in zip(to_describe, descriptions):
+        # "none": letras, dígitos e símbolos de interface ficam fora dos catálogos.
+        if tile_description.category not in new_rows:
+            continue
+        new_rows[tile_description.category].append(
+            {
+                "x": x,
+                "y": y,
+                "base64": _data_uri(tiles[current[(x, y)][1]]),
+                "description": tile_description.description.strip(),
+            }
+        )
+
+    for category, df in catalogues.items():
+        kept = df[[(int(x), int(y)) in keep for x, y in zip(df["x"], df["y"])]]
+        added = pd.DataFrame(new_rows[category], columns=CATALOGUE_COLUMNS)
+        updated = pd.concat([kept, added], ignore_index=True) if len(added) else kept
+        updated = updated.sort_values(["y", "x"], kind="stable")
+
+        report["removed"] += len(df) - len(kept)
+        report["added"] += len(added)
+
+        if len(kept) != len(df) or len(added) or not exists(config.databases[category]["csv_path"]):
+            _write_catalogue(
+                updated, config.databases[category]["csv_path"], saved_with_index[category]
+            )
+
+    # O manifesto por último: se a descrição falhar, a próxima execução refaz os mesmos tiles.
+    manifest = pd.DataFrame(
+        [(x, y, tile_hash) for (x, y), (tile_hash, _) in current.items()],
+        columns=["x", "y", "hash"],
+    )
+    os.makedirs(data_path, exist_ok=True)
+    _write_csv(manifest, manifest_path)
+
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Slices a tileset into its tile catalogues.")
+    parser.add_argument("--tileset", choices=list_tilesets(), default=DEFAULT_TILESET)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only report what would change."
+    )
+    args = parser.parse_args()
+
+    report = ingest_tileset(args.tileset, dry_run=args.dry_run)
+    print(
+        f"{report['tiles']} visible tiles ({report['duplicates']} duplicates), "
+        f"{report['unchanged']} unchanged, {report['described']} to describe, "
+        f"{report['inherited']} reusing a catalogued duplicate; "
+        f"catalogue rows: -{report['removed']} +{report['added']}."
+    )
+    if report["bootstrap"]:
+        print(
+            "No previous manifest: the current catalogues were taken as up to date"
+            + (
+                f", except for {report['removed']} row(s) of duplicate tiles, dropped."
+                if report["removed"]
+                else "."
+            )
+        )
+    if not args.dry_run and (report["removed"] or report["added"]):
+        print(f"Now run: python sync_vector_stores.py --tileset {args.tileset}")
@@ -0,0 +1,74 @@
+"""
+Incremental scanner for streamed structured output.
+
+The list sections are answered as `{"items": [{...}, {...}]}`. `ItemStream`
+is fed the text as it arrives and returns each object of the `items` array as
+soon as its closing brace is seen, so work on an item (texture retrieval) can
+start while the rest of the answer is still being generated. A bare top-level
+array is accepted too. Text before the document (e.g. a ```json fence) is
+ignored; the complete answer is still parsed and validated as before.
+"""
+
+from typing import Any, List, Optional
+import json
+
+
+class ItemStream:
+    def __init__(self, key: str = "items") -> None:
+        self.key = key
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string: List[str] = []
+        self._last_root_string: Optional[str] = None
+        self._array_key: Optional[str] = None
+        self._item: Optional[List[str]] = None
+        self._item_depth = 0
+
+    def _at_item_level(self) -> bool:
+        if self._stack == ["["]:
+            return True
+        return self._stack == ["{", "["] and self._array_key == self.key
+
+    def feed(self, text: str) -> List[Any]:
+        """Returns the items completed by `text`."""
+        completed: List[Any] = []
+
+        for char in text:
+            if self._item is not None:
+                self._item.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_root_string = "".join(self._string)
+                elif len(self._stack) == 1:
+                    self._string.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string = []
+            elif char == "{" or char == "[":
+                if char == "{" and self._item is None and self._at_item_level():
+                    self._item = [char]
+                    self._item_depth = len(self._stack)
+                if char == "[" and self._stack == ["{"]:
+                    self._array_key = self._last_root_string
+                self._stack.append(char)
+            elif char == "}" or char == "]":
+                if self._stack:
+                    self._stack.pop()
+                if self._item is not None and len(self._stack) == self._item_depth:
+                    try:
+                        completed.append(json.loads("".join(self._item)))
+                    except ValueError:
+                        pass
+                    self._item = None
+
+        return completed
@@ -0,0 +1,276 @@
+"""
+Local lexical (BM25) retriever over the tile descriptions of each store.
+
+Tile descriptions produced by the LLM share a lot of vocabulary with the
+`description` column of the tile CSVs, so a sparse BM25 index can answer a large
+share of texture lookups without the remote embedding call. `query_tiles` is the
+entry point used by the generator: depending on `config.texture_retriever`
+it uses the lexical index, the vector store, or the lexical index first and
+the vector store only when the lexical confidence is low. The vector store
+also answers when the lexical index finds no match at all.
+
+Running this module prints a match-agreement report between the lexical
+retriever and the textures chosen by the vector store for stored bundles:
+
+    python lexical_retriever.py [--live] [--threshold 0.3]
+"""
+
+from collections import Counter as TermCounter
+from typing import Any, Dict, List, Sequence, Tuple
+import argparse
+import math
+import re
+import sys
+
+from config import lexical_confidence_threshold, texture_retriever
+from metrics import texture_retrievals_total
+from tile_catalogue import get_tile_catalogue
+from tilesets import DEFAULT_TILESET, get_tileset, tileset_resource
+from vector_db import StoreType, query_vector_store
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "could", "for",
+    "from", "has", "have", "in", "into", "is", "it", "its", "of", "on", "or",
+    "that", "the", "their", "this", "to", "with", "which", "while", "like",
+    "appears", "seems", "some", "very", "tile",
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        # Stemming mínimo: plural simples ("stones" -> "stone").
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+
+    return tokens
+
+
+class BM25Index:
+    """
+    Sparse BM25 index (term -> postings) precomputed once per store.
+    """
+
+    def __init__(self, rows: Sequence[Any], k1: float = 1.2, b: float = 0.75) -> None:
+        self.rows = rows
+        self.k1 = k1
+        self.b = b
+
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.document_lengths: List[int] = []
+        # Documento de cada posição (x, y) da folha, usado pelo texture_assignment.
+        self.position_index: Dict[Tuple[int, int], int] = {}
+
+        for index, row in enumerate(rows):
+            self.position_index[(int(row["x"]), int(row["y"]))] = index
+            terms = tokenize(str(row["description"]))
+            self.document_lengths.append(len(terms))
+            for term, frequency in TermCounter(terms).items():
+                self.postings.setdefault(term, []).append((index, frequency))
+
+        self.document_count = len(rows)
+        self.average_length = (
+            sum(self.document_lengths) / self.document_count if self.document_count else 0
+        )
+        self.idf = {term: self._idf(len(postings)) for term, postings in self.postings.items()}
+
+    def estimated_bytes(self) -> int:
+        # Cada posting é uma tupla (índice, frequência) numa lista (~80 bytes).
+        postings = sum(len(postings) for postings in self.postings.values())
+        terms = sum(sys.getsizeof(term) + 200 for term in self.postings)
+        # Entrada do position_index: chave (x, y) e slot do dict (~170 bytes).
+        positions = 170 * len(self.position_index)
+        return 80 * postings + terms + 8 * len(self.document_lengths) + positions
+
+    def _idf(self, document_frequency: int) -> float:
+        return math.log(
+            (self.document_count - document_frequency + 0.5) / (document_frequency + 0.5)
+            + 1
+        )
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """BM25 score of every document that shares at least one term with the query."""
+        scores: Dict[int, float] = {}
+
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for index, frequency in self.postings[term]:
+                length_norm = 1 - self.b + self.b * self.document_lengths[index] / self.average_length
+                scores[index] = scores.get(index, 0.0) + idf * (
+                    frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                )
+
+        return scores
+
+    def max_score(self, query: str) -> float:
+        """
+        Upper bound of the score for this query: every known term matched with
+        a saturated frequency. Terms the tileset never uses are ignored, since
+        LLM descriptions are long prose and would otherwise never be confident.
+        """
+        return sum(
+            self.idf[term] * (self.k1 + 1)
+            for term in set(tokenize(query))
+            if term in self.idf
+        )
+
+    def search(self, query: str, k: int = 4) -> List[dict]:
+        scores = self.scores(query)
+        upper_bound = self.max_score(query) or 1.0
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+        return [
+            {
+                "b64image": self.rows[index].get("base64"),
+                "x": int(self.rows[index]["x"]),
+                "y": int(self.rows[index]["y"]),
+                "description": str(self.rows[index]["description"]),
+                "score": score,
+                "confidence": score / upper_bound,
+                "retriever": "lexical",
+            }
+            for index, score in best
+        ]
+
+
+def get_lexical_index(store_type: StoreType, tileset: str = DEFAULT_TILESET) -> BM25Index:
+    if store_type not in get_tileset(tileset).databases:
+        raise ValueError(f"Tipo de store inválido: {store_type}")
+
+    # Registros do catálogo: o base64 só é montado para os tiles retornados.
+    return tileset_resource(
+        tileset,
+        f"lexical:{store_type}",
+        lambda: BM25Index(get_tile_catalogue(tileset).records(store_type)),
+        BM25Index.estimated_bytes,
+    )
+
+
+def query_lexical(
+    query: str, store_type: StoreType, documents_count: int = 4, tileset: str = DEFAULT_TILESET
+) -> list:
+    return get_lexical_index(store_type, tileset).search(query, documents_count)
+
+
+def query_tiles(
+    query: str,
+    store_type: StoreType,
+    documents_count: int = 4,
+    retriever: str = texture_retriever,
+    threshold: float = lexical_confidence_threshold,
+    tileset: str = DEFAULT_TILESET,
+) -> list:
+    """
+    Busca tiles do tileset com o retriever configurado ("vector", "lexical" ou "hybrid").
+    """
+    if retriever in ("lexical", "hybrid"):
+        tiles = query_lexical(query, store_type, documents_count, tileset)
+
+        # Sem nenhum termo no vocabulário o BM25 não acha nada: vai para os embeddings.
+        if tiles and (retriever == "lexical" or tiles[0]["confidence"] >= threshold):
+            texture_retrievals_total.inc(store_type=store_type, retriever="lexical")
+            return tiles
+
+    texture_retrievals_total.inc(store_type=store_type, retriever="vector")
+    return [
+        {**tile, "retriever": "vector"}
+        for tile in query_vector_store(query, store_type, documents_count, tileset)
+    ]
+
+
+def _stored_tile_matches() -> List[Tuple[str, StoreType, str, Tuple[int, int]]]:
+    """(tile description, store type, tileset, chosen position) for every stored bundle."""
+    from db import find_all_assets_bundles, find_bundle_data_by_id
+
+    matches = []
+    for row in find_all_assets_bundles():
+        bundle = find_bundle_data_by_id(row["id"])
+        if bundle is None:
+            continue
+
+        tiles = [(bundle.player.tile_with_texture, "entities")]
+        tiles.append((bundle.final_objective.tile_with_texture, "items"))
+        for level in bundle.dungeon_levels.items:
+            tiles.append((level.wall_tile_with_texture, "environments"))
+            tiles.append((level.floor_tile_with_texture, "environments"))
+        tiles += [(enemy.tile_with_texture, "entities") for enemy in bundle.enemies.items]
+        tiles += [(weapon.tile_with_texture, "items") for weapon in bundle.weapons.items]
+
+        for tile, store_type in tiles:
+            position = tile.texture.tileset_position
+            matches.append(
+                (tile.description, store_type, bundle.tileset, (position.x, position.y))
+            )
+
+    return matches
+
+
+def print_agreement_report(live: bool, threshold: float) -> None:
+    """
+    Compares the lexical top-1 against the vector store top-1. By default the
+    vector result is the texture stored in each bundle; `live` re-queries Chroma.
+    """
+    buckets: Dict[str, List[int]] = {}
+    total = agree = agree_top5 = confident = confident_agree = 0
+
+    for description, store_type, tileset, stored_position in _stored_tile_matches():
+        if live:
+            best = query_vector_store(description, store_type, 1, tileset)[0]
+            stored_position = (best["x"], best["y"])
+
+        lexical = query_lexical(description, store_type, 5, tileset)
+        lexical_positions = [(tile["x"], tile["y"]) for tile in lexical]
+        confidence = lexical[0]["confidence"] if lexical else 0.0
+        is_match = lexical_positions[:1] == [stored_position]
+
+        total += 1
+        agree += is_match
+        agree_top5 += stored_position in lexical_positions
+        if confidence >= threshold:
+            confident += 1
+            confident_agree += is_match
+
+        bucket = f"{min(int(confidence * 10), 9) / 10:.1f}"
+        buckets.setdefault(bucket, [0, 0])
+        buckets[bucket][0] += 1
+        buckets[bucket][1] += is_match
+
+    if total == 0:
+        print("No stored bundles to compare.")
+        return
+
+    print(f"Tiles compared:           {total}")
+    print(f"Top-1 agreement:          {agree / total:.1%}")
+    print(f"Vector top-1 in lexical top-5: {agree_top5 / total:.1%}")
+    print(f"Served lexically (>= {threshold}): {confident / total:.1%}")
+    if confident:
+        print(f"Agreement when served:    {confident_agree / confident:.1%}")
+    print("confidence  tiles  agreement")
+    for bucket, (count, matches) in sorted(buckets.items()):
+        print(f"{bucket:>10}  {count:>5}  {matches / count:>9.1%}")
+
+    # Varredura do limiar: quanto o hybrid serviria sem a rede e com que acerto.
+    print("threshold  served  agreement when served")
+    for step in range(1, 10):
+        served = [values for bucket, values in buckets.items() if float(bucket) >= step / 10]
+        count = sum(values[0] for values in served)
+        if count:
+            matches = sum(values[1] for values in served)
+            print(f"{step / 10:>9.1f}  {count / total:>6.1%}  {matches / count:>21.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lexical vs vector match-agreement report.")
+    parser.add_argument("--live", action="store_true", help="Re-query Chroma instead of using stored textures.")
+    parser.add_argument("--threshold", type=float, default=lexical_confidence_threshold)
+    args = parser.parse_args()
+
+    print_agreement_report(args.live, args.threshold)
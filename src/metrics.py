@@ -0,0 +1,326 @@
+"""
+In-process metrics (counters and latency histograms) with Prometheus text
+exposition, plus a per-generation stage recorder that is attached to each
+stored asset bundle.
+"""
+
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Iterable, Optional, Tuple
+import asyncio
+import threading
+import time
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+_lock = threading.Lock()
+_registry: list = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with _lock:
+            series = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for key, series in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+def render_prometheus() -> str:
+    """Serializes every registered metric in the Prometheus text format."""
+    with _lock:
+        lines = [line for metric in _registry for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+################################################################################
+# Metrics
+################################################################################
+
+stage_seconds = Histogram(
+    "asset_generator_stage_seconds",
+    "Wall time spent in each generation stage.",
+    ["model", "stage"],
+)
+llm_call_seconds = Histogram(
+    "asset_generator_llm_call_seconds",
+    "Latency of a single LLM request (one attempt).",
+    ["model", "stage"],
+)
+llm_attempts_total = Counter(
+    "asset_generator_llm_attempts_total",
+    "LLM requests made, including retries.",
+    ["model", "stage"],
+)
+llm_validation_failures_total = Counter(
+    "asset_generator_llm_validation_failures_total",
+    "Structured LLM responses rejected by schema validation.",
+    ["model", "stage"],
+)
+llm_errors_total = Counter(
+    "asset_generator_llm_errors_total",
+    "LLM requests that failed with a non validation error.",
+    ["model", "stage"],
+)
+llm_tokens_total = Counter(
+    "asset_generator_llm_tokens_total",
+    "Tokens consumed by LLM requests.",
+    ["model", "stage", "kind"],
+)
+texture_lookup_seconds = Histogram(
+    "asset_generator_texture_lookup_seconds",
+    "Latency of a tile to texture lookup.",
+    ["store_type"],
+)
+texture_retrievals_total = Counter(
+    "asset_generator_texture_retrievals_total",
+    "Texture lookups served by each retriever (lexical or vector).",
+    ["store_type", "retriever"],
+)
+texture_cache_lookups_total = Counter(
+    "asset_generator_texture_cache_lookups_total",
+    "Texture cache lookups by result (memory_hit, db_hit or miss).",
+    ["store_type", "result"],
+)
+db_operation_seconds = Histogram(
+    "asset_generator_db_operation_seconds",
+    "Latency of database operations.",
+    ["operation"],
+)
+generations_cancelled_total = Counter(
+    "asset_generator_generations_cancelled_total",
+    "Generations cancelled before finishing, by the stage they were in.",
+    ["model", "stage", "reason"],
+)
+generation_requests_total = Counter(
+    "asset_generator_generation_requests_total",
+    "Generation requests by outcome (started, coalesced into a running one, replayed by Idempotency-Key, or served from the pre-generation pool).",
+    ["result"],
+)
+pregenerated_bundles_total = Counter(
+    "asset_generator_pregenerated_bundles_total",
+    "Bundles generated in the background for the pre-generation pool, by result.",
+    ["result"],
+)
+generation_jobs_total = Counter(
+    "asset_generator_generation_jobs_total",
+    "Queued generation jobs run by worker.py, by result (completed, retried, failed, lost, resumed).",
+    ["result"],
+)
+tileset_events_total = Counter(
+    "asset_generator_tileset_events_total",
+    "Tilesets loaded into memory and evicted from it (tilesets.py), by event.",
+    ["tileset", "event"],
+)
+bundle_generation_seconds = Histogram(
+    "asset_generator_bundle_generation_seconds",
+    "Total wall time to generate an asset bundle.",
+    ["model"],
+)
+
+
+def timed_db_operation(operation: str):
+    """Decorator that records the latency of a db.py function."""
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with db_operation_seconds.time(operation=operation):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class StageRecorder:
+    """
+    Collects timings, attempts and token usage per stage for a single
+    generation. The result of `as_dict()` is stored on the asset bundle.
+    """
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.stages: Dict[str, dict] = {}
+        self.cancelled_stage: Optional[str] = None
+
+    def _stage(self, stage: str) -> dict:
+        return self.stages.setdefault(
+            stage,
+            {
+                "seconds": 0.0,
+                "llm_calls": 0,
+                "attempts": 0,
+                "validation_failures": 0,
+                "errors": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "total_tokens": 0,
+                "texture_lookups": 0,
+            },
+        )
+
+    @contextmanager
+    def stage(self, stage: str):
+        entry = self._stage(stage)
+        start = time.perf_counter()
+        try:
+            yield entry
+        except asyncio.CancelledError:
+            self.cancelled_stage = self.cancelled_stage or stage
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            entry["seconds"] += elapsed
+            stage_seconds.observe(elapsed, model=self.model, stage=stage)
+
+    @contextmanager
+    def llm_attempt(self, stage: str):
+        entry = self._stage(stage)
+        entry["attempts"] += 1
+        llm_attempts_total.inc(model=self.model, stage=stage)
+        with llm_call_seconds.time(model=self.model, stage=stage):
+            yield
+
+    def record_llm_call(self, stage: str) -> None:
+        self._stage(stage)["llm_calls"] += 1
+
+    def record_validation_failure(self, stage: str) -> None:
+        self._stage(stage)["validation_failures"] += 1
+        llm_validation_failures_total.inc(model=self.model, stage=stage)
+
+    def record_error(self, stage: str) -> None:
+        self._stage(stage)["errors"] += 1
+        llm_errors_total.inc(model=self.model, stage=stage)
+
+    def record_usage(self, stage: str, usage_metadata: dict) -> None:
+        """Adds the usage of a UsageMetadataCallbackHandler to the stage."""
+        entry = self._stage(stage)
+        for model_name, usage in usage_metadata.items():
+            for kind in ("input_tokens", "output_tokens", "total_tokens"):
+                amount = usage.get(kind, 0) or 0
+                entry[kind] += amount
+                llm_tokens_total.inc(
+                    amount, model=model_name, stage=stage, kind=kind.split("_")[0]
+                )
+
+    @contextmanager
+    def texture_lookup(self, stage: str, store_type: str):
+        self._stage(stage)["texture_lookups"] += 1
+        with texture_lookup_seconds.time(store_type=store_type):
+            yield
+
+    def record_texture_lookups(self, stage: str, count: int) -> None:
+        """Counts lookups resolved in batch (timed by the caller per store)."""
+        self._stage(stage)["texture_lookups"] += count
+
+    def record_cancellation(self, reason: str) -> None:
+        """Counts a cancelled generation (reason: "disconnect" or "deadline")."""
+        generations_cancelled_total.inc(
+            model=self.model, stage=self.cancelled_stage or "pending", reason=reason
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            stage: {
+                **values,
+                "seconds": round(values["seconds"], 3),
+            }
+            for stage, values in self.stages.items()
+        }
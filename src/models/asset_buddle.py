@@ -30,3 +30,13 @@ class AssetBundle(AssetBundleBase):
     final_objective: FinalObjectiveWithTexture
 
     usage_metadata: dict
+
+    stage_metrics: dict = Field(
+        default_factory=dict,
+        description="Per stage timings, LLM attempts, validation failures and token usage.",
+    )
+
+    tileset: str = Field(
+        default="default",
+        description="Id of the tileset (art style) the texture positions refer to.",
+    )
@@ -2,6 +2,9 @@ from typing import List
 from pydantic import BaseModel, Field
 from .tiles import Tile, TileWithTexture
 
+# Profundidade máxima de um nível (e, portanto, do número de níveis de um bundle).
+MAX_DUNGEON_DEPTH = 19
+
 
 class DungeonLevel(BaseModel):
     description: str = Field(
@@ -14,7 +17,7 @@ class DungeonLevel(BaseModel):
 
     depth: int = Field(
         gt=0,
-        lt=20,
+        le=MAX_DUNGEON_DEPTH,
         description="The dungeon level depth. The deeper the level, the harder it is.",
     )
 
@@ -0,0 +1,136 @@
+"""
+Background pre-generation of bundles for the popular themes.
+
+The registered themes (`config.prompts` plus `config.pregeneration_themes`)
+each keep up to `pregeneration_pool_size` fresh bundles in the `bundle_pool`
+table of database.db. POST /asset-bundle/ with one of these themes (same
+normalized description, default section sizes) takes a pooled bundle, stored
+as a regular bundle in the same transaction, and wakes the refill; other
+themes are generated on demand as before.
+
+Disabled by default (`config.pregeneration_enabled`). The refill only runs
+while the process is idle (no generation running and no generation request
+for `pregeneration_idle_seconds`), one bundle at a time. Each bundle is first
+claimed in database.db (db.claim_pregeneration), which enforces
+`pregeneration_max_per_hour` across all the processes sharing the database
+and counts the bundles being generated, so several API workers never fill
+the same theme at once.
+"""
+
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+import asyncio
+import logging
+
+from asset_generator import AssetsGenerator
+from async_db import (
+    claim_pregeneration,
+    finish_pregeneration,
+    insert_pooled_bundle,
+    take_pooled_bundle,
+)
+from bundle_index import index_bundle
+from config import (
+    generation_deadline_seconds,
+    model_key,
+    pregeneration_enabled,
+    pregeneration_idle_seconds,
+    pregeneration_max_age_hours,
+    pregeneration_max_per_hour,
+    pregeneration_pool_size,
+    pregeneration_themes,
+    prompts,
+)
+from generation_flights import hash_request, is_idle, set_bundle_pool
+from metrics import pregenerated_bundles_total
+from models import AssetBundle
+
+logger = logging.getLogger(__name__)
+
+_refill_requested = asyncio.Event()
+_background_tasks: set = set()
+
+
+def registered_themes() -> List[str]:
+    return list(prompts) + list(pregeneration_themes)
+
+
+def _fresh_after() -> str:
+    return (datetime.now() - timedelta(hours=pregeneration_max_age_hours)).isoformat()
+
+
+async def take_from_pool(request_hash: str) -> Optional[Tuple[int, AssetBundle]]:
+    """Pooled bundle of the request (already stored), waking the refill."""
+    pooled = await take_pooled_bundle(request_hash, _fresh_after())
+    if pooled is None:
+        return None
+
+    _refill_requested.set()
+    bundle_id, asset_bundle = pooled
+    # A resposta não espera o embedding do índice de similares.
+    task = asyncio.create_task(asyncio.to_thread(index_bundle, bundle_id, asset_bundle.description))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return pooled
+
+
+async def _claim_theme() -> Optional[Tuple[int, str]]:
+    """
+    Claims the registered theme with the fewest fresh pooled (or in progress)
+    bundles, if any is short and the hourly budget allows. Returns (run id, theme).
+    """
+    themes = {hash_request(theme): theme for theme in registered_themes()}
+    # Uma reserva sem fim depois do prazo de geração é de um processo que morreu.
+    running_after = (datetime.now() - timedelta(seconds=generation_deadline_seconds)).isoformat()
+    claimed = await claim_pregeneration(
+        list(themes),
+        pregeneration_pool_size,
+        pregeneration_max_per_hour,
+        _fresh_after(),
+        running_after,
+    )
+    if claimed is None:
+        return None
+
+    run_id, request_hash = claimed
+    return run_id, themes[request_hash]
+
+
+async def _pregenerate(run_id: int, theme: str) -> None:
+    try:
+        asset_bundle = await AssetsGenerator(theme).agenerate_asset_bundle()
+        await insert_pooled_bundle(hash_request(theme), asset_bundle, model_key, run_id)
+    except Exception:
+        await finish_pregeneration(run_id)
+        pregenerated_bundles_total.inc(result="error")
+        raise
+    pregenerated_bundles_total.inc(result="stored")
+
+
+async def run_pregeneration() -> None:
+    """Refill loop; runs until cancelled."""
+    while True:
+        try:
+            await asyncio.wait_for(_refill_requested.wait(), timeout=pregeneration_idle_seconds)
+        except asyncio.TimeoutError:
+            pass
+        _refill_requested.clear()
+
+        try:
+            while is_idle(pregeneration_idle_seconds):
+                claimed = await _claim_theme()
+                if claimed is None:
+                    break
+                await _pregenerate(*claimed)
+        except Exception as e:
+            # Sem nova tentativa imediata: o próximo ciclo tenta de novo.
+            logger.warning(f"Pre-generation failed: {e}")
+
+
+def start_pregeneration() -> Optional[asyncio.Task]:
+    """Installs the pool on the POST path and starts the refill loop."""
+    if not pregeneration_enabled:
+        return None
+
+    set_bundle_pool(take_from_pool)
+    return asyncio.create_task(run_pregeneration())
@@ -0,0 +1,179 @@
+"""
+Server-side bundle previews.
+
+Composes the bundle sprites, tinted with each `Tile.color`, into two PNGs:
+
+- preview: every tile of the bundle in sections (player and final objective,
+  wall/floor of each level, enemies, weapons), scaled like the viewer;
+- thumbnail: a small room of the first level (walls around the floor) with
+  the player, the final objective, a weapon and the first enemies on it.
+
+Renders are cached on disk as previews/<id>_<kind>.v<RENDER_VERSION>.png and
+removed when the bundle is deleted. Bumping RENDER_VERSION invalidates old
+renders after a layout change.
+"""
+
+from os.path import exists, join
+from typing import List, Optional
+import glob
+import os
+import tempfile
+
+import numpy as np
+
+from db import find_bundle_data_by_id
+from models import AssetBundle, TileWithTexture
+from sprites import TILE_SIZE, encode_png, parse_color, tinted_tile
+from utils import MAIN_PATH
+
+PREVIEWS_PATH = join(MAIN_PATH, "previews")
+RENDER_VERSION = 1
+
+PREVIEW_KINDS = ("preview", "thumbnail")
+
+BACKGROUND_COLOR = "#1e1e1e"
+SLOT_COLOR = "#2a2a2a"
+PREVIEW_SCALE = 3
+PREVIEW_COLUMNS = 10
+PREVIEW_PADDING = 8
+THUMBNAIL_SCALE = 1
+
+
+def _canvas(height: int, width: int, color: str) -> np.ndarray:
+    canvas = np.empty((height, width, 4), dtype=np.uint8)
+    canvas[..., :3] = parse_color(color)
+    canvas[..., 3] = 255
+    return canvas
+
+
+def _sprite(tile: TileWithTexture, scale: int, tileset: str) -> np.ndarray:
+    position = tile.texture.tileset_position
+    sprite = tinted_tile(position.x, position.y, tile.color, tileset)
+    return sprite.repeat(scale, axis=0).repeat(scale, axis=1)
+
+
+def _draw(canvas: np.ndarray, sprite: np.ndarray, top: int, left: int) -> None:
+    """Alpha-blends `sprite` onto the opaque canvas."""
+    height, width = sprite.shape[:2]
+    region = canvas[top : top + height, left : left + width, :3].astype(np.float32)
+    alpha = sprite[..., 3:4].astype(np.float32) / 255
+    blended = region * (1 - alpha) + sprite[..., :3].astype(np.float32) * alpha
+    canvas[top : top + height, left : left + width, :3] = blended.round().astype(np.uint8)
+
+
+def _sections(bundle: AssetBundle) -> List[List[TileWithTexture]]:
+    levels = []
+    for level in bundle.dungeon_levels.items:
+        levels += [level.wall_tile_with_texture, level.floor_tile_with_texture]
+
+    sections = [
+        [bundle.player.tile_with_texture, bundle.final_objective.tile_with_texture],
+        levels,
+        [enemy.tile_with_texture for enemy in bundle.enemies.items],
+        [weapon.tile_with_texture for weapon in bundle.weapons.items],
+    ]
+    return [section for section in sections if section]
+
+
+def render_preview(bundle: AssetBundle) -> np.ndarray:
+    size = TILE_SIZE * PREVIEW_SCALE
+    cell = size + PREVIEW_PADDING
+
+    rows = []  # linhas de sprites; None separa as seções
+    for section in _sections(bundle):
+        if rows:
+            rows.append(None)
+        rows += [
+            section[start : start + PREVIEW_COLUMNS]
+            for start in range(0, len(section), PREVIEW_COLUMNS)
+        ]
+
+    columns = max(len(row) for row in rows if row is not None)
+    height = PREVIEW_PADDING + sum(cell if row is not None else PREVIEW_PADDING for row in rows)
+    canvas = _canvas(height, PREVIEW_PADDING + columns * cell, BACKGROUND_COLOR)
+    slot = _canvas(size, size, SLOT_COLOR)
+
+    top = PREVIEW_PADDING
+    for row in rows:
+        if row is None:
+            top += PREVIEW_PADDING
+            continue
+        for column, tile in enumerate(row):
+            left = PREVIEW_PADDING + column * cell
+            canvas[top : top + size, left : left + size] = slot
+            _draw(canvas, _sprite(tile, PREVIEW_SCALE, bundle.tileset), top, left)
+        top += cell
+
+    return canvas
+
+
+def render_thumbnail(bundle: AssetBundle) -> np.ndarray:
+    size = TILE_SIZE * THUMBNAIL_SCALE
+    room = 5
+    canvas = _canvas(room * size, room * size, BACKGROUND_COLOR)
+
+    levels = bundle.dungeon_levels.items
+    if levels:
+        wall = _sprite(levels[0].wall_tile_with_texture, THUMBNAIL_SCALE, bundle.tileset)
+        floor = _sprite(levels[0].floor_tile_with_texture, THUMBNAIL_SCALE, bundle.tileset)
+        for row in range(room):
+            for column in range(room):
+                border = row in (0, room - 1) or column in (0, room - 1)
+                _draw(canvas, wall if border else floor, row * size, column * size)
+
+    # (linha, coluna) dentro da sala: jogador no centro, o resto nos cantos.
+    placements = [((2, 2), bundle.player.tile_with_texture)]
+    placements.append(((1, 3), bundle.final_objective.tile_with_texture))
+    if bundle.weapons.items:
+        placements.append(((3, 1), bundle.weapons.items[0].tile_with_texture))
+    for position, enemy in zip([(1, 1), (3, 3)], bundle.enemies.items):
+        placements.append((position, enemy.tile_with_texture))
+
+    for (row, column), tile in placements:
+        _draw(canvas, _sprite(tile, THUMBNAIL_SCALE, bundle.tileset), row * size, column * size)
+
+    return canvas
+
+
+RENDERERS = {"preview": render_preview, "thumbnail": render_thumbnail}
+
+
+def _cache_path(bundle_id: int, kind: str) -> str:
+    return join(PREVIEWS_PATH, f"{bundle_id}_{kind}.v{RENDER_VERSION}.png")
+
+
+def get_bundle_image_path(bundle_id: int, kind: str) -> Optional[str]:
+    """
+    Path of the cached render, rendering it first if needed. None when the
+    bundle does not exist.
+    """
+    if kind not in RENDERERS:
+        raise ValueError(f"Invalid preview kind: {kind}")
+
+    path = _cache_path(bundle_id, kind)
+    if exists(path):
+        return path
+
+    bundle = find_bundle_data_by_id(bundle_id)
+    if bundle is None:
+        return None
+
+    png = encode_png(RENDERERS[kind](bundle))
+
+    # Escrita atômica: requisições simultâneas nunca leem um PNG pela metade.
+    os.makedirs(PREVIEWS_PATH, exist_ok=True)
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=PREVIEWS_PATH, suffix=".tmp")
+    with os.fdopen(file_descriptor, "wb") as file:
+        file.write(png)
+    os.replace(temporary_path, path)
+
+    return path
+
+
+def delete_bundle_images(bundle_id: int) -> None:
+    """Removes every cached render of the bundle (any kind or version)."""
+    for path in glob.glob(join(PREVIEWS_PATH, f"{bundle_id}_*.png")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -3,7 +3,7 @@ const TILE_SIZE = 16;      // Tamanho do tile em pixels (16x16)
 const TILE_SPACING = 0;    // Espaço entre tiles no arquivo (Kenny Pack costuma ter 1px)
 const SCALE_FACTOR = 3;    // Fator de escala para visualização (3x maior = 48px)
 
-const tilesetImage = new Image();
+let tilesetImage = new Image();
 let isTilesetLoaded = false;
 
 // 1. Carregar a imagem tileset.png
@@ -36,9 +36,11 @@ fileInput.addEventListener('change', (event) => {
     reader.onload = (e) => {
         try {
             const json = JSON.parse(e.target.result);
-            renderAssetBundle(json);
-            btnSave.disabled = false;
-            updateStatus("JSON processado com sucesso.");
+            loadTileset(json.tileset, () => {
+                renderAssetBundle(json);
+                btnSave.disabled = false;
+                updateStatus("JSON processado com sucesso.");
+            });
         } catch (error) {
             console.error(error);
             alert("Erro ao ler o JSON. Verifique o console.");
@@ -66,6 +68,25 @@ function updateStatus(msg) {
     statusMsg.textContent = msg;
 }
 
+// Tileset do bundle: o padrão fica nesta pasta, os outros são servidos pela API.
+function loadTileset(tileset, onLoad) {
+    const src = (tileset && tileset !== 'default')
+        ? `/tilesets/${encodeURIComponent(tileset)}/tileset.png`
+        : 'tileset.png';
+
+    if (tilesetImage.getAttribute('src') === src && tilesetImage.complete) {
+        onLoad();
+        return;
+    }
+
+    tilesetImage = new Image();
+    tilesetImage.onload = onLoad;
+    tilesetImage.onerror = () => {
+        updateStatus(`Erro ao carregar o tileset '${tileset}'.`);
+    };
+    tilesetImage.src = src;
+}
+
 // 5. Função Utilitária: Snake Case -> Title Case
 function snakeToTitle(str) {
     if (!str) return "";
@@ -0,0 +1,210 @@
+"""
+Tileset sprites: a minimal PNG codec (8-bit RGBA, numpy + zlib) and the
+sprite atlas with only the tiles referenced by a bundle.
+
+The sprites come from the tileset of the bundle (the viewer tileset by
+default), which holds white masks: clients tint them with the tile `color`,
+like public/viewer/index.js does.
+"""
+
+from typing import Dict, Iterable, List, Tuple
+import struct
+import zlib
+
+import numpy as np
+
+from tilesets import DEFAULT_TILESET, get_tileset, tileset_resource
+
+TILESET_PATH = get_tileset(DEFAULT_TILESET).image_path
+TILE_SIZE = 16
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+Position = Tuple[int, int]
+
+
+def _paeth(a: int, b: int, c: int) -> int:
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+def _unfilter(raw: bytes, width: int, height: int, channels: int) -> np.ndarray:
+    stride = width * channels
+    pixels = np.zeros((height, stride), dtype=np.uint8)
+    previous = np.zeros(stride, dtype=np.int32)
+
+    for row in range(height):
+        start = row * (stride + 1)
+        filter_type = raw[start]
+        line = np.frombuffer(raw, dtype=np.uint8, count=stride, offset=start + 1).astype(np.int32)
+
+        if filter_type == 0:
+            current = line
+        elif filter_type == 1:
+            current = line.reshape(width, channels).cumsum(axis=0).ravel() & 0xFF
+        elif filter_type == 2:
+            current = (line + previous) & 0xFF
+        elif filter_type in (3, 4):
+            # Average e Paeth dependem do byte anterior já decodificado da linha.
+            current = line.copy()
+            for i in range(stride):
+                left = current[i - channels] if i >= channels else 0
+                if filter_type == 3:
+                    predictor = (left + previous[i]) // 2
+                else:
+                    up_left = previous[i - channels] if i >= channels else 0
+                    predictor = _paeth(left, previous[i], up_left)
+                current[i] = (current[i] + predictor) & 0xFF
+        else:
+            raise ValueError(f"Invalid PNG filter type: {filter_type}")
+
+        pixels[row] = current
+        previous = current
+
+    return pixels.reshape(height, width, channels)
+
+
+def decode_png(data: bytes) -> np.ndarray:
+    """
+    Decodes a non interlaced 8-bit RGBA/RGB PNG into a (height, width, 4) array.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("Not a PNG file.")
+
+    offset = len(PNG_SIGNATURE)
+    header = None
+    compressed = b""
+
+    while offset < len(data):
+        (length,) = struct.unpack(">I", data[offset : offset + 4])
+        chunk_type = data[offset + 4 : offset + 8]
+        chunk = data[offset + 8 : offset + 8 + length]
+        offset += 12 + length
+
+        if chunk_type == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif chunk_type == b"IDAT":
+            compressed += chunk
+        elif chunk_type == b"IEND":
+            break
+
+    if header is None:
+        raise ValueError("PNG without IHDR chunk.")
+
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if bit_depth != 8 or color_type not in (2, 6) or interlace != 0:
+        raise ValueError("Only non interlaced 8-bit RGB/RGBA PNGs are supported.")
+
+    channels = 4 if color_type == 6 else 3
+    pixels = _unfilter(zlib.decompress(compressed), width, height, channels)
+
+    if channels == 3:
+        alpha = np.full((height, width, 1), 255, dtype=np.uint8)
+        pixels = np.concatenate([pixels, alpha], axis=2)
+
+    return pixels
+
+
+def _chunk(chunk_type: bytes, data: bytes) -> bytes:
+    crc = zlib.crc32(chunk_type + data) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
+
+
+def encode_png(pixels: np.ndarray, compression_level: int = 9) -> bytes:
+    """Encodes a (height, width, 4) uint8 array as an RGBA PNG."""
+    height, width, channels = pixels.shape
+    if channels != 4:
+        raise ValueError("Expected an RGBA (height, width, 4) array.")
+
+    # Filtro 0 (None) em todas as linhas: sprites pixel art comprimem bem assim.
+    rows = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels.astype(np.uint8).reshape(height, width * 4)
+
+    return (
+        PNG_SIGNATURE
+        + _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + _chunk(b"IDAT", zlib.compress(rows.tobytes(), compression_level))
+        + _chunk(b"IEND", b"")
+    )
+
+
+def _load_tileset_pixels(tileset: str) -> np.ndarray:
+    from tile_artifact import get_tile_artifact
+
+    # O tileset já decodificado no artefato é compartilhado entre os workers.
+    artifact = get_tile_artifact(tileset)
+    if artifact is not None:
+        return artifact.tileset
+
+    with open(get_tileset(tileset).image_path, "rb") as file:
+        pixels = decode_png(file.read())
+    pixels.setflags(write=False)
+    return pixels
+
+
+def get_tileset_pixels(tileset: str = DEFAULT_TILESET) -> np.ndarray:
+    return tileset_resource(
+        tileset,
+        "pixels",
+        lambda: _load_tileset_pixels(tileset),
+        # Os pixels mapeados do artefato já contam no tamanho dele.
+        lambda pixels: 0 if isinstance(pixels, np.memmap) else pixels.nbytes,
+    )
+
+
+def get_tile_pixels(x: int, y: int, tileset: str = DEFAULT_TILESET) -> np.ndarray:
+    """Pixels (16, 16, 4) of the tile at the tileset position (x, y)."""
+    pixels = get_tileset_pixels(tileset)
+    top, left = y * TILE_SIZE, x * TILE_SIZE
+
+    if top + TILE_SIZE > pixels.shape[0] or left + TILE_SIZE > pixels.shape[1]:
+        raise ValueError(f"Tile ({x}, {y}) is outside the tileset.")
+
+    return pixels[top : top + TILE_SIZE, left : left + TILE_SIZE]
+
+
+def build_sprite_atlas(
+    positions: Iterable[Position], tileset: str = DEFAULT_TILESET
+) -> Tuple[bytes, List[Position], int]:
+    """
+    Packs the distinct tiles in `positions` (in first use order) into a
+    square-ish PNG grid. Returns (png bytes, tileset position of each sprite,
+    atlas columns); sprite i is at column i % columns, row i // columns.
+    """
+    sprites: Dict[Position, int] = {}
+    for position in positions:
+        sprites.setdefault((int(position[0]), int(position[1])), len(sprites))
+
+    order = list(sprites)
+    columns = max(1, int(np.ceil(np.sqrt(len(order)))))
+    rows = max(1, -(-len(order) // columns))
+
+    atlas = np.zeros((rows * TILE_SIZE, columns * TILE_SIZE, 4), dtype=np.uint8)
+    for index, (x, y) in enumerate(order):
+        top, left = (index // columns) * TILE_SIZE, (index % columns) * TILE_SIZE
+        atlas[top : top + TILE_SIZE, left : left + TILE_SIZE] = get_tile_pixels(x, y, tileset)
+
+    return encode_png(atlas), order, columns
+
+
+def parse_color(color: str) -> Tuple[int, int, int]:
+    """'#RRGGBB' -> (r, g, b); invalid colors fall back to white, like the viewer."""
+    value = color.strip().lstrip("#")
+    if len(value) != 6:
+        return (255, 255, 255)
+    try:
+        return tuple(int(value[i : i + 2], 16) for i in (0, 2, 4))  # type: ignore[return-value]
+    except ValueError:
+        return (255, 255, 255)
+
+
+def tinted_tile(x: int, y: int, color: str, tileset: str = DEFAULT_TILESET) -> np.ndarray:
+    """Tile mask filled with `color` (canvas 'source-in' composition)."""
+    mask = get_tile_pixels(x, y, tileset)
+    tile = np.empty_like(mask)
+    tile[..., :3] = parse_color(color)
+    tile[..., 3] = mask[..., 3]
+    return tile
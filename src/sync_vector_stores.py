@@ -0,0 +1,30 @@
+"""
+Sincroniza os vector stores com os CSVs de tiles_data/.
+
+Apenas tiles novos ou com descrição alterada são embutidos (em lotes); tiles
+removidos do CSV são apagados. Os três stores são processados em paralelo.
+Em seguida o artefato mapeado em memória (tile_artifact.py) é reconstruído.
+Com --tileset, sincroniza os stores de tilesets/<id>/ (ver tilesets.py).
+
+    python sync_vector_stores.py [--tileset default] [--store items] [--batch-size 100]
+"""
+
+import argparse
+
+from tile_artifact import build_tile_artifact
+from tilesets import DEFAULT_TILESET, list_tilesets
+from vector_db import DATABASES, SYNC_BATCH_SIZE, sync_all_vector_stores, sync_vector_store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental vector store sync.")
+    parser.add_argument("--tileset", choices=list_tilesets(), default=DEFAULT_TILESET)
+    parser.add_argument("--store", choices=list(DATABASES.keys()))
+    parser.add_argument("--batch-size", type=int, default=SYNC_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.store:
+        sync_vector_store(args.store, args.batch_size, args.tileset)
+    else:
+        sync_all_vector_stores(args.batch_size, args.tileset)
+
+    build_tile_artifact(tileset=args.tileset)
@@ -0,0 +1,278 @@
+"""
+Batch texture assignment for all tiles of a bundle.
+
+Instead of picking the nearest texture of every tile independently (which
+often gives both enemies, or the walls of both levels, the same sprite), the
+tiles of each store are matched jointly:
+
+1. cached assignments (texture_cache) are reused when they don't collide;
+2. the remaining tiles get their top-k candidates from one batched lexical
+   and/or vector query per store, unless they were retrieved ahead (the
+   generator prefetches them while the LLM is still streaming);
+3. a tiles x candidates similarity matrix is built with numpy and solved as a
+   minimum-cost assignment, so every tile gets a different sprite whenever
+   the store has enough candidates.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import (
+    lexical_confidence_threshold,
+    texture_candidates_per_tile,
+    texture_retriever,
+    unique_textures_per_bundle,
+)
+from lexical_retriever import get_lexical_index
+from metrics import texture_lookup_seconds, texture_retrievals_total
+from models import Tile
+from texture_cache import get_cached_texture, set_cached_texture
+from tilesets import DEFAULT_TILESET
+from vector_db import StoreType, query_vector_store_batch
+
+Position = Tuple[int, int]
+
+
+def linear_sum_assignment(cost: np.ndarray) -> np.ndarray:
+    """
+    Minimum-cost assignment of every row to a distinct column (rows <= columns),
+    using the shortest augmenting path variant of the Hungarian algorithm with
+    the inner loop over columns vectorized. Returns the column of each row.
+    """
+    rows, columns = cost.shape
+    if rows > columns:
+        raise ValueError("The cost matrix needs at least as many columns as rows.")
+
+    u = np.zeros(rows + 1)
+    v = np.zeros(columns + 1)
+    owner = np.zeros(columns + 1, dtype=int)  # owner[j] = row (1-based) on column j
+    way = np.zeros(columns + 1, dtype=int)
+
+    for row in range(1, rows + 1):
+        owner[0] = row
+        current_column = 0
+        min_value = np.full(columns + 1, np.inf)
+        used = np.zeros(columns + 1, dtype=bool)
+
+        while True:
+            used[current_column] = True
+            current_row = owner[current_column]
+
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            free = ~used[1:]
+            improves = free & (reduced < min_value[1:])
+            min_value[1:][improves] = reduced[improves]
+            way[1:][improves] = current_column
+
+            candidates = np.where(free, min_value[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+
+            u[owner[used]] += delta
+            v[used] -= delta
+            min_value[1:][free] -= delta
+
+            current_column = next_column
+            if owner[current_column] == 0:
+                break
+
+        while current_column:
+            previous_column = way[current_column]
+            owner[current_column] = owner[previous_column]
+            current_column = previous_column
+
+    assignment = np.zeros(rows, dtype=int)
+    for column in range(1, columns + 1):
+        if owner[column]:
+            assignment[owner[column] - 1] = column - 1
+
+    return assignment
+
+
+def _solve(scores: np.ndarray, unique: bool) -> np.ndarray:
+    """Column of each row maximizing the total score."""
+    rows, columns = scores.shape
+
+    if not unique:
+        return scores.argmax(axis=1)
+
+    # Sem candidatos suficientes, cada candidato é repetido com uma pequena
+    # penalidade, para que uma textura só se repita quando for inevitável.
+    copies = -(-rows // columns)
+    penalties = np.repeat(np.arange(copies) * 1e-3, columns)
+    expanded = np.tile(scores, (1, copies)) - penalties
+
+    return linear_sum_assignment(-expanded) % columns
+
+
+def _texture(candidate: dict) -> dict:
+    return {"x": candidate["x"], "y": candidate["y"], "description": candidate["description"]}
+
+
+def retrieve_candidates(
+    descriptions: List[str], store_type: StoreType, tileset: str = DEFAULT_TILESET
+) -> List[dict]:
+    """
+    Candidate textures of each description, as {"lexical", "matches",
+    "embedding"}: the lexical top-k when it is confident, otherwise the vector
+    top-k (one batched query) and the query embedding. This is the I/O part
+    of the assignment, so it can run ahead of it (see assign_textures).
+    """
+    index = get_lexical_index(store_type, tileset)
+    k = texture_candidates_per_tile
+
+    retrieved: List[dict] = []
+    vector_rows: List[int] = []
+
+    for row, description in enumerate(descriptions):
+        matches = index.search(description, k) if texture_retriever != "vector" else []
+        use_lexical = bool(matches) and (
+            texture_retriever == "lexical"
+            or matches[0]["confidence"] >= lexical_confidence_threshold
+        )
+        retrieved.append(
+            {"lexical": use_lexical, "matches": matches if use_lexical else [], "embedding": None}
+        )
+        if not use_lexical:
+            vector_rows.append(row)
+
+    if vector_rows:
+        query_embeddings, vector_candidates = query_vector_store_batch(
+            [descriptions[row] for row in vector_rows], store_type, k, tileset
+        )
+        for row, embedding, matches in zip(vector_rows, query_embeddings, vector_candidates):
+            retrieved[row]["matches"] = matches
+            retrieved[row]["embedding"] = embedding
+
+    lexical_count = len(descriptions) - len(vector_rows)
+    texture_retrievals_total.inc(lexical_count, store_type=store_type, retriever="lexical")
+    texture_retrievals_total.inc(len(vector_rows), store_type=store_type, retriever="vector")
+
+    return retrieved
+
+
+def _assign_store(
+    tiles: List[Tile],
+    store_type: StoreType,
+    taken: set,
+    unique: bool,
+    retrieved: List[dict],
+    tileset: str,
+) -> List[dict]:
+    """Assigns textures to the (uncached) tiles of one store."""
+    index = get_lexical_index(store_type, tileset)
+    descriptions = [tile.description for tile in tiles]
+
+    candidates: Dict[Position, dict] = {}
+    for entry in retrieved:
+        for match in entry["matches"]:
+            if entry["lexical"]:
+                candidates.setdefault((match["x"], match["y"]), match)
+            else:
+                candidates.setdefault((match["x"], match["y"]), {}).update(match)
+
+    lexical_rows = [row for row, entry in enumerate(retrieved) if entry["lexical"]]
+    vector_rows = [row for row, entry in enumerate(retrieved) if not entry["lexical"]]
+    query_embeddings = [retrieved[row]["embedding"] for row in vector_rows]
+
+    available = [position for position in candidates if position not in taken]
+    positions = available or list(candidates)
+    if not positions:
+        raise ValueError(f"No texture candidates found in store '{store_type}'.")
+
+    scores = np.zeros((len(tiles), len(positions)))
+
+    # Linhas lexicais: confiança BM25 contra todos os candidatos.
+    for row in lexical_rows:
+        bm25 = index.scores(descriptions[row])
+        upper_bound = index.max_score(descriptions[row]) or 1.0
+        for column, position in enumerate(positions):
+            document = index.position_index.get(position)
+            if document is not None:
+                scores[row, column] = bm25.get(document, 0.0) / upper_bound
+
+    # Linhas vetoriais: similaridade cosseno contra os candidatos com embedding.
+    embedded_columns = [
+        column for column, position in enumerate(positions) if candidates[position].get("embedding")
+    ]
+    if vector_rows and embedded_columns:
+        embedded = np.array(
+            [candidates[positions[column]]["embedding"] for column in embedded_columns]
+        )
+        embedded /= np.linalg.norm(embedded, axis=1, keepdims=True) + 1e-12
+        queries = np.array(query_embeddings, dtype=float)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12
+        scores[np.ix_(vector_rows, embedded_columns)] = queries @ embedded.T
+
+    assignment = _solve(scores, unique)
+    best = scores.argmax(axis=1)
+
+    textures = []
+    for row, column in enumerate(assignment):
+        texture = _texture(candidates[positions[column]])
+        taken.add(positions[column])
+        # Só memoriza a melhor textura da descrição, não a escolhida por diversidade.
+        if scores[row, column] >= scores[row, best[row]]:
+            set_cached_texture(descriptions[row], store_type, texture, tileset)
+        textures.append(texture)
+
+    return textures
+
+
+def assign_textures(
+    requests: List[Tuple[Tile, StoreType]],
+    unique: Optional[bool] = None,
+    reserved: Optional[Dict[str, Set[Position]]] = None,
+    retrieved: Optional[Dict[Tuple[str, str], dict]] = None,
+    tileset: str = DEFAULT_TILESET,
+) -> List[dict]:
+    """
+    Returns the texture ({"x", "y", "description"}) of each (tile, store_type)
+    pair from the stores of `tileset`, solving the tiles of each store jointly.
+    `reserved` holds positions already used by the rest of the bundle (by
+    store), avoided when unique. `retrieved` holds candidates fetched ahead
+    with retrieve_candidates, by (store_type, description); the other tiles
+    are retrieved here.
+    """
+    unique = unique_textures_per_bundle if unique is None else unique
+    textures: List[Optional[dict]] = [None] * len(requests)
+
+    by_store: Dict[str, List[int]] = {}
+    for i, (_, store_type) in enumerate(requests):
+        by_store.setdefault(store_type, []).append(i)
+
+    for store_type, indexes in by_store.items():
+        with texture_lookup_seconds.time(store_type=store_type):
+            taken: set = set((reserved or {}).get(store_type, ()))
+            pending: List[int] = []
+
+            for i in indexes:
+                cached = get_cached_texture(requests[i][0].description, store_type, tileset)  # type: ignore[arg-type]
+                position = (cached["x"], cached["y"]) if cached else None
+
+                if cached and not (unique and position in taken):
+                    textures[i] = cached
+                    taken.add(position)
+                else:
+                    pending.append(i)
+
+            if pending:
+                known = retrieved or {}
+                descriptions = [requests[i][0].description for i in pending]
+                missing = list(
+                    dict.fromkeys(d for d in descriptions if (store_type, d) not in known)
+                )
+                fetched = dict(zip(missing, retrieve_candidates(missing, store_type, tileset)))  # type: ignore[arg-type]
+                assigned = _assign_store(
+                    [requests[i][0] for i in pending],
+                    store_type,  # type: ignore[arg-type]
+                    taken,
+                    unique,
+                    [known.get((store_type, d)) or fetched[d] for d in descriptions],
+                    tileset,
+                )
+                for i, texture in zip(pending, assigned):
+                    textures[i] = texture
+
+    return textures  # type: ignore[return-value]
@@ -0,0 +1,146 @@
+"""
+Memoized description -> texture assignments.
+
+Tile descriptions repeat a lot across bundles ("cracked stone floor",
+"rusted iron door"), so the texture chosen for a normalized description and
+store type is kept in memory (LRU) and in the `texture_cache` table. Entries
+carry the store fingerprint written by the last vector store sync, plus the
+retriever settings, so rebuilding a store invalidates them automatically.
+
+The stores of other tilesets than the default are cached under the key
+"<tileset>/<store_type>" (the `store_type` column of the table).
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import threading
+
+from config import (
+    lexical_confidence_threshold,
+    texture_cache_enabled,
+    texture_cache_memory_entries,
+    texture_retriever,
+)
+from db import (
+    count_texture_cache_entries,
+    delete_stale_texture_cache_entries,
+    find_texture_cache_entry,
+    upsert_texture_cache_entry,
+)
+from lexical_retriever import tokenize
+from metrics import texture_cache_lookups_total
+from tilesets import DEFAULT_TILESET
+from vector_db import DATABASES, StoreType, get_store_fingerprint
+
+_memory: "OrderedDict[Tuple[str, str], Tuple[str, dict]]" = OrderedDict()
+_lock = threading.Lock()
+_purged_fingerprints: Dict[str, str] = {}
+
+
+def normalize_description(description: str) -> str:
+    """
+    Chave do cache: termos relevantes, sem plural simples, ordenados e sem
+    repetição ("Cracked stone floors" == "floor of cracked stone").
+    """
+    return " ".join(sorted(set(tokenize(description))))
+
+
+def _store_key(store_type: StoreType, tileset: str) -> str:
+    return store_type if tileset == DEFAULT_TILESET else f"{tileset}/{store_type}"
+
+
+def _current_fingerprint(store_type: StoreType, tileset: str) -> str:
+    store_key = _store_key(store_type, tileset)
+    fingerprint = (
+        f"{get_store_fingerprint(store_type, tileset)}:"
+        f"{texture_retriever}:{lexical_confidence_threshold}"
+    )
+
+    # Primeira consulta com um store novo: descarta as entradas antigas.
+    if _purged_fingerprints.get(store_key) != fingerprint:
+        delete_stale_texture_cache_entries(store_key, fingerprint)
+        _purged_fingerprints[store_key] = fingerprint
+
+    return fingerprint
+
+
+def get_cached_texture(
+    description: str, store_type: StoreType, tileset: str = DEFAULT_TILESET
+) -> Optional[dict]:
+    """
+    Retorna {"x", "y", "description"} da textura em cache, ou None.
+    """
+    if not texture_cache_enabled:
+        return None
+
+    store_key = _store_key(store_type, tileset)
+    key = (normalize_description(description), store_key)
+    fingerprint = _current_fingerprint(store_type, tileset)
+
+    with _lock:
+        cached = _memory.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            _memory.move_to_end(key)
+            texture_cache_lookups_total.inc(store_type=store_key, result="memory_hit")
+            return cached[1]
+
+    row = find_texture_cache_entry(key[0], store_key, fingerprint)
+
+    if row is None:
+        texture_cache_lookups_total.inc(store_type=store_key, result="miss")
+        return None
+
+    texture = {"x": row["x"], "y": row["y"], "description": row["tileset_description"]}
+    _remember(key, fingerprint, texture)
+    texture_cache_lookups_total.inc(store_type=store_key, result="db_hit")
+
+    return texture
+
+
+def set_cached_texture(
+    description: str, store_type: StoreType, texture: dict, tileset: str = DEFAULT_TILESET
+) -> None:
+    if not texture_cache_enabled:
+        return
+
+    store_key = _store_key(store_type, tileset)
+    key = (normalize_description(description), store_key)
+    fingerprint = _current_fingerprint(store_type, tileset)
+    texture = {"x": texture["x"], "y": texture["y"], "description": texture["description"]}
+
+    _remember(key, fingerprint, texture)
+    upsert_texture_cache_entry(
+        key[0], store_key, fingerprint, texture["x"], texture["y"], texture["description"]
+    )
+
+
+def _remember(key: Tuple[str, str], fingerprint: str, texture: dict) -> None:
+    with _lock:
+        _memory[key] = (fingerprint, texture)
+        _memory.move_to_end(key)
+        while len(_memory) > texture_cache_memory_entries:
+            _memory.popitem(last=False)
+
+
+def get_texture_cache_stats() -> dict:
+    """Hit rate por store desde o início do processo e entradas persistidas."""
+    entries = count_texture_cache_entries()
+    stats = {}
+
+    # Stores do tileset padrão, depois os dos outros tilesets com entradas.
+    for store_type in dict.fromkeys([*DATABASES, *entries]):
+        counts = {
+            result: texture_cache_lookups_total.value(store_type=store_type, result=result)
+            for result in ("memory_hit", "db_hit", "miss")
+        }
+        lookups = sum(counts.values())
+        hits = counts["memory_hit"] + counts["db_hit"]
+
+        stats[store_type] = {
+            **{key: int(value) for key, value in counts.items()},
+            "lookups": int(lookups),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "persisted_entries": entries.get(store_type, 0),
+        }
+
+    return stats
@@ -0,0 +1,330 @@
+"""
+Read-only tile data compiled into memory-mapped files.
+
+Every API worker used to parse the tile CSVs (base64 images included), open
+its own Chroma clients and decode tileset.png. The artifact stores the same
+data as flat .npy/.bin files that each worker maps with `np.load(mmap_mode="r")`,
+so the pages live once in the OS page cache and are shared by all workers:
+
+    positions.npy            (n, 2) int16, tileset x/y of each tile
+    categories.npy           (n,) uint8, index into manifest["categories"]
+    descriptions.bin         utf-8 descriptions, sliced by description_offsets.npy
+    images.bin               raw PNG bytes of each tile, sliced by image_offsets.npy
+    embeddings.npy           (n, d) float32, normalized description embeddings
+    has_embedding.npy        (n,) bool, False where the store had no vector
+    tileset.npy              decoded viewer tileset (sprite masks)
+    manifest.json            version, sources (CSV hashes, store fingerprints)
+
+The artifact is rebuilt from tiles_data/ and the Chroma stores by
+
+    python tile_artifact.py [--tileset <id>]
+
+(also run by sync_vector_stores.py), or automatically on first use when its
+sources changed. Each tileset has its own artifact (see tilesets.py). Builds
+are written to a temporary folder and swapped in, so workers that still map
+the previous files keep working.
+"""
+
+from os.path import exists, join
+from typing import Dict, List, Optional, Tuple
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from config import tile_artifact_auto_build, tile_artifact_enabled
+from sprites import decode_png
+from tilesets import (
+    DEFAULT_TILESET,
+    forget_tileset_resource,
+    get_tileset,
+    loaded_tileset_resource,
+    tileset_resource,
+)
+
+logger = logging.getLogger(__name__)
+
+TILE_ARTIFACT_PATH = get_tileset(DEFAULT_TILESET).artifact_path
+ARTIFACT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _current_sources(tileset: str) -> dict:
+    from vector_db import get_store_fingerprint
+
+    databases = get_tileset(tileset).databases
+    return {
+        "version": ARTIFACT_VERSION,
+        "csv_hashes": {
+            store_type: _file_hash(config["csv_path"]) for store_type, config in databases.items()
+        },
+        "store_fingerprints": {
+            store_type: get_store_fingerprint(store_type, tileset)  # type: ignore[arg-type]
+            for store_type in databases
+        },
+        "tileset_hash": _file_hash(get_tileset(tileset).image_path),
+    }
+
+
+def _store_embeddings(store_type: str, tileset: str) -> Dict[Tuple[int, int], List[float]]:
+    """Vectors already indexed in the Chroma store, by tileset position."""
+    from langchain_chroma import Chroma
+
+    db_config = get_tileset(tileset).databases[store_type]
+    vector_store = loaded_tileset_resource(tileset, f"store:{store_type}")
+    opened = vector_store is None
+    if opened:
+        if not exists(db_config["db_path"]):
+            return {}
+        # Só leitura dos vetores: não precisa do modelo de embedding.
+        vector_store = Chroma(
+            collection_name=db_config["collection_name"],
+            persist_directory=db_config["db_path"],
+        )
+
+    try:
+        indexed = vector_store._collection.get(include=["embeddings", "metadatas"])  # type: ignore[list-item]
+    finally:
+        if opened:
+            vector_store._client.close()
+    return {
+        (int(metadata["x"]), int(metadata["y"])): embedding  # type: ignore[arg-type]
+        for metadata, embedding in zip(indexed["metadatas"], indexed["embeddings"])  # type: ignore[arg-type]
+    }
+
+
+def _pack(values: List[bytes]) -> Tuple[bytes, np.ndarray]:
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in values])
+    return b"".join(values), offsets
+
+
+def build_tile_artifact(path: Optional[str] = None, tileset: str = DEFAULT_TILESET) -> dict:
+    """
+    Compiles tiles_data/, the Chroma vectors and tileset.png of the tileset
+    into `path` (by default, its tile_artifact/ folder).
+    """
+    path = path or get_tileset(tileset).artifact_path
+    databases = get_tileset(tileset).databases
+    sources = _current_sources(tileset)
+    categories = list(databases)
+
+    positions, category_ids, descriptions, images, vectors = [], [], [], [], []
+    for category_id, (store_type, db_config) in enumerate(databases.items()):
+        store_vectors = _store_embeddings(store_type, tileset)
+        df_tiles = pd.read_csv(db_config["csv_path"])
+
+        for record in df_tiles[["x", "y", "base64", "description"]].itertuples(index=False):
+            x, y = int(record.x), int(record.y)
+            positions.append((x, y))
+            category_ids.append(category_id)
+            descriptions.append(str(record.description).encode("utf-8"))
+            images.append(base64.b64decode(str(record.base64).split(",", 1)[-1]))
+            vectors.append(store_vectors.get((x, y)))
+
+    dimensions = max((len(vector) for vector in vectors if vector is not None), default=0)
+    embeddings = np.zeros((len(vectors), dimensions), dtype=np.float32)
+    has_embedding = np.zeros(len(vectors), dtype=bool)
+    for i, vector in enumerate(vectors):
+        if vector is not None and len(vector) == dimensions:
+            embeddings[i] = vector
+            has_embedding[i] = True
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
+
+    with open(get_tileset(tileset).image_path, "rb") as file:
+        tileset_pixels = decode_png(file.read())
+
+    parent = os.path.dirname(path)
+    temporary_path = tempfile.mkdtemp(dir=parent, prefix=".tile_artifact_")
+
+    description_bytes, description_offsets = _pack(descriptions)
+    image_bytes, image_offsets = _pack(images)
+
+    np.save(join(temporary_path, "positions.npy"), np.array(positions, dtype=np.int16).reshape(-1, 2))
+    np.save(join(temporary_path, "categories.npy"), np.array(category_ids, dtype=np.uint8))
+    np.save(join(temporary_path, "description_offsets.npy"), description_offsets)
+    np.save(join(temporary_path, "image_offsets.npy"), image_offsets)
+    np.save(join(temporary_path, "embeddings.npy"), embeddings)
+    np.save(join(temporary_path, "has_embedding.npy"), has_embedding)
+    np.save(join(temporary_path, "tileset.npy"), tileset_pixels)
+    with open(join(temporary_path, "descriptions.bin"), "wb") as file:
+        file.write(description_bytes)
+    with open(join(temporary_path, "images.bin"), "wb") as file:
+        file.write(image_bytes)
+
+    manifest = {
+        **sources,
+        "categories": categories,
+        "tiles": len(positions),
+        "dimensions": dimensions,
+        "embedded_tiles": int(has_embedding.sum()),
+    }
+    with open(join(temporary_path, MANIFEST_FILE), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+
+    # Troca atômica do diretório; quem mapeia os arquivos antigos não é afetado.
+    old_path = None
+    if exists(path):
+        old_path = tempfile.mkdtemp(dir=parent, prefix=".tile_artifact_old_")
+        os.rmdir(old_path)
+        os.rename(path, old_path)
+    os.rename(temporary_path, path)
+    if old_path:
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    return manifest
+
+
+class TileArtifact:
+    """Memory-mapped view of a built artifact."""
+
+    def __init__(self, path: str) -> None:
+        with open(join(path, MANIFEST_FILE), "r", encoding="utf-8") as file:
+            self.manifest = json.load(file)
+        self.path = path
+
+        def load(name: str) -> np.ndarray:
+            return np.load(join(path, name), mmap_mode="r")
+
+        self.categories: List[str] = self.manifest["categories"]
+        self.positions = load("positions.npy")
+        self.category_ids = load("categories.npy")
+        self.embeddings = load("embeddings.npy")
+        self.has_embedding = load("has_embedding.npy")
+        self.tileset = load("tileset.npy")
+        self._description_offsets = load("description_offsets.npy")
+        self._image_offsets = load("image_offsets.npy")
+        self._descriptions = self._map_bytes(join(path, "descriptions.bin"))
+        self._images = self._map_bytes(join(path, "images.bin"))
+
+        self._rows: Dict[str, np.ndarray] = {
+            category: np.flatnonzero(np.asarray(self.category_ids) == category_id)
+            for category_id, category in enumerate(self.categories)
+        }
+
+    @staticmethod
+    def _map_bytes(file_path: str) -> np.ndarray:
+        # np.memmap não aceita arquivos vazios.
+        if os.path.getsize(file_path) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(file_path, dtype=np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def estimated_bytes(self) -> int:
+        """Size of the mapped files (resident once their pages are read)."""
+        return sum(
+            entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file()
+        )
+
+    def rows(self, store_type: str) -> np.ndarray:
+        return self._rows.get(store_type, np.zeros(0, dtype=np.int64))
+
+    def description(self, row: int) -> str:
+        start, end = self._description_offsets[row], self._description_offsets[row + 1]
+        return bytes(self._descriptions[start:end]).decode("utf-8")
+
+    def image(self, row: int) -> bytes:
+        """Raw PNG bytes of the tile."""
+        start, end = self._image_offsets[row], self._image_offsets[row + 1]
+        return bytes(self._images[start:end])
+
+    def has_store_embeddings(self, store_type: str) -> bool:
+        rows = self.rows(store_type)
+        return len(rows) > 0 and bool(np.asarray(self.has_embedding)[rows].all())
+
+    def search(
+        self, query_embeddings: np.ndarray, store_type: str, k: int
+    ) -> List[List[Tuple[int, float]]]:
+        """Top-k (row, cosine) of the store for each query embedding."""
+        rows = self.rows(store_type)
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True) + 1e-12
+
+        scores = queries @ self.embeddings[rows].T
+        k = min(k, len(rows))
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        results = []
+        for query_scores, query_best in zip(scores, best):
+            ordered = query_best[np.argsort(-query_scores[query_best])]
+            results.append([(int(rows[i]), float(query_scores[i])) for i in ordered])
+        return results
+
+
+def _is_current(path: str, tileset: str) -> bool:
+    try:
+        with open(join(path, MANIFEST_FILE), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return False
+
+    sources = _current_sources(tileset)
+    return all(manifest.get(key) == value for key, value in sources.items())
+
+
+def _load_tile_artifact(tileset: str) -> Optional[TileArtifact]:
+    path = get_tileset(tileset).artifact_path
+
+    try:
+        if not _is_current(path, tileset):
+            if not tile_artifact_auto_build:
+                logger.warning(
+                    f"Tile artifact of '{tileset}' missing or stale; "
+                    f"run `python tile_artifact.py --tileset {tileset}`."
+                )
+                return None
+            logger.info(f"Building tile artifact of '{tileset}'...")
+            build_tile_artifact(tileset=tileset)
+        return TileArtifact(path)
+    except Exception as e:
+        logger.warning(f"Tile artifact of '{tileset}' unavailable: {e}")
+        return None
+
+
+def get_tile_artifact(tileset: str = DEFAULT_TILESET) -> Optional[TileArtifact]:
+    """
+    The mapped artifact of the tileset in this process, (re)built when missing
+    or stale and auto build is enabled. None when disabled or unavailable.
+    """
+    if not tile_artifact_enabled:
+        return None
+
+    return tileset_resource(
+        tileset, "artifact", lambda: _load_tile_artifact(tileset), TileArtifact.estimated_bytes
+    )
+
+
+def reset_tile_artifact(tileset: str = DEFAULT_TILESET) -> None:
+    """Forgets the mapped artifact, so the next use checks the sources again."""
+    forget_tileset_resource(tileset, "artifact")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the tile artifact of a tileset.")
+    parser.add_argument("--tileset", default=DEFAULT_TILESET)
+    args = parser.parse_args()
+
+    manifest = build_tile_artifact(tileset=args.tileset)
+    reset_tile_artifact(args.tileset)
+    print(
+        f"Tile artifact built at {get_tileset(args.tileset).artifact_path}: "
+        f"{manifest['tiles']} tiles, {manifest['embedded_tiles']} with embeddings "
+        f"({manifest['dimensions']} dims)."
+    )
@@ -0,0 +1,225 @@
+"""
+Compact in-memory catalogue of every tile in tiles_data/.
+
+Replaces the pandas DataFrame (`full_csv`) whose largest column was a base64
+data-URI string per tile stored as Python objects. The catalogue keeps
+parallel arrays (numpy positions, a categorical category code, interned
+descriptions) and the images as raw PNG bytes, read from the memory-mapped
+tile artifact when it is available. Lookups return `TileRecord`s, small
+`__slots__` views that only build the base64 data URI when it is asked for.
+
+Built from the artifact the catalogue holds little more than the descriptions,
+about a tenth of the DataFrame heap (see the benchmark). The CSV fallback, used
+when the artifact is disabled or fails to build, also keeps every PNG in the
+heap: roughly half of the DataFrame, not the small fraction of the artifact.
+
+Each tileset has its own catalogue (see tilesets.py).
+
+    python -m benchmarks.memory   # heap cost compared with the DataFrame
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+import base64
+import logging
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from tilesets import DEFAULT_TILESET, get_tileset, tileset_resource
+
+logger = logging.getLogger(__name__)
+
+DATA_URI_PREFIX = "data:image/png;base64,"
+
+
+def _position_key(x: Any, y: Any) -> Any:
+    # x e y cabem em 16 bits (int16 no catálogo e no artefato).
+    return (x << 16) | (y & 0xFFFF)
+
+
+class TileRecord:
+    """
+    One tile of the catalogue. Supports the dict access used with the old
+    DataFrame records (`tile["description"]`, `tile["base64"]`, `tile.get(...)`).
+    """
+
+    __slots__ = ("_catalogue", "row")
+
+    def __init__(self, catalogue: "TileCatalogue", row: int) -> None:
+        self._catalogue = catalogue
+        self.row = row
+
+    @property
+    def x(self) -> int:
+        return int(self._catalogue.xs[self.row])
+
+    @property
+    def y(self) -> int:
+        return int(self._catalogue.ys[self.row])
+
+    @property
+    def category(self) -> str:
+        return self._catalogue.categories[self._catalogue.category_codes[self.row]]
+
+    @property
+    def description(self) -> str:
+        return self._catalogue.descriptions[self.row]
+
+    @property
+    def image(self) -> bytes:
+        """Raw PNG bytes."""
+        return self._catalogue.image(self.row)
+
+    @property
+    def base64(self) -> str:
+        return DATA_URI_PREFIX + base64.b64encode(self.image).decode("ascii")
+
+    _FIELDS = ("x", "y", "base64", "description", "category")
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self._FIELDS else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self._FIELDS}
+
+    def __repr__(self) -> str:
+        return f"TileRecord(x={self.x}, y={self.y}, category={self.category!r})"
+
+
+class PackedImages:
+    """PNG bytes of every tile concatenated in one buffer, sliced by offsets."""
+
+    def __init__(self, images: List[bytes]) -> None:
+        self._offsets = np.zeros(len(images) + 1, dtype=np.int64)
+        self._offsets[1:] = np.cumsum([len(image) for image in images])
+        self._buffer = b"".join(images)
+
+    def image(self, row: int) -> bytes:
+        return self._buffer[self._offsets[row] : self._offsets[row + 1]]
+
+    def estimated_bytes(self) -> int:
+        return len(self._buffer) + self._offsets.nbytes
+
+
+class TileCatalogue:
+    def __init__(
+        self,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        category_codes: np.ndarray,
+        categories: Sequence[str],
+        descriptions: List[str],
+        images: Any,
+    ) -> None:
+        self.xs = xs
+        self.ys = ys
+        self.category_codes = category_codes
+        self.categories = tuple(categories)
+        # Descrições repetidas (mesmo tile em mais de uma categoria) viram um só objeto.
+        self.descriptions = [sys.intern(description) for description in descriptions]
+        # PackedImages ou o artefato mapeado: ambos com .image(row).
+        self._images = images
+
+        # Posição -> linhas por busca binária em chaves ordenadas: um dicionário
+        # de listas custava ~200 bytes por posição.
+        keys = _position_key(np.asarray(xs, dtype=np.int64), np.asarray(ys, dtype=np.int64))
+        self._rows_by_key = np.argsort(keys, kind="stable").astype(np.int32)
+        self._sorted_keys = keys[self._rows_by_key]
+
+    @classmethod
+    def from_artifact(cls, artifact) -> "TileCatalogue":
+        return cls(
+            xs=artifact.positions[:, 0],
+            ys=artifact.positions[:, 1],
+            category_codes=artifact.category_ids,
+            categories=artifact.categories,
+            descriptions=[artifact.description(row) for row in range(len(artifact))],
+            images=artifact,
+        )
+
+    @classmethod
+    def from_csvs(cls, csv_paths: Dict[str, str]) -> "TileCatalogue":
+        xs, ys, codes, descriptions, images = [], [], [], [], []
+
+        for code, (category, csv_path) in enumerate(csv_paths.items()):
+            if not os.path.exists(csv_path):
+                logger.warning(f"Tile CSV not found: {csv_path}")
+                continue
+            df_tiles = pd.read_csv(csv_path, usecols=["x", "y", "base64", "description"])
+            for record in df_tiles.itertuples(index=False):
+                xs.append(record.x)
+                ys.append(record.y)
+                codes.append(code)
+                descriptions.append(str(record.description))
+                images.append(base64.b64decode(str(record.base64).split(",", 1)[-1]))
+
+        return cls(
+            xs=np.array(xs, dtype=np.int16),
+            ys=np.array(ys, dtype=np.int16),
+            category_codes=np.array(codes, dtype=np.uint8),
+            categories=list(csv_paths),
+            descriptions=descriptions,
+            images=PackedImages(images),
+        )
+
+    def __len__(self) -> int:
+        return len(self.descriptions)
+
+    def estimated_bytes(self) -> int:
+        """Heap held by the catalogue (the images of the artifact are mapped, not counted)."""
+        arrays = sum(
+            np.asarray(array).nbytes for array in (self.xs, self.ys, self.category_codes)
+        )
+        arrays += self._rows_by_key.nbytes + self._sorted_keys.nbytes
+        descriptions = sum(sys.getsizeof(description) for description in set(self.descriptions))
+        images = self._images.estimated_bytes() if isinstance(self._images, PackedImages) else 0
+        return arrays + descriptions + images
+
+    def __iter__(self) -> Iterator[TileRecord]:
+        return (TileRecord(self, row) for row in range(len(self)))
+
+    def image(self, row: int) -> bytes:
+        return self._images.image(row)
+
+    def at(self, x: int, y: int) -> List[TileRecord]:
+        key = _position_key(int(x), int(y))
+        start, end = np.searchsorted(self._sorted_keys, (key, key + 1)).tolist()
+        return [TileRecord(self, row) for row in self._rows_by_key[start:end].tolist()]
+
+    def records(self, category: Optional[str] = None) -> List[TileRecord]:
+        if category is None:
+            return list(self)
+        code = self.categories.index(category)
+        rows = np.flatnonzero(np.asarray(self.category_codes) == code)
+        return [TileRecord(self, int(row)) for row in rows]
+
+
+def _load_tile_catalogue(tileset: str) -> TileCatalogue:
+    from tile_artifact import get_tile_artifact
+
+    artifact = get_tile_artifact(tileset)
+    if artifact is not None:
+        return TileCatalogue.from_artifact(artifact)
+    return TileCatalogue.from_csvs(
+        {
+            category: config["csv_path"]
+            for category, config in get_tileset(tileset).databases.items()
+        }
+    )
+
+
+def get_tile_catalogue(tileset: str = DEFAULT_TILESET) -> TileCatalogue:
+    """Catalogue of the tileset in this process, built from the artifact or from the CSVs."""
+    return tileset_resource(
+        tileset,
+        "catalogue",
+        lambda: _load_tile_catalogue(tileset),
+        TileCatalogue.estimated_bytes,
+    )
@@ -0,0 +1,220 @@
+"""
+Tilesets (art styles) and the data each process loads from them.
+
+The default tileset keeps the original layout of src/ (public/viewer/tileset.png,
+tiles_data/, chroma_*_db/, tile_artifact/). Every folder tilesets/<id>/ with a
+tileset.png is another registered tileset, with the same layout inside it:
+
+    tilesets/<id>/tileset.png
+    tilesets/<id>/tiles_data/{items,environment,entities}_data.csv
+    tilesets/<id>/chroma_{items,environments,entities}_db/   (sync_vector_stores.py --tileset <id>)
+    tilesets/<id>/tile_artifact/                              (built on first use)
+
+What a process derives from a tileset (Chroma clients, tile catalogue, BM25
+indexes, mapped artifact, decoded pixels) is created on first use through
+`tileset_resource` and kept in an LRU of tilesets: once the estimated size of
+the loaded tilesets exceeds `config.tileset_memory_budget_mb`, the least
+recently used ones are dropped and loaded again on their next request.
+Requests still running on a dropped tileset keep its objects until they end.
+"""
+
+from collections import OrderedDict
+from os.path import exists, join
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+import os
+import re
+import threading
+
+from config import tileset_memory_budget_mb
+from metrics import tileset_events_total
+from utils import MAIN_PATH
+
+T = TypeVar("T")
+
+DEFAULT_TILESET = "default"
+TILESETS_PATH = join(MAIN_PATH, "tilesets")
+TILESET_IMAGE = "tileset.png"
+
+# Ids viram nomes de pasta: nada de "..", barras ou maiúsculas.
+TILESET_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+
+def _databases(root: str) -> Dict[str, Dict[str, str]]:
+    return {
+        "items": {
+            "csv_path": join(root, "tiles_data", "items_data.csv"),
+            "db_path": join(root, "chroma_items_db"),
+            "collection_name": "Items_Descriptions",
+        },
+        "environments": {
+            "csv_path": join(root, "tiles_data", "environment_data.csv"),
+            "db_path": join(root, "chroma_environments_db"),
+            "collection_name": "Environments_Descriptions",
+        },
+        "entities": {
+            "csv_path": join(root, "tiles_data", "entities_data.csv"),
+            "db_path": join(root, "chroma_entities_db"),
+            "collection_name": "Entities_Descriptions",
+        },
+    }
+
+
+# Stores do tileset padrão (também exportado como vector_db.DATABASES).
+DATABASES = _databases(MAIN_PATH)
+
+
+class Tileset:
+    """Paths of one registered tileset."""
+
+    def __init__(self, id: str, root: str, image_path: str) -> None:
+        self.id = id
+        self.root = root
+        self.image_path = image_path
+        self.databases = DATABASES if id == DEFAULT_TILESET else _databases(root)
+        self.artifact_path = join(root, "tile_artifact")
+
+    def __repr__(self) -> str:
+        return f"Tileset({self.id!r})"
+
+
+_tilesets: Dict[str, Tileset] = {
+    DEFAULT_TILESET: Tileset(
+        DEFAULT_TILESET, MAIN_PATH, join(MAIN_PATH, "public", "viewer", TILESET_IMAGE)
+    )
+}
+
+
+def is_registered(tileset_id: str) -> bool:
+    return tileset_id in _tilesets or (
+        bool(TILESET_ID_PATTERN.match(tileset_id))
+        and exists(join(TILESETS_PATH, tileset_id, TILESET_IMAGE))
+    )
+
+
+def get_tileset(tileset_id: str = DEFAULT_TILESET) -> Tileset:
+    """The registered tileset `tileset_id`; ValueError when there is none."""
+    tileset = _tilesets.get(tileset_id)
+    if tileset is None:
+        if not is_registered(tileset_id):
+            raise ValueError(f"Unknown tileset: {tileset_id}")
+        root = join(TILESETS_PATH, tileset_id)
+        tileset = _tilesets.setdefault(
+            tileset_id, Tileset(tileset_id, root, join(root, TILESET_IMAGE))
+        )
+    return tileset
+
+
+def list_tilesets() -> List[str]:
+    tileset_ids = [DEFAULT_TILESET]
+    if exists(TILESETS_PATH):
+        tileset_ids += sorted(
+            name
+            for name in os.listdir(TILESETS_PATH)
+            if name != DEFAULT_TILESET and is_registered(name)
+        )
+    return tileset_ids
+
+
+################################################################################
+# Recursos carregados por tileset (LRU com orçamento de memória)
+################################################################################
+
+
+class _LoadedTileset:
+    def __init__(self) -> None:
+        self.resources: Dict[str, Any] = {}
+        self.sizes: Dict[str, int] = {}
+        # Um lock por tileset: carregar um tileset não bloqueia os outros.
+        self.lock = threading.RLock()
+
+    def size(self) -> int:
+        return sum(self.sizes.values())
+
+
+_loaded: "OrderedDict[str, _LoadedTileset]" = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+def _entry(tileset_id: str) -> _LoadedTileset:
+    get_tileset(tileset_id)
+
+    with _loaded_lock:
+        entry = _loaded.get(tileset_id)
+        if entry is None:
+            entry = _loaded[tileset_id] = _LoadedTileset()
+            tileset_events_total.inc(tileset=tileset_id, event="loaded")
+        _loaded.move_to_end(tileset_id)
+        return entry
+
+
+def _evict(keep: str) -> None:
+    """Drops the least recently used tilesets (never `keep`) while over budget."""
+    budget = tileset_memory_budget_mb * 1024 * 1024
+
+    with _loaded_lock:
+        total = sum(entry.size() for entry in _loaded.values())
+        for tileset_id in list(_loaded):
+            if total <= budget:
+                break
+            if tileset_id == keep:
+                continue
+            total -= _loaded.pop(tileset_id).size()
+            tileset_events_total.inc(tileset=tileset_id, event="evicted")
+
+
+def tileset_resource(
+    tileset_id: str,
+    name: str,
+    load: Callable[[], T],
+    size: Callable[[T], int] = lambda _: 0,
+) -> T:
+    """
+    Resource `name` of the tileset, created with `load()` on first use and
+    kept while the tileset stays loaded; `size` estimates its bytes for the
+    memory budget. A None result is not kept, so it is loaded again next time.
+    """
+    entry = _entry(tileset_id)
+
+    with entry.lock:
+        if name in entry.resources:
+            return entry.resources[name]
+        value = load()
+        if value is None:
+            return value
+        entry.resources[name] = value
+        entry.sizes[name] = size(value)
+
+    _evict(keep=tileset_id)
+    return value
+
+
+def loaded_tileset_resource(tileset_id: str, name: str) -> Optional[Any]:
+    """The resource if it is already loaded, without loading it."""
+    entry = _loaded.get(tileset_id)
+    return entry.resources.get(name) if entry is not None else None
+
+
+def forget_tileset_resource(tileset_id: str, name: str) -> None:
+    """Drops a resource, so the next use loads it again."""
+    entry = _loaded.get(tileset_id)
+    if entry is not None:
+        with entry.lock:
+            entry.resources.pop(name, None)
+            entry.sizes.pop(name, None)
+
+
+def get_loaded_tilesets() -> Dict[str, int]:
+    """Estimated bytes of each loaded tileset, least recently used first."""
+    with _loaded_lock:
+        return {tileset_id: entry.size() for tileset_id, entry in _loaded.items()}
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for folder, _, files in os.walk(path):
+        for file_name in files:
+            try:
+                total += os.path.getsize(join(folder, file_name))
+            except OSError:
+                pass
+    return total
@@ -1,148 +1,313 @@
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_chroma import Chroma
-from langchain_core.documents import Document
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from os.path import join
 from utils import MAIN_PATH
-from typing import Literal
-
+from typing import Literal, Optional
+from langchain_core.embeddings import Embeddings
+from tile_catalogue import TileRecord, get_tile_catalogue
+from tilesets import (
+    DATABASES,
+    DEFAULT_TILESET,
+    directory_size,
+    get_tileset,
+    tileset_resource,
+)
+
+import base64
 import dotenv
 import os
 import pandas as pd
 import math
+import hashlib
+import json
+import time
+import weakref
 
 dotenv.load_dotenv(join(MAIN_PATH, "..", ".env"))
 
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+_embeddings: Optional[Embeddings] = None
 
-StoreType = Literal["items", "environments", "entities"]
 
-DATABASES = {
-    "items": {
-        "csv_path": join(MAIN_PATH, "tiles_data", "items_data.csv"),
-        "db_path": join(MAIN_PATH, "chroma_items_db"),
-        "collection_name": "Items_Descriptions",
-    },
-    "environments": {
-        "csv_path": join(MAIN_PATH, "tiles_data", "environment_data.csv"),
-        "db_path": join(MAIN_PATH, "chroma_environments_db"),
-        "collection_name": "Environments_Descriptions",
-    },
-    "entities": {
-        "csv_path": join(MAIN_PATH, "tiles_data", "entities_data.csv"),
-        "db_path": join(MAIN_PATH, "chroma_entities_db"),
-        "collection_name": "Entities_Descriptions",
-    },
-}
+def get_embeddings() -> Embeddings:
+    """
+    Retorna o modelo de embedding global, criando-o no primeiro uso.
+    """
+    global _embeddings
 
+    if _embeddings is None:
+        _embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
 
-def get_full_csv() -> pd.DataFrame:
-    dataframes_list = []
+    return _embeddings
 
-    for category, config in DATABASES.items():
-        csv_path = config["csv_path"]
 
-        if os.path.exists(csv_path):
-            try:
-                df = pd.read_csv(csv_path)
+def set_embeddings(embeddings: Embeddings) -> None:
+    """
+    Substitui o modelo de embedding global (ex: por um stand-in local nos benchmarks).
+    """
+    global _embeddings
+    _embeddings = embeddings
 
-                df["category"] = category
 
-                dataframes_list.append(df)
-            except Exception as e:
-                print(f"Erro ao ler o arquivo {csv_path}: {e}")
-        else:
-            print(f"Aviso: Arquivo não encontrado em {csv_path}")
+StoreType = Literal["items", "environments", "entities"]
 
-    if not dataframes_list:
-        return pd.DataFrame()
 
-    full_df = pd.concat(dataframes_list, ignore_index=True)
+def query_by_tileset_position(
+    x: int, y: int, tileset: str = DEFAULT_TILESET
+) -> list[TileRecord]:
+    """
+    Tiles do catálogo nessa posição do tileset (um por categoria em que aparece).
+    Os registros aceitam tile['base64'], tile['description'], etc.; a imagem só
+    é convertida para base64 quando lida.
+    """
+    return get_tile_catalogue(tileset).at(x, y)
 
-    return full_df
 
+def _store_size(db_path: str) -> int:
+    # O índice HNSW (subpastas do store) é o que o Chroma mantém em memória.
+    if not os.path.exists(db_path):
+        return 0
+    return sum(
+        directory_size(entry.path) for entry in os.scandir(db_path) if entry.is_dir()
+    )
 
-full_csv = get_full_csv()
 
+def _open_vector_store(store_type: StoreType, tileset: str) -> Chroma:
+    db_config = get_tileset(tileset).databases[store_type]
 
-def query_by_tileset_position(x: int, y: int) -> list[dict]:
-    # Filtra o DataFrame onde a coluna 'x' é igual ao parametro x E a coluna 'y' é igual a y
-    matches = full_csv[(full_csv["x"] == x) & (full_csv["y"] == y)]
+    is_vector_database_created = os.path.exists(db_config["db_path"])
 
-    # Se não houver correspondência, retorna lista vazia
-    if matches.empty:
-        return []
+    vector_store = Chroma(
+        collection_name=db_config["collection_name"],
+        persist_directory=db_config["db_path"],
+        embedding_function=get_embeddings(),
+    )
+    # Quando o tileset sai da memória e ninguém mais usa o store, o cliente
+    # é fechado (o chromadb mantém o sistema aberto por diretório até lá).
+    weakref.finalize(vector_store, vector_store._client.close)
 
-    # Converte as linhas encontradas para uma lista de dicionários (records)
-    # Isso facilita o uso posterior (ex: tile['base64'], tile['description'])
-    return matches.to_dict(orient="records")
+    if not is_vector_database_created:
+        print(f"Criando vector store para '{store_type}' ({tileset})...")
+        _sync_vector_store(vector_store, store_type, SYNC_BATCH_SIZE, tileset)
+
+    return vector_store
 
 
-def get_vector_store(store_type: StoreType) -> Chroma:
+def get_vector_store(store_type: StoreType, tileset: str = DEFAULT_TILESET) -> Chroma:
     """
-    Recupera o vector store baseado no tipo (items, environments, entities).
-    Cria o banco se ele ainda não existir.
+    Recupera o vector store baseado no tipo (items, environments, entities)
+    e no tileset. Cria o banco se ele ainda não existir.
     """
-    if store_type not in DATABASES:
+    databases = get_tileset(tileset).databases
+    if store_type not in databases:
         raise ValueError(
-            f"Tipo de store inválido: {store_type}. Escolha entre: {list(DATABASES.keys())}"
+            f"Tipo de store inválido: {store_type}. Escolha entre: {list(databases.keys())}"
         )
+    db_path = databases[store_type]["db_path"]
+
+    # Um cliente Chroma por store, reaproveitado entre consultas. Os recursos
+    # de um tileset são criados sob o lock dele: criar clientes concorrentemente
+    # para o mesmo diretório não é seguro no chromadb.
+    return tileset_resource(
+        tileset,
+        f"store:{store_type}",
+        lambda: _open_vector_store(store_type, tileset),
+        lambda _: _store_size(db_path),
+    )
 
-    db_config = DATABASES[store_type]
 
-    is_vector_database_created = os.path.exists(db_config["db_path"])
+def create_vector_store(store_type: StoreType, tileset: str = DEFAULT_TILESET):
+    """
+    Lê o CSV específico do tipo e cria (ou atualiza) o banco vetorial correspondente.
+    """
+    sync_vector_store(store_type, tileset=tileset)
 
-    if not is_vector_database_created:
-        print(f"Criando vector store para '{store_type}'...")
-        create_vector_store(store_type)
 
-    return Chroma(
-        collection_name=db_config["collection_name"],
-        persist_directory=db_config["db_path"],
-        embedding_function=embeddings,
-    )
+################################################################################
+# Sincronização incremental CSV -> vector store
+################################################################################
 
+SYNC_BATCH_SIZE = 100
+
+SYNC_MANIFEST_FILE = "sync_manifest.json"
 
-def create_vector_store(store_type: StoreType):
-    """
-    Lê o CSV específico do tipo e cria o banco vetorial correspondente.
-    """
-    if store_type not in DATABASES:
-        raise ValueError(f"Tipo de store inválido: {store_type}")
 
-    db_config = DATABASES[store_type]
+def _tile_id(x: int, y: int) -> str:
+    # A posição no tileset identifica o tile, ao contrário do índice da linha.
+    return f"{x}_{y}"
+
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _read_tile_rows(store_type: StoreType, tileset: str) -> dict[str, dict]:
+    """Linhas do CSV indexadas pelo id do tile, com os hashes de conteúdo."""
+    db_config = get_tileset(tileset).databases[store_type]
 
     if not os.path.exists(db_config["csv_path"]):
         raise FileNotFoundError(f"Arquivo CSV não encontrado: {db_config['csv_path']}")
 
     df_tiles = pd.read_csv(db_config["csv_path"])
+    rows = {}
+
+    for record in df_tiles.to_dict(orient="records"):
+        x, y = int(record.get("x", 0)), int(record.get("y", 0))
+        description = str(record["description"])
+        b64image = str(record.get("base64", ""))
+
+        rows[_tile_id(x, y)] = {
+            "description": description,
+            "metadata": {
+                "b64image": b64image,
+                "x": x,
+                "y": y,
+                "type": store_type,  # Útil para identificar a origem depois se necessário
+                "content_hash": _hash_text(description),
+                "image_hash": _hash_text(b64image),
+            },
+        }
 
-    documents = []
-    ids = []
+    return rows
 
-    for i, row in df_tiles.iterrows():
-        metadata = {
-            "b64image": row.get("base64", ""),
-            "x": row.get("x", 0),
-            "y": row.get("y", 0),
-            "type": store_type,  # Útil para identificar a origem depois se necessário
-        }
 
-        document = Document(
-            page_content=str(row["description"]),
-            id=str(i),
-            metadata=metadata,
+def _sync_vector_store(
+    vector_store: Chroma, store_type: StoreType, batch_size: int, tileset: str
+) -> dict:
+    start_time = time.time()
+    rows = _read_tile_rows(store_type, tileset)
+
+    indexed = vector_store.get(include=["metadatas"])
+    indexed_metadata = dict(zip(indexed["ids"], indexed["metadatas"]))
+
+    # Ids antigos (índice da linha) ou tiles removidos do CSV.
+    to_delete = [tile_id for tile_id in indexed_metadata if tile_id not in rows]
+    to_embed = []
+    to_update_metadata = []
+
+    for tile_id, row in rows.items():
+        metadata = indexed_metadata.get(tile_id) or {}
+
+        if metadata.get("content_hash") != row["metadata"]["content_hash"]:
+            to_embed.append(tile_id)
+        elif metadata.get("image_hash") != row["metadata"]["image_hash"]:
+            to_update_metadata.append(tile_id)
+
+    if to_delete:
+        vector_store.delete(ids=to_delete)
+
+    # Só a descrição é embutida; mudanças apenas na imagem não pedem novo embedding.
+    if to_update_metadata:
+        vector_store._collection.update(
+            ids=to_update_metadata,
+            metadatas=[rows[tile_id]["metadata"] for tile_id in to_update_metadata],
         )
-        ids.append(str(i))
-        documents.append(document)
 
-    vector_store = Chroma(
-        collection_name=db_config["collection_name"],
-        persist_directory=db_config["db_path"],
-        embedding_function=embeddings,
+    for i in range(0, len(to_embed), batch_size):
+        batch = to_embed[i : i + batch_size]
+        vector_store.add_texts(
+            texts=[rows[tile_id]["description"] for tile_id in batch],
+            metadatas=[rows[tile_id]["metadata"] for tile_id in batch],
+            ids=batch,
+        )
+
+    fingerprint = _hash_text(
+        "\n".join(
+            f"{tile_id}:{row['metadata']['content_hash']}:{row['metadata']['image_hash']}"
+            for tile_id, row in sorted(rows.items())
+        )
+    )
+    db_config = get_tileset(tileset).databases[store_type]
+    os.makedirs(db_config["db_path"], exist_ok=True)
+    with open(join(db_config["db_path"], SYNC_MANIFEST_FILE), "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "fingerprint": fingerprint,
+                "rows": len(rows),
+                "synced_at": datetime.now().isoformat(),
+            },
+            file,
+        )
+
+    return {
+        "tileset": tileset,
+        "store_type": store_type,
+        "embedded": len(to_embed),
+        "metadata_updated": len(to_update_metadata),
+        "deleted": len(to_delete),
+        "unchanged": len(rows) - len(to_embed) - len(to_update_metadata),
+        "seconds": round(time.time() - start_time, 3),
+    }
+
+
+# Por manifesto (um por store de cada tileset): (mtime, fingerprint).
+_fingerprints: dict[str, tuple[float, str]] = {}
+
+
+def get_store_fingerprint(store_type: StoreType, tileset: str = DEFAULT_TILESET) -> str:
+    """
+    Fingerprint do conteúdo indexado, gravado pela última sincronização.
+    Muda sempre que o store é reconstruído ou atualizado.
+    """
+    manifest_path = join(
+        get_tileset(tileset).databases[store_type]["db_path"], SYNC_MANIFEST_FILE
     )
 
-    vector_store.add_documents(documents=documents, ids=ids)
-    print(f"Vector store '{store_type}' criado com sucesso em {db_config['db_path']}")
+    try:
+        modified_at = os.path.getmtime(manifest_path)
+    except OSError:
+        return "unsynced"
+
+    cached = _fingerprints.get(manifest_path)
+    if cached is None or cached[0] != modified_at:
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            cached = (modified_at, json.load(file)["fingerprint"])
+        _fingerprints[manifest_path] = cached
+
+    return cached[1]
+
+
+def sync_vector_store(
+    store_type: StoreType, batch_size: int = SYNC_BATCH_SIZE, tileset: str = DEFAULT_TILESET
+) -> dict:
+    """
+    Sincroniza o vector store com o CSV: embute em lotes apenas tiles novos ou
+    com descrição alterada e remove os tiles que saíram do CSV.
+    """
+    if store_type not in get_tileset(tileset).databases:
+        raise ValueError(f"Tipo de store inválido: {store_type}")
+
+    result = _sync_vector_store(
+        get_vector_store(store_type, tileset), store_type, batch_size, tileset
+    )
+    print(
+        f"Vector store '{store_type}' ({tileset}) sincronizado: {result['embedded']} embutidos, "
+        f"{result['metadata_updated']} atualizados, {result['deleted']} removidos "
+        f"({result['seconds']}s)"
+    )
+    return result
+
+
+def sync_all_vector_stores(
+    batch_size: int = SYNC_BATCH_SIZE, tileset: str = DEFAULT_TILESET
+) -> list[dict]:
+    """Sincroniza os stores do tileset em paralelo."""
+    databases = get_tileset(tileset).databases
+
+    # Os clientes são abertos em sequência (get_vector_store), só a sincronização é paralela.
+    stores = {
+        store_type: get_vector_store(store_type, tileset)  # type: ignore[arg-type]
+        for store_type in databases
+    }
+
+    with ThreadPoolExecutor(max_workers=len(databases)) as executor:
+        return list(
+            executor.map(
+                lambda store_type: sync_vector_store(store_type, batch_size, tileset),
+                stores,
+            )
+        )
 
 
 def get_cosine_similarity(text1: str, text2: str) -> float:
@@ -151,8 +316,8 @@ def get_cosine_similarity(text1: str, text2: str) -> float:
     Retorna um valor entre -1 e 1 (geralmente entre 0 e 1 para textos).
     Quanto maior o valor (mais próximo de 1), maior a similaridade.
     """
-    vec1 = embeddings.embed_query(text1)
-    vec2 = embeddings.embed_query(text2)
+    vec1 = get_embeddings().embed_query(text1)
+    vec2 = get_embeddings().embed_query(text2)
 
     # Produto escalar
     dot_product = sum(a * b for a, b in zip(vec1, vec2))
@@ -170,13 +335,46 @@ def get_cosine_similarity(text1: str, text2: str) -> float:
     return similarity
 
 
+def _get_searchable_artifact(store_type: StoreType, tileset: str):
+    """Artefato mapeado em memória, se ele tiver os vetores deste store."""
+    from tile_artifact import get_tile_artifact
+
+    artifact = get_tile_artifact(tileset)
+    if artifact is not None and artifact.has_store_embeddings(store_type):
+        return artifact
+    return None
+
+
+def _artifact_tile(artifact, row: int, with_embedding: bool = False) -> dict:
+    x, y = artifact.positions[row]
+    tile = {
+        "b64image": "data:image/png;base64,"
+        + base64.b64encode(artifact.image(row)).decode("ascii"),
+        "x": int(x),
+        "y": int(y),
+        "description": artifact.description(row),
+    }
+    if with_embedding:
+        tile["embedding"] = artifact.embeddings[row].tolist()
+    return tile
+
+
 def query_vector_store(
-    query: str, store_type: StoreType, documents_count: int = 4
+    query: str, store_type: StoreType, documents_count: int = 4, tileset: str = DEFAULT_TILESET
 ) -> list:
     """
-    Faz uma busca no vector store especificado pelo store_type.
+    Faz uma busca no vector store especificado pelo store_type e pelo tileset.
     """
-    vector_store = get_vector_store(store_type)
+    # Com o artefato, a busca é um produto de matrizes local, sem abrir o Chroma.
+    artifact = _get_searchable_artifact(store_type, tileset)
+    if artifact is not None:
+        query_embedding = [get_embeddings().embed_query(query)]
+        return [
+            _artifact_tile(artifact, row)
+            for row, _ in artifact.search(query_embedding, store_type, documents_count)[0]
+        ]
+
+    vector_store = get_vector_store(store_type, tileset)
     tiles = []
 
     retriever = vector_store.as_retriever(search_kwargs={"k": documents_count})
@@ -195,6 +393,70 @@ def query_vector_store(
     return tiles
 
 
+def embed_queries(queries: list[str]) -> list[list[float]]:
+    """
+    Embute várias consultas numa única chamada, como `embed_query` faria uma a uma.
+    """
+    embeddings = get_embeddings()
+
+    try:
+        return embeddings.embed_documents(queries, task_type="RETRIEVAL_QUERY")  # type: ignore[call-arg]
+    except TypeError:
+        # Modelos de embedding sem distinção entre consulta e documento.
+        return embeddings.embed_documents(queries)
+
+
+def query_vector_store_batch(
+    queries: list[str],
+    store_type: StoreType,
+    documents_count: int = 4,
+    tileset: str = DEFAULT_TILESET,
+) -> tuple[list[list[float]], list[list[dict]]]:
+    """
+    Busca várias consultas com uma chamada de embedding e uma consulta ao Chroma.
+    Retorna os embeddings das consultas e, para cada uma, os tiles candidatos
+    (incluindo o embedding de cada tile, em "embedding").
+    """
+    if not queries:
+        return [], []
+
+    query_embeddings = embed_queries(queries)
+
+    artifact = _get_searchable_artifact(store_type, tileset)
+    if artifact is not None:
+        return query_embeddings, [
+            [_artifact_tile(artifact, row, with_embedding=True) for row, _ in matches]
+            for matches in artifact.search(query_embeddings, store_type, documents_count)
+        ]
+
+    vector_store = get_vector_store(store_type, tileset)
+
+    result = vector_store._collection.query(
+        query_embeddings=query_embeddings,  # type: ignore[arg-type]
+        n_results=documents_count,
+        include=["metadatas", "documents", "embeddings"],  # type: ignore[list-item]
+    )
+
+    candidates = []
+    for metadatas, documents, tile_embeddings in zip(
+        result["metadatas"], result["documents"], result["embeddings"]  # type: ignore[arg-type]
+    ):
+        candidates.append(
+            [
+                {
+                    "b64image": metadata.get("b64image"),
+                    "x": int(metadata.get("x", 0)),  # type: ignore[arg-type]
+                    "y": int(metadata.get("y", 0)),  # type: ignore[arg-type]
+                    "description": document,
+                    "embedding": list(embedding),
+                }
+                for metadata, document, embedding in zip(metadatas, documents, tile_embeddings)
+            ]
+        )
+
+    return query_embeddings, candidates
+
+
 if __name__ == "__main__":
     original = ""
     reconstruction = ""
@@ -0,0 +1,187 @@
+"""
+Generation worker: runs the jobs of the `generation_jobs` queue (database.db).
+
+    python worker.py --processes 4 --concurrency 2
+
+Each process claims jobs with a lease (UPDATE ... RETURNING, so a job goes
+to one worker only) and renews it while the job runs. Every completed stage
+is saved as the job checkpoint, so when a worker dies its job is picked up
+again once the lease expires and resumes after the last saved stage instead
+of paying for those LLM calls again. Failed jobs go back to the queue with
+exponential backoff until `generation_job_max_attempts`. The bundle is
+stored and the job completed in the same transaction.
+
+Capacity scales with the number of worker processes, independently of the
+API processes (enable `config.generation_queue_enabled` for the API to use
+the queue).
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import uuid
+
+from asset_generator import AssetsGenerator
+from async_db import (
+    claim_generation_job,
+    complete_generation_job,
+    fail_generation_job,
+    find_bundle_data_by_id,
+    renew_generation_job,
+)
+from bundle_index import index_bundle
+from config import (
+    generation_job_lease_seconds,
+    generation_job_max_attempts,
+    generation_job_retry_backoff_seconds,
+    generation_queue_poll_seconds,
+    model_key,
+)
+from metrics import generation_jobs_total
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """The job was cancelled or taken by another worker."""
+
+
+async def _keep_lease(job_id: int, owner: str, task: asyncio.Task) -> None:
+    """Renews the lease every lease / 3 seconds; cancels `task` when it is lost."""
+    while True:
+        await asyncio.sleep(generation_job_lease_seconds / 3)
+        if not await renew_generation_job(job_id, owner, generation_job_lease_seconds):
+            task.cancel()
+            return
+
+
+async def _generate(job: Dict[str, Any], owner: str) -> int:
+    payload = job["payload"]
+
+    async def save_checkpoint(checkpoint: dict) -> None:
+        if not await renew_generation_job(
+            job["id"], owner, generation_job_lease_seconds, checkpoint
+        ):
+            raise LeaseLost(f"Job {job['id']} is no longer owned by {owner}.")
+
+    if job["kind"] == "regenerate":
+        parent_bundle = await find_bundle_data_by_id(payload["parent_id"])
+        if parent_bundle is None:
+            raise ValueError(f"Asset bundle with id {payload['parent_id']} no found.")
+        asset_generator = AssetsGenerator.from_bundle(parent_bundle)
+        asset_bundle = await asset_generator.aregenerate_section(parent_bundle, payload["section"])
+    else:
+        asset_generator = AssetsGenerator(
+            payload["map_description"],
+            **(payload.get("section_counts") or {}),
+            tileset=payload.get("tileset"),
+        )
+        asset_bundle = await asset_generator.agenerate_asset_bundle(
+            job["checkpoint"], save_checkpoint
+        )
+
+    bundle_id = await complete_generation_job(
+        job["id"], owner, asset_bundle, model_key, payload.get("parent_id")
+    )
+    if bundle_id is None:
+        raise LeaseLost(f"Job {job['id']} is no longer owned by {owner}.")
+    await asyncio.to_thread(index_bundle, bundle_id, asset_bundle.description)
+    return bundle_id
+
+
+async def run_job(job: Dict[str, Any], owner: str) -> None:
+    if job["checkpoint"]:
+        generation_jobs_total.inc(result="resumed")
+
+    task = asyncio.create_task(_generate(job, owner))
+    lease = asyncio.create_task(_keep_lease(job["id"], owner, task))
+    try:
+        bundle_id = await task
+        generation_jobs_total.inc(result="completed")
+        logger.info(f"Job {job['id']} stored as bundle {bundle_id}.")
+    except (asyncio.CancelledError, LeaseLost):
+        if asyncio.current_task().cancelling():  # type: ignore[union-attr]
+            raise
+        # Cancelado pela API ou assumido por outro worker: nada a salvar.
+        generation_jobs_total.inc(result="lost")
+        logger.info(f"Job {job['id']} lost its lease.")
+    except Exception as e:
+        if job["attempts"] < generation_job_max_attempts:
+            delay = generation_job_retry_backoff_seconds * 2 ** (job["attempts"] - 1)
+            retry_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+            generation_jobs_total.inc(result="retried")
+        else:
+            retry_at = None
+            generation_jobs_total.inc(result="failed")
+        logger.warning(f"Job {job['id']} failed (attempt {job['attempts']}): {e}")
+        await fail_generation_job(job["id"], owner, repr(e)[:500], retry_at)
+    finally:
+        lease.cancel()
+
+
+async def work(concurrency: int) -> None:
+    """Claims and runs jobs, up to `concurrency` at a time, until cancelled."""
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    running: set = set()
+
+    try:
+        while True:
+            while len(running) < concurrency:
+                job = await claim_generation_job(owner, generation_job_lease_seconds)
+                if job is None:
+                    break
+                task = asyncio.create_task(run_job(job, owner))
+                running.add(task)
+                task.add_done_callback(running.discard)
+
+            await asyncio.sleep(generation_queue_poll_seconds)
+    finally:
+        # Jobs interrompidos ficam com a lease e voltam à fila quando ela vence.
+        for task in list(running):
+            task.cancel()
+
+
+def _process_main(concurrency: int) -> None:
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s"
+    )
+    # SIGTERM encerra como Ctrl+C; jobs interrompidos voltam à fila quando a lease vence.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(work(concurrency))
+    except KeyboardInterrupt:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Runs the queued bundle generations.")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=2, help="Jobs per process")
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        _process_main(args.concurrency)
+        return
+
+    processes = [
+        multiprocessing.Process(target=_process_main, args=(args.concurrency,))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()